@@ -1,5 +1,6 @@
 from yamlguardian.rules import RuleManager
-from yamlguardian.validate import format_errors, validate_data
+from yamlguardian.save_load_yaml import format_errors
+from yamlguardian.validate import validate_data
 
 
 class YamlGuardian:
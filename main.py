@@ -1,54 +1,206 @@
+import asyncio
+import json
+import os
 import sys
+from contextlib import asynccontextmanager
+from typing import Literal, Optional
 
 import jsonschema
 import uvicorn
-import yaml
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 
-from yamlguardian.validate import validate_yaml_data
+from yamlguardian.bounded_executor import BoundedExecutor, ExecutorSaturatedError
+from yamlguardian.core import YamlGuardian
+from yamlguardian.rule_watcher import stop_watching, watch_rules
+from yamlguardian.validate import schema_registry, validate_yaml_data
+from yamlguardian.validation_context import error_limit
 
+# スキーマのパス（本番環境用）。読み込みは CLI と共有するレジストリが行う
+SCHEMA_PATH = "schema.yaml"
 
-# スキーマのロード関数
-def load_schema(schema_path: str):
-    """YAMLスキーマファイルを読み込む"""
-    with open(schema_path, encoding="utf-8") as f:
-        return yaml.safe_load(f)
+# バリデーションを実行する Executor の設定 (環境変数で変更可能)
+EXECUTOR_KIND = os.environ.get("YAMLGUARDIAN_EXECUTOR", "thread")
+MAX_WORKERS = int(os.environ.get("YAMLGUARDIAN_MAX_WORKERS", "0")) or None
+MAX_IN_FLIGHT = int(os.environ.get("YAMLGUARDIAN_MAX_IN_FLIGHT", "0")) or None
+RETRY_AFTER_SECONDS = int(os.environ.get("YAMLGUARDIAN_RETRY_AFTER", "1"))
 
+# 指定すると rule_config などのディレクトリを監視し、ルールセットをメモリ上に保つ
+WATCH_DIR = os.environ.get("YAMLGUARDIAN_WATCH_DIR")
+
+# compile サブコマンドで作ったバンドル。指定するとスキーマと検証プランをバンドルから読み込む
+BUNDLE_PATH = os.environ.get("YAMLGUARDIAN_BUNDLE")
+# 起動時にバンドルの元ファイルが変わっていないか確認する (元ファイルを配置しない環境では 0 のまま)
+# 別のバージョンの yamlguardian でコンパイルしたバンドルは、この設定によらず使わない
+CHECK_BUNDLE = os.environ.get("YAMLGUARDIAN_BUNDLE_CHECK", "0") == "1"
+
+validation_executor = BoundedExecutor(EXECUTOR_KIND, MAX_WORKERS, MAX_IN_FLIGHT)
+
+
+def load_bundle_guardian():
+    if not BUNDLE_PATH:
+        return None
+    guardian = YamlGuardian.from_bundle(BUNDLE_PATH)
+    # pickle したチェッカーの動作が今のコードと違う可能性があるので、フィンガープリントは常に確認する
+    if guardian.bundle.compiler_changed():
+        print(
+            f"Bundle {BUNDLE_PATH} was compiled by a different version of yamlguardian; "
+            f"validating with {SCHEMA_PATH} instead."
+        )
+        return None
+    if CHECK_BUNDLE and guardian.bundle.stale_sources():
+        print(f"Bundle {BUNDLE_PATH} is stale; validating with {SCHEMA_PATH} instead.")
+        return None
+    return guardian
+
+
+bundle_guardian = load_bundle_guardian()
+
+
+def validate_document(yaml_content, mode=None, max_errors=None):
+    """バンドルがあればコンパイル済みの YamlGuardian で、なければ検証ステージで検証する"""
+    if bundle_guardian is not None:
+        return bundle_guardian.validate(yaml_content, mode, max_errors)
+    return validate_yaml_data(yaml_content, mode, max_errors)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WATCH_DIR:
+        watch_rules(WATCH_DIR)
+    yield
+    stop_watching()
+    validation_executor.shutdown(wait=False)
 
-# スキーマを読み込む（本番環境用）
-schema = load_schema("schema.yaml")
 
 # FastAPI アプリケーションのセットアップ
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+
+def busy_response():
+    """Executor が飽和しているときに即座に返すレスポンス"""
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+        content={"message": "Server busy", **validation_executor.stats()},
+    )
 
 
 class YamlInput(BaseModel):
     yaml_content: str
+    # fail_fast / max_errors / exhaustive (省略時は fail_fast、max_errors 指定時は max_errors)
+    mode: Optional[Literal["fail_fast", "max_errors", "exhaustive"]] = None
+    max_errors: Optional[int] = None
 
 
 @app.get("/schema", response_class=JSONResponse)
 def get_schema():
     """スキーマを JSON 形式で公開するエンドポイント"""
-    return schema
+    if bundle_guardian is not None:
+        return bundle_guardian.schema
+    return schema_registry.get_schema(SCHEMA_PATH)
+
+
+@app.get("/executor", response_class=JSONResponse)
+def get_executor_stats():
+    """バリデーション Executor の実行中タスク数とキューの深さを返すエンドポイント"""
+    return validation_executor.stats()
 
 
 @app.post("/validate")
-def validate_yaml_endpoint(input_data: YamlInput):
+async def validate_yaml_endpoint(input_data: YamlInput):
     """YAML データをバリデーションするエンドポイント"""
     try:
-        validation_result = validate_yaml_data(input_data.yaml_content)
+        future = validation_executor.submit(
+            validate_document, input_data.yaml_content, input_data.mode, input_data.max_errors
+        )
+    except ExecutorSaturatedError:
+        return busy_response()
+    try:
+        validation_result = await asyncio.wrap_future(future)
         if validation_result["message"] == "Validation failed":
             return JSONResponse(status_code=400, content=validation_result)
 
         return {"message": "Validation successful"}
+    except ValueError as e:
+        return JSONResponse(status_code=422, content={"message": "Validation error", "detail": str(e)})
     except jsonschema.exceptions.ValidationError as e:
         return JSONResponse(status_code=422, content={"message": "Validation error", "detail": str(e)})
     except Exception as e:
         return JSONResponse(status_code=500, content={"message": "Internal server error", "detail": str(e)})
 
 
+def parse_batch_body(body: bytes, content_type: str) -> list[str]:
+    """NDJSON または JSON 配列のリクエストボディから YAML 文字列のリストを取り出す
+
+    各要素は YAML 文字列、または {"yaml_content": ...} のオブジェクト。
+    """
+    if "ndjson" in content_type or "jsonl" in content_type:
+        items = [json.loads(line) for line in body.splitlines() if line.strip()]
+    else:
+        items = json.loads(body)
+        if not isinstance(items, list):
+            raise ValueError("リクエストボディは JSON 配列である必要があります")
+    documents = []
+    for index, item in enumerate(items):
+        if isinstance(item, dict):
+            item = item.get("yaml_content")
+        if not isinstance(item, str):
+            raise ValueError(f"{index} 番目の要素に yaml_content がありません")
+        documents.append(item)
+    return documents
+
+
+async def stream_batch_results(documents, mode=None, max_errors=None):
+    """ドキュメントを Executor で検証し、完了したものから NDJSON の行を返す"""
+    window = validation_executor.max_workers
+    waiting = list(enumerate(documents))
+    waiting.reverse()
+    pending = {}
+    while waiting or pending:
+        while waiting and len(pending) < window:
+            index, content = waiting[-1]
+            try:
+                future = validation_executor.submit(validate_document, content, mode, max_errors)
+            except ExecutorSaturatedError:
+                break
+            waiting.pop()
+            pending[asyncio.wrap_future(future)] = index
+        if not pending:
+            # 他のリクエストで飽和している間は空きが出るまで待つ
+            await asyncio.sleep(0.05)
+            continue
+        done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for future in done:
+            index = pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"message": "Internal server error", "detail": str(e)}
+            yield json.dumps({"index": index, **result}, ensure_ascii=False) + "\n"
+
+
+@app.post("/validate/batch")
+async def validate_batch_endpoint(
+    request: Request,
+    mode: Optional[Literal["fail_fast", "max_errors", "exhaustive"]] = None,
+    max_errors: Optional[int] = None,
+):
+    """NDJSON または JSON 配列で受け取った複数の YAML をまとめて検証するエンドポイント
+
+    結果は完了した順に 1 行 1 件の NDJSON ({"index": 入力での位置, ...}) でストリーミングする。
+    """
+    try:
+        error_limit(mode, max_errors)
+        documents = parse_batch_body(await request.body(), request.headers.get("content-type", ""))
+    except ValueError as e:
+        return JSONResponse(status_code=422, content={"message": "Validation error", "detail": str(e)})
+    if validation_executor.in_flight >= validation_executor.max_in_flight:
+        return busy_response()
+    return StreamingResponse(stream_batch_results(documents, mode, max_errors), media_type="application/x-ndjson")
+
+
 # コマンドライン実行時
 if __name__ == "__main__":
     if len(sys.argv) > 1:
@@ -0,0 +1,42 @@
+import threading
+import time
+import unittest
+
+import pytest
+
+from yamlguardian.bounded_executor import BoundedExecutor, ExecutorSaturatedError
+
+
+class TestBoundedExecutor(unittest.TestCase):
+    def setUp(self):
+        self.executor = BoundedExecutor("thread", max_workers=1, max_in_flight=2)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_rejects_when_saturated(self):
+        release = threading.Event()
+        first = self.executor.submit(release.wait)
+        second = self.executor.submit(release.wait)
+        assert self.executor.in_flight == 2
+        assert self.executor.queue_depth == 1
+        with pytest.raises(ExecutorSaturatedError):
+            self.executor.submit(release.wait)
+
+        release.set()
+        first.result()
+        second.result()
+        # 完了コールバックは result() の後に走ることがある
+        deadline = time.monotonic() + 5
+        while self.executor.in_flight and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert self.executor.in_flight == 0
+        assert self.executor.submit(sum, [1, 2]).result() == 3
+
+    def test_unknown_kind(self):
+        with pytest.raises(ValueError):
+            BoundedExecutor("fiber")
+
+
+if __name__ == "__main__":
+    unittest.main()
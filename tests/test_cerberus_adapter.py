@@ -1,7 +1,23 @@
+import os
+import tempfile
+import threading
 import unittest
+import unittest.mock
 
-from yamlguardian.cerberus_adapter import convert_yaml_to_cerberus
+from yamlguardian.cerberus_adapter import CompiledCerberusSchema, convert_yaml_to_cerberus
 from yamlguardian.save_load_yaml import load_yaml
+from yamlguardian.schema_registry import SchemaRegistry
+from yamlguardian.validate import JsonSchemaValidatorCache, load_validation_rules
+
+STAGE_SCHEMA = """
+value:
+  anyof_type: [string, integer]
+code:
+  oneof_regex: ["a.*", "b.*"]
+tags:
+  schema:
+    type: string
+"""
 
 
 class TestConvertYamlToCerberus(unittest.TestCase):
@@ -20,6 +36,147 @@ class TestConvertYamlToCerberus(unittest.TestCase):
         assert cerberus_schema["age"]["min"] == 0
         assert cerberus_schema["age"]["required"] == True
 
+    def test_convert_nested_schema(self):
+        yaml_schema = {
+            "address": {
+                "type": "object",
+                "description": "Address",
+                "properties": {"city": {"type": "string"}, "zip": {"type": "string", "pattern": "^[0-9]{3}-[0-9]{4}$"}},
+                "required": ["city"],
+            },
+            "profile": {"type": "dict", "schema": {"nickname": "string"}},
+        }
+        cerberus_schema = convert_yaml_to_cerberus(yaml_schema)
+        assert cerberus_schema["address"] == {
+            "type": "dict",
+            "schema": {
+                "city": {"type": "string", "required": True},
+                "zip": {"type": "string", "regex": "^[0-9]{3}-[0-9]{4}$"},
+            },
+        }
+        assert cerberus_schema["profile"] == {"type": "dict", "schema": {"nickname": {"type": "string"}}}
+
+    def test_convert_list_items(self):
+        yaml_schema = {
+            "tags": {"type": "array", "items": {"type": "string", "enum": ["a", "b"]}, "minItems": 1},
+            "pair": {"type": "list", "items": [{"type": "integer"}, "string"]},
+            "scores": {"type": "list", "schema": {"type": "int", "minimum": 0, "maximum": 100}},
+        }
+        cerberus_schema = convert_yaml_to_cerberus(yaml_schema)
+        assert cerberus_schema["tags"] == {
+            "type": "list",
+            "minlength": 1,
+            "schema": {"type": "string", "allowed": ["a", "b"]},
+        }
+        assert cerberus_schema["pair"] == {"type": "list", "items": [{"type": "integer"}, {"type": "string"}]}
+        assert cerberus_schema["scores"] == {"type": "list", "schema": {"type": "integer", "min": 0, "max": 100}}
+
+    def test_convert_dependencies_and_excludes(self):
+        yaml_schema = {
+            "card": {"type": "string", "dependencies": ["expiry"], "excludes": "cash"},
+            "expiry": {"type": "string", "dependencies": {"card": ["visa"]}},
+            "cash": {"type": "boolean", "nullable": True},
+        }
+        cerberus_schema = convert_yaml_to_cerberus(yaml_schema)
+        assert cerberus_schema["card"] == {"type": "string", "dependencies": ["expiry"], "excludes": "cash"}
+        assert cerberus_schema["expiry"] == {"type": "string", "dependencies": {"card": ["visa"]}}
+        assert cerberus_schema["cash"] == {"type": "boolean", "nullable": True}
+
+    def test_cerberus_rules_pass_through(self):
+        def check_even(field, value, error):
+            if value % 2:
+                error(field, "must be even")
+
+        yaml_schema = {
+            "value": {"anyof_type": ["string", "integer"], "description": "Value"},
+            "code": {"oneof_regex": ["^a", "^b"]},
+            "even": {"type": "integer", "check_with": check_even, "coerce": int},
+            "tags": {"schema": {"type": "string"}},
+        }
+        cerberus_schema = convert_yaml_to_cerberus(yaml_schema)
+        assert cerberus_schema["value"] == {"anyof_type": ["string", "integer"]}
+        assert cerberus_schema["code"] == {"oneof_regex": ["^a", "^b"]}
+        assert cerberus_schema["even"] == {"type": "integer", "check_with": check_even, "coerce": int}
+        # type のない schema は Cerberus の解釈に任せる (list の要素のルールとしても使える)
+        assert cerberus_schema["tags"] == {"schema": {"type": "string"}}
+
+        compiled = CompiledCerberusSchema(yaml_schema)
+        assert compiled.normalize
+        assert "value" in compiled.validate({"value": 1.5})
+        assert compiled.validate({"code": "c"})
+        assert compiled.validate({"even": "3"}) == {"even": ["must be even"]}
+        assert compiled.validate({"even": "4"}) is None
+        assert compiled.validate({"tags": [1]}) == {"tags": [{0: ["must be of string type"]}]}
+
+
+class TestStageSchemas(unittest.TestCase):
+    """ステージのスキーマは Cerberus の形式のまま使う"""
+
+    def test_native_cerberus_rules(self):
+        registry = SchemaRegistry(load_validation_rules, JsonSchemaValidatorCache())
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "user_defined_yaml.yaml")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(STAGE_SCHEMA)
+            compiled = registry.get_cerberus_schema(path)
+            assert compiled.validate({"value": "a", "code": "a1", "tags": ["x"]}) is None
+            assert "value" in compiled.validate({"value": 1.5})
+            assert "code" in compiled.validate({"code": "c"})
+            assert compiled.validate({"tags": [1]}) == {"tags": [{0: ["must be of string type"]}]}
+
+
+class TestCompiledCerberusSchema(unittest.TestCase):
+    def setUp(self):
+        self.compiled = CompiledCerberusSchema(
+            {
+                "name": {"type": "string", "required": True, "description": "Name"},
+                "tags": {"type": "array", "items": {"type": "string", "allowed": ["a", "b"]}},
+                "card": {"type": "string", "dependencies": "expiry", "excludes": "cash"},
+                "expiry": {"type": "string", "regex": "^[0-9]{2}/[0-9]{2}$"},
+                "cash": {"type": "boolean"},
+                "address": {"type": "object", "properties": {"city": {"type": "string"}}, "required": ["city"]},
+            }
+        )
+
+    def test_validate(self):
+        assert self.compiled.validate({"name": "a", "tags": ["a"], "card": "x", "expiry": "01/30"}) is None
+        assert self.compiled.validate({"tags": ["c"]}) == {
+            "name": ["required field"],
+            "tags": [{0: ["unallowed value c"]}],
+        }
+        assert self.compiled.validate({"name": "a", "card": "x"}) == {"card": ["field 'expiry' is required"]}
+        assert "card" in self.compiled.validate({"name": "a", "card": "x", "expiry": "01/30", "cash": True})
+        assert self.compiled.validate({"name": "a", "expiry": "1/30"}) is not None
+        assert self.compiled.validate({"name": "a", "address": {}}) == {"address": [{"city": ["required field"]}]}
+
+    def test_normalization_is_skipped_without_normalization_rules(self):
+        assert not self.compiled.normalize
+        document = {"name": "a"}
+        validator = self.compiled.validator()
+        with unittest.mock.patch.object(validator, "validate", wraps=validator.validate) as validate:
+            assert self.compiled.validate(document) is None
+        validate.assert_called_once_with(document, normalize=False)
+
+        compiled = CompiledCerberusSchema({"name": {"type": "string", "default": "x"}, "age": {"type": "integer"}})
+        assert compiled.normalize
+        assert compiled.validate({"age": 1}) is None
+        assert compiled.validator().document == {"name": "x", "age": 1}
+
+    def test_validator_is_reused_per_thread(self):
+        validator = self.compiled.validator()
+        assert self.compiled.validator() is validator
+        # 前回の検証結果は次の validate() で初期化される
+        assert not validator.validate({})
+        assert validator.validate({"name": "a"})
+        assert validator.errors == {}
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(self.compiled.validator()))
+        thread.start()
+        thread.join()
+        assert other[0] is not validator
+        assert other[0].schema is validator.schema
+
 
 class TestLoadYamlFile(unittest.TestCase):
     def test_load_yaml_file(self):
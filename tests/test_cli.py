@@ -1,5 +1,13 @@
+import contextlib
+import io
+import os
 import subprocess
+import tempfile
 import unittest
+import unittest.mock
+
+from yamlguardian import cli
+from yamlguardian.directory_analyzer import DirectoryAnalyzer
 
 
 class TestCLISuccess(unittest.TestCase):
@@ -34,5 +42,33 @@ class TestCLIFailure(unittest.TestCase):
         assert "Validation failed with the following errors:" in result.stdout
 
 
+class TestCLIDirectory(unittest.TestCase):
+    def test_same_file_names_in_subdirectories(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_dir = os.path.join(tmp_dir, "rules")
+            for name, value in (("a", "John"), ("b", 1)):
+                os.makedirs(os.path.join(input_dir, name))
+                with open(os.path.join(input_dir, name, "form.yaml"), "w", encoding="utf-8") as f:
+                    f.write(f"name: {value}\n")
+            schema_file = os.path.join(tmp_dir, "schema.yaml")
+            with open(schema_file, "w", encoding="utf-8") as f:
+                f.write("type: object\nproperties:\n  name:\n    type: string\n")
+            cache_file = os.path.join(tmp_dir, "cache.bin")
+
+            output = io.StringIO()
+            with (
+                unittest.mock.patch.object(DirectoryAnalyzer, "cache_file", cache_file),
+                contextlib.redirect_stdout(output),
+            ):
+                cli.main(["-i", input_dir, "-s", schema_file])
+            lines = output.getvalue().splitlines()
+            # 同じ名前のファイルが上書きし合わず、入力ディレクトリからの相対パスで報告される
+            assert "Validation failed for a/form with the following errors:" in lines
+            b_index = lines.index("Validation failed for b/form with the following errors:")
+            assert lines[b_index + 1] == "1 is not of type 'string'"
+            # 次回の実行で使えるようにキャッシュを保存する
+            assert os.path.exists(cache_file)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,8 +1,29 @@
 import csv
+import datetime
 import os
+import pickle
+import tempfile
 import unittest
+import unittest.mock
 
-from yamlguardian.directory_analyzer import DirectoryAnalyzer
+import pytest
+
+from yamlguardian.change_detector import DIGEST, MTIME_NS, ChangeDetector, file_digest, stat_signature
+from yamlguardian.directory_analyzer import (
+    BinaryCacheStore,
+    CacheStore,
+    DirectoryAnalyzer,
+    SqliteCacheStore,
+    default_cache_file,
+    open_cache_store,
+    scan_yaml_files,
+)
+from yamlguardian.validate import load_validation_rules
+
+
+class _Exploit:
+    def __reduce__(self):
+        return (os.system, ("touch exploited",))
 
 
 class TestDirectoryAnalyzer(unittest.TestCase):
@@ -54,5 +75,285 @@ class TestDirectoryAnalyzer(unittest.TestCase):
         assert file_path in analyzer.validation_schema_cache
 
 
+class TestParallelScan(unittest.TestCase):
+    def test_parallel_scan_matches_sequential(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for page in ("page1", "page2", "page2/sub"):
+                os.makedirs(os.path.join(tmp_dir, page), exist_ok=True)
+                for name in ("form1.yaml", "form2.yaml", "notes.txt"):
+                    with open(os.path.join(tmp_dir, page, name), "w") as f:
+                        f.write(f"name: {page}/{name}\n")
+
+            yaml_files = scan_yaml_files(tmp_dir)
+            assert len(yaml_files) == 6
+            assert yaml_files == sorted(yaml_files)
+
+            sequential = DirectoryAnalyzer(os.path.join(tmp_dir, "seq.bin"))
+            sequential.analyze_directory_structure(tmp_dir)
+            parallel = DirectoryAnalyzer(os.path.join(tmp_dir, "par.bin"))
+            parallel.analyze_directory_structure(tmp_dir, jobs=2)
+            assert list(parallel.validation_rules.items()) == list(sequential.validation_rules.items())
+
+
+class TestCacheStores(unittest.TestCase):
+    def test_open_cache_store_by_extension(self):
+        assert isinstance(open_cache_store("cache.sqlite"), SqliteCacheStore)
+        assert isinstance(open_cache_store("cache.bin"), BinaryCacheStore)
+
+    def test_round_trip_and_lazy_get(self):
+        for extension in (".bin", ".sqlite"):
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                cache_file = os.path.join(tmp_dir, "cache" + extension)
+                store = open_cache_store(cache_file)
+                store.save({"a.yaml": ({"name": "a"}, 1.0), "b.yaml": ({"name": "b"}, 2.0)})
+                store.close()
+
+                # 一部だけ更新しても、読み込んでいない他のエントリは残る
+                store = open_cache_store(cache_file)
+                assert store.states() == {"a.yaml": 1.0, "b.yaml": 2.0}
+                store.save({"b.yaml": ({"name": "b2"}, 3.0)})
+                assert store.get("a.yaml") == {"name": "a"}
+                assert store.get("b.yaml") == {"name": "b2"}
+                assert store.get("c.yaml") is None
+                store.close()
+
+                # 削除されたエントリは索引からも消える
+                store = open_cache_store(cache_file)
+                store.save({}, deleted=["a.yaml"])
+                assert store.states() == {"b.yaml": 3.0}
+                assert store.get("a.yaml") is None
+                store.close()
+
+    def test_yaml_values_round_trip(self):
+        content = {
+            "date": datetime.date(2024, 1, 2),
+            "at": datetime.datetime(2024, 1, 2, 3, 4, 5),
+            "items": [1, 2.5, True, None, b"bin"],
+            "keys": {1: "one", datetime.date(2024, 1, 1): "new year"},
+            "set": {"a", "b"},
+        }
+        for extension in (".bin", ".sqlite"):
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                store = open_cache_store(os.path.join(tmp_dir, "cache" + extension))
+                store.save({"a.yaml": (content, (1, 2, 3, 4, "digest")), "b.yaml": (object(), (1, 2, 3, 4, "x"))})
+                store.close()
+                store = open_cache_store(os.path.join(tmp_dir, "cache" + extension))
+                # キャッシュできない内容は保存しない
+                assert store.states() == {"a.yaml": (1, 2, 3, 4, "digest")}
+                assert store.get("a.yaml") == content
+                store.close()
+
+    def test_pickled_cache_is_not_loaded(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_file = os.path.join(tmp_dir, "cache.bin")
+            with open(cache_file, "wb") as f:
+                f.write(pickle.dumps(_Exploit()))
+            with unittest.mock.patch("os.system", side_effect=AssertionError):
+                analyzer = DirectoryAnalyzer(cache_file)
+            assert analyzer.cache_states == {}
+            analyzer.cache_store.close()
+
+    def test_corrupt_cache_is_treated_as_empty(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            rule_dir = os.path.join(tmp_dir, "rules")
+            os.makedirs(rule_dir)
+            with open(os.path.join(rule_dir, "a.yaml"), "w") as f:
+                f.write("name: a\n")
+            cache_file = os.path.join(tmp_dir, "cache.bin")
+            store = BinaryCacheStore(cache_file)
+            store.save({"x.yaml": ({"name": "x"}, 1.0), "y.yaml": ({"name": "y"}, 2.0)})
+            store.close()
+            with open(cache_file, "rb") as f:
+                data = f.read()
+
+            index_offset = len(data) - BinaryCacheStore.FOOTER.size
+            for broken in (
+                data[: len(data) // 2],
+                data[:index_offset] + BinaryCacheStore.FOOTER.pack(len(data) * 2),
+                data[:index_offset] + BinaryCacheStore.FOOTER.pack(len(BinaryCacheStore.MAGIC)),
+                data.replace(b'"x.yaml": [', b'"x.yaml": [9999'),
+            ):
+                with open(cache_file, "wb") as f:
+                    f.write(broken)
+                analyzer = DirectoryAnalyzer(cache_file)
+                assert analyzer.cache_states == {}
+                analyzer.analyze_directory_structure(rule_dir)
+                assert list(analyzer.validation_rules) == [os.path.join(rule_dir, "a.yaml")]
+                # 次の save で正しいキャッシュに作り直される
+                analyzer.save_cache()
+                analyzer.cache_store.close()
+                store = BinaryCacheStore(cache_file)
+                assert list(store.states()) == [os.path.join(rule_dir, "a.yaml")]
+                store.close()
+
+    def test_save_uses_unique_temp_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_file = os.path.join(tmp_dir, "cache.bin")
+            store = BinaryCacheStore(cache_file)
+            store.save({"a.yaml": ({"name": "a"}, 1.0)})
+            store.close()
+
+            # 書き込みに失敗しても一時ファイルは残らず、元のキャッシュもそのまま
+            store = BinaryCacheStore(cache_file)
+            with (
+                unittest.mock.patch.object(BinaryCacheStore, "_write", side_effect=OSError),
+                pytest.raises(OSError),
+            ):
+                store.save({"b.yaml": ({"name": "b"}, 2.0)})
+            store.close()
+            assert os.listdir(tmp_dir) == ["cache.bin"]
+            assert BinaryCacheStore(cache_file).states() == {"a.yaml": 1.0}
+
+            temp_names = []
+            mkstemp = tempfile.mkstemp
+
+            def recording_mkstemp(*args, **kwargs):
+                fd, path = mkstemp(*args, **kwargs)
+                temp_names.append(path)
+                return fd, path
+
+            with unittest.mock.patch("tempfile.mkstemp", side_effect=recording_mkstemp):
+                for _ in range(2):
+                    store = BinaryCacheStore(cache_file)
+                    store.save({"b.yaml": ({"name": "b"}, 2.0)})
+                    store.close()
+            assert len(set(temp_names)) == 2
+            assert all(os.path.dirname(name) == tmp_dir for name in temp_names)
+
+    def test_default_cache_file_is_per_user(self):
+        with unittest.mock.patch.dict(os.environ, {"XDG_CACHE_HOME": "/tmp/xdg"}):
+            if os.name != "nt":
+                assert default_cache_file() == os.path.join("/tmp/xdg", "yamlguardian", "cache.bin")
+            assert DirectoryAnalyzer(cache_store=BinaryCacheStore("unused.bin")).cache_file == default_cache_file()
+
+    def test_cache_store_is_abstract(self):
+        with pytest.raises(TypeError):
+            CacheStore("cache.bin")
+
+    def test_warm_cache_still_collects_rules(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            rule_dir = os.path.join(tmp_dir, "rules")
+            os.makedirs(os.path.join(rule_dir, "sub"))
+            for name in ("a.yaml", "sub/b.yaml"):
+                with open(os.path.join(rule_dir, name), "w") as f:
+                    f.write(f"name: {name}\n")
+            cache_file = os.path.join(tmp_dir, "cache.bin")
+            analyzer = DirectoryAnalyzer(cache_file)
+            analyzer.analyze_directory_structure(rule_dir)
+            cold = dict(analyzer.validation_rules)
+            analyzer.save_cache()
+            analyzer.cache_store.close()
+            assert len(cold) == 2
+
+            analyzer = DirectoryAnalyzer(cache_file)
+            assert analyzer.analyze_directory_structure(rule_dir) == []
+            assert analyzer.validation_rules == cold
+            analyzer.cache_store.close()
+
+            with unittest.mock.patch.object(DirectoryAnalyzer, "cache_file", cache_file):
+                assert load_validation_rules(rule_dir) == cold
+
+    def test_analyze_uses_single_scan(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with open(os.path.join(tmp_dir, "a.yaml"), "w") as f:
+                f.write("name: a\n")
+            analyzer = DirectoryAnalyzer(os.path.join(tmp_dir, "cache.bin"))
+            # 2 回目の走査で新しいファイルが見つかっても KeyError にならないよう、走査は 1 回だけ行う
+            with unittest.mock.patch("yamlguardian.directory_analyzer.scan_yaml_files", wraps=scan_yaml_files) as scan:
+                analyzer.analyze_directory_structure(tmp_dir)
+            assert scan.call_count == 1
+            assert list(analyzer.validation_rules) == [os.path.join(tmp_dir, "a.yaml")]
+
+    def test_analyzer_warms_from_cache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            yaml_path = os.path.join(tmp_dir, "rule.yaml")
+            with open(yaml_path, "w") as f:
+                f.write("name: test\n")
+            cache_file = os.path.join(tmp_dir, "cache.bin")
+            analyzer = DirectoryAnalyzer(cache_file)
+            assert analyzer.load_yaml_with_cache(yaml_path) == ({"name": "test"}, True)
+            analyzer.save_cache()
+            analyzer.cache_store.close()
+
+            analyzer = DirectoryAnalyzer(cache_file)
+            assert yaml_path not in analyzer.validation_schema_cache
+            assert analyzer.load_yaml_with_cache(yaml_path) == ({"name": "test"}, False)
+            analyzer.cache_store.close()
+
+
+class TestChangeDetector(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = self.tmp_dir.name
+        self.path = os.path.join(self.root, "rule.yaml")
+        with open(self.path, "w") as f:
+            f.write("name: test\n")
+        self.detector = ChangeDetector()
+        self.state = stat_signature(self.path) + (file_digest(self.path),)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_unchanged_by_stat(self):
+        assert self.detector.check(self.path, self.state) == (False, self.state)
+
+    def test_size_change_is_detected(self):
+        with open(self.path, "w") as f:
+            f.write("name: changed\n")
+        assert self.detector.check(self.path, self.state) == (True, None)
+
+    def test_same_size_with_restored_mtime_is_detected(self):
+        # touch -r と同様に mtime を戻しても ctime が変わるので内容を比べる
+        with open(self.path, "w") as f:
+            f.write("name: tesT\n")
+        os.utime(self.path, ns=(self.state[MTIME_NS], self.state[MTIME_NS]))
+        assert self.detector.check(self.path, self.state) == (True, None)
+
+    def test_rewrite_with_same_content_is_unchanged(self):
+        with open(self.path, "w") as f:
+            f.write("name: test\n")
+        os.utime(self.path, ns=(self.state[MTIME_NS] + 10**9, self.state[MTIME_NS] + 10**9))
+        is_changed, state = self.detector.check(self.path, self.state)
+        assert not is_changed
+        assert state[DIGEST] == self.state[DIGEST]
+        assert state[:DIGEST] == stat_signature(self.path)
+
+    def test_diff_classifies_files_and_directories(self):
+        new_dir = os.path.join(self.root, "new")
+        gone_dir = os.path.join(self.root, "gone")
+        new_file = os.path.join(new_dir, "a.yaml")
+        gone_file = os.path.join(gone_dir, "b.yaml")
+        outside = os.path.join(os.path.dirname(self.root), "other", "c.yaml")
+        change_set = self.detector.diff(
+            self.root,
+            [self.path, new_file],
+            [self.path, new_file],
+            [self.path, gone_file, outside],
+        )
+        assert change_set.added == {new_file}
+        assert change_set.modified == {self.path}
+        assert change_set.deleted == {gone_file}
+        assert change_set.added_directories == {new_dir}
+        assert change_set.modified_directories == {self.root}
+        assert change_set.deleted_directories == {gone_dir}
+        assert ["DeletedFile", gone_file] in change_set.to_rows()
+
+    def test_analyzer_forgets_deleted_files(self):
+        cache_file = os.path.join(self.root, "cache.bin")
+        analyzer = DirectoryAnalyzer(cache_file)
+        analyzer.analyze_directory_structure(self.root)
+        analyzer.save_cache()
+        analyzer.cache_store.close()
+
+        os.remove(self.path)
+        analyzer = DirectoryAnalyzer(cache_file)
+        analyzer.analyze_directory_structure(self.root)
+        assert analyzer.change_set.deleted == {self.path}
+        assert self.path not in analyzer.validation_rules
+        analyzer.save_cache()
+        assert self.path not in analyzer.cache_store.states()
+        analyzer.cache_store.close()
+
+
 if __name__ == "__main__":
     unittest.main()
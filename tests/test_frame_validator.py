@@ -0,0 +1,131 @@
+import contextlib
+import io
+import os
+import random
+import tempfile
+import unittest
+
+import pandas as pd
+
+from yamlguardian import cli
+from yamlguardian.core import YamlGuardian
+from yamlguardian.frame_validator import read_frame, validate_frame
+from yamlguardian.validator import Validator
+
+SCHEMA = {
+    "root_element": [
+        {"name": "name", "description": "名前", "type": "string", "required": True, "minlength": 2, "maxlength": 4},
+        {"name": "age", "description": "年齢", "type": "integer", "min": 0, "max": 150},
+        {"name": "tags", "description": "タグ", "type": "list", "maxlength": 2},
+        {"name": "score", "description": "点数", "min": 0.5},
+        {"name": "secret", "description": "秘密", "prohibited": True},
+        {"name": "even", "description": "偶数", "custom_rules": [lambda value: value is None or value % 2 == 0]},
+        {"name": "missing", "description": "なし", "required": True},
+    ]
+}
+
+SCHEMA_FILE = """
+root_element:
+  - name: name
+    description: Name
+    type: string
+    required: true
+  - name: age
+    description: Age
+    type: integer
+    min: 0
+"""
+
+
+def record(row) -> dict:
+    """DataFrame の 1 行を dict にする (欠損値の要素は含めない)"""
+    return {key: value for key, value in row.items() if not (pd.api.types.is_scalar(value) and pd.isna(value))}
+
+
+class TestValidateFrame(unittest.TestCase):
+    def assert_matches_records(self, df, schema):
+        validator = Validator(schema)
+        failures = validate_frame(df, schema)
+        for index, row in zip(df.index, df.to_dict("records")):
+            expected = validator.validate(record(row))
+            assert [failure["message"] for failure in failures if index in failure["rows"]] == expected, row
+
+    def test_matches_record_validation(self):
+        rng = random.Random(0)
+        size = 300
+        df = pd.DataFrame(
+            {
+                "name": [rng.choice(["a", "ab", "abcde", None]) for _ in range(size)],
+                "age": [rng.choice([-1, 0, 30, 200]) for _ in range(size)],
+                "tags": [rng.choice([["a"], ["a", "b", "c"], "abc", 1, None]) for _ in range(size)],
+                "score": [rng.choice([0.1, 1.0, float("nan")]) for _ in range(size)],
+                "secret": [rng.choice([None, "x"]) for _ in range(size)],
+                "even": [rng.choice([1, 2, None]) for _ in range(size)],
+            },
+            index=range(100, 100 + size),
+        )
+        self.assert_matches_records(df, SCHEMA)
+        # nullable な型の列も同じ結果になる
+        self.assert_matches_records(df.convert_dtypes(), SCHEMA)
+
+    def test_reports_rows_per_rule(self):
+        df = pd.DataFrame({"name": ["ab", "a", None], "age": [1, -1, 2]})
+        failures = validate_frame(df, SCHEMA)
+        by_rule = {(failure["name"], failure["rule"]): failure["rows"] for failure in failures}
+        assert by_rule[("name", "required")] == [2]
+        assert by_rule[("name", "minlength")] == [1]
+        assert by_rule[("age", "min")] == [1]
+        assert by_rule[("missing", "required")] == [0, 1, 2]
+        assert ("age", "type") not in by_rule
+
+    def test_guardian_and_cli(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            schema_file = os.path.join(tmp_dir, "schema.yaml")
+            with open(schema_file, "w", encoding="utf-8") as f:
+                f.write(SCHEMA_FILE)
+            csv_file = os.path.join(tmp_dir, "records.csv")
+            with open(csv_file, "w", encoding="utf-8") as f:
+                f.write("name,age\na,1\n,2\nc,\nd,-3\n")
+            jsonl_file = os.path.join(tmp_dir, "records.jsonl")
+            with open(jsonl_file, "w", encoding="utf-8") as f:
+                f.write('{"name": "a", "age": 1}\n{"name": "b", "age": 2}\n')
+
+            guardian = YamlGuardian(schema_file)
+            failures = guardian.validate_frame(read_frame(csv_file))
+            assert [(failure["rule"], failure["rows"]) for failure in failures] == [
+                ("required", [1]),
+                ("type", [1]),
+                ("type", [2]),
+                ("min", [3]),
+            ]
+
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                cli.main(["-i", csv_file, "-s", schema_file])
+                cli.main(["-i", jsonl_file, "-s", schema_file])
+            lines = output.getvalue().splitlines()
+            assert "Rule 'min' of age failed for 1 row(s): Age は 0 以上である必要があります。" in lines
+            assert f"Validation failed for 3 row(s) in {csv_file}." in lines
+            assert f"Validation succeeded for {jsonl_file}." in lines
+
+    def test_digit_only_string_column(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            schema_file = os.path.join(tmp_dir, "schema.yaml")
+            with open(schema_file, "w", encoding="utf-8") as f:
+                f.write(SCHEMA_FILE)
+            csv_file = os.path.join(tmp_dir, "records.csv")
+            with open(csv_file, "w", encoding="utf-8") as f:
+                f.write("name,age\n007,1\n0123,2\n,3\n")
+
+            guardian = YamlGuardian(schema_file)
+            df = guardian.read_frame(csv_file)
+            assert df["name"].tolist()[:2] == ["007", "0123"]
+            assert df["age"].tolist() == [1, 2, 3]
+            assert [(failure["rule"], failure["rows"]) for failure in guardian.validate_frame(df)] == [
+                ("required", [2]),
+                ("type", [2]),
+            ]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,41 @@
+import copy
+import random
 import unittest
 
 from yamlguardian.hierarchy_merger import HierarchyMerger
 
 
+def sequential_merge(hierarchies):
+    """以前の実装と同じ順次マージ (入力を複製してから使う)"""
+
+    def merge_dicts(dict1, dict2):
+        for key, value in dict2.items():
+            if key in dict1 and isinstance(dict1[key], dict) and isinstance(value, dict):
+                merge_dicts(dict1[key], value)
+            elif key in dict1 and isinstance(dict1[key], list) and isinstance(value, list):
+                dict1[key].extend(value)
+            else:
+                dict1[key] = value
+
+    merged = {}
+    for hierarchy in copy.deepcopy(hierarchies):
+        merge_dicts(merged, hierarchy)
+    return merged
+
+
+def random_hierarchy(rng, depth=3):
+    hierarchy = {}
+    for key in rng.sample("abcd", rng.randint(1, 3)):
+        kind = rng.choice(["dict", "list", "scalar"] if depth else ["list", "scalar"])
+        if kind == "dict":
+            hierarchy[key] = random_hierarchy(rng, depth - 1)
+        elif kind == "list":
+            hierarchy[key] = [rng.randint(0, 9)]
+        else:
+            hierarchy[key] = rng.randint(0, 9)
+    return hierarchy
+
+
 class TestHierarchyMerger(unittest.TestCase):
     def setUp(self):
         self.merger = HierarchyMerger()
@@ -32,6 +65,51 @@ class TestHierarchyMerger(unittest.TestCase):
         assert merged["name"] == "Jane"
         assert merged["age"] == 25
 
+    def test_merge_hierarchies_lists(self):
+        merged = self.merger.merge_hierarchies([{"items": [1]}, {"items": [2]}, {"items": [3]}])
+        assert merged == {"items": [1, 2, 3]}
+
+    def test_inputs_are_not_mutated(self):
+        hierarchies = [{"person": {"name": "John"}, "tags": ["a"]}, {"person": {"age": 30}, "tags": ["b"]}]
+        original = copy.deepcopy(hierarchies)
+        merged = self.merger.merge_hierarchies(hierarchies)
+        assert merged == {"person": {"name": "John", "age": 30}, "tags": ["a", "b"]}
+        assert hierarchies == original
+        # 後からマージしても最初の階層の部分木は変わらない
+        self.merger.merge_hierarchies([merged, {"person": {"city": "Tokyo"}}])
+        assert hierarchies == original
+        assert "city" not in merged["person"]
+
+    def test_replaced_values_are_not_merged_again(self):
+        hierarchies = [{"k": {"x": 1}}, {"k": 5}, {"k": {"y": 2}}, {"l": [1]}, {"l": {}}, {"l": [2]}]
+        assert self.merger.merge_hierarchies(hierarchies) == {"k": {"y": 2}, "l": [2]}
+
+    def test_matches_sequential_merge(self):
+        rng = random.Random(0)
+        for _ in range(200):
+            hierarchies = [random_hierarchy(rng) for _ in range(rng.randint(0, 9))]
+            assert self.merger.merge_hierarchies(hierarchies) == sequential_merge(hierarchies)
+
+    def test_deep_hierarchy(self):
+        depth = 10000
+        hierarchies = []
+        for leaf in ("first", "second"):
+            hierarchy = node = {}
+            for _ in range(depth):
+                node["child"] = {}
+                node = node["child"]
+            node[leaf] = True
+            hierarchies.append(hierarchy)
+        node = self.merger.merge_hierarchies(hierarchies)
+        for _ in range(depth):
+            node = node["child"]
+        assert node == {"first": True, "second": True}
+
+    def test_process_pool(self):
+        rng = random.Random(1)
+        hierarchies = [random_hierarchy(rng) for _ in range(50)]
+        assert HierarchyMerger(jobs=3).merge_hierarchies(hierarchies) == sequential_merge(hierarchies)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# CLI やプリコミットフックの起動で読み込まれてはいけない重い依存
+HEAVY_MODULES = ("fastapi", "pydantic", "jsonschema", "cerberus", "jsonref", "ruamel", "pandas")
+
+# yamlguardian.core の import にかけてよい時間 (ミリ秒)。遅い CI では環境変数で緩める
+IMPORT_BUDGET_MS = int(os.environ.get("YAMLGUARDIAN_IMPORT_BUDGET_MS", "250"))
+
+
+def import_times(module) -> dict:
+    """-X importtime の出力から モジュール名 -> 累積時間 (マイクロ秒) を得る"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        cwd=ROOT_DIR,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestImportTime(unittest.TestCase):
+    def test_heavy_dependencies_are_lazy(self):
+        for module in ("yamlguardian.core", "yamlguardian.validate", "yamlguardian.cli"):
+            times = import_times(module)
+            loaded = sorted(name for name in times if name.split(".")[0] in HEAVY_MODULES)
+            assert loaded == [], f"{module} imports {loaded}"
+
+    def test_core_import_budget(self):
+        # 一度目はバイトコードの生成を含むので、二度目を計測する
+        import_times("yamlguardian.core")
+        cumulative_ms = import_times("yamlguardian.core")["yamlguardian.core"] / 1000
+        assert cumulative_ms < IMPORT_BUDGET_MS, f"import yamlguardian.core took {cumulative_ms:.0f} ms"
+
+    def test_lazy_module_attributes(self):
+        from yamlguardian import save_load_yaml, yaml_to_json_schema
+
+        assert save_load_yaml.yaml is save_load_yaml.get_yaml()
+        assert yaml_to_json_schema.converter is yaml_to_json_schema.get_converter()
+
+
+if __name__ == "__main__":
+    unittest.main()
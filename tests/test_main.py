@@ -0,0 +1,132 @@
+import json
+import operator
+import os
+import tempfile
+import threading
+import time
+import unittest
+import unittest.mock
+
+from fastapi.testclient import TestClient
+
+import main
+from yamlguardian import rule_bundle
+from yamlguardian.bounded_executor import BoundedExecutor
+from yamlguardian.rule_bundle import compile_bundle
+from yamlguardian.validate import count_errors
+
+NDJSON = {"content-type": "application/x-ndjson"}
+
+
+def batch_results(response) -> list[dict]:
+    """NDJSON のレスポンスを入力の順に並べる (結果は完了した順に返る)"""
+    results = [json.loads(line) for line in response.text.splitlines()]
+    return sorted(results, key=operator.itemgetter("index"))
+
+
+class TestValidateBatch(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(main.app)
+
+    def test_multi_document_body(self):
+        body = json.dumps(["a: 1\nb: 2\nc: 3", {"yaml_content": "a: 1"}, "{}"])
+        response = self.client.post("/validate/batch", content=body, headers={"content-type": "application/json"})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        results = batch_results(response)
+        assert [result["index"] for result in results] == [0, 1, 2]
+        assert results[0]["message"] == "Validation failed"
+        assert set(results[0]["errors"]) == {"a", "b", "c"}
+        assert results[1]["errors"] == {"a": ["unknown field"]}
+        assert results[2]["message"] == "Validation successful"
+
+    def test_malformed_line(self):
+        # JSON として読めない行はリクエスト全体のエラーになる
+        body = b'{"yaml_content": "a: 1"}\nnot json\n'
+        response = self.client.post("/validate/batch", content=body, headers=NDJSON)
+        assert response.status_code == 422
+        assert response.json()["message"] == "Validation error"
+
+        response = self.client.post("/validate/batch", content=b'{"content": "a: 1"}\n', headers=NDJSON)
+        assert response.status_code == 422
+        assert "yaml_content" in response.json()["detail"]
+
+        # YAML として読めないドキュメントはその行だけのエラーになる
+        body = b'{"yaml_content": "a: [1"}\n\n"{}"\n'
+        response = self.client.post("/validate/batch", content=body, headers=NDJSON)
+        assert response.status_code == 200
+        results = batch_results(response)
+        assert [result["message"] for result in results] == ["Validation error", "Validation successful"]
+
+    def test_max_errors(self):
+        body = b'"a: 1\\nb: 2\\nc: 3"\n'
+        for max_errors in (1, 2, 4):
+            response = self.client.post(
+                "/validate/batch", content=body, headers=NDJSON, params={"max_errors": max_errors}
+            )
+            # ステージをまたいでも報告するメッセージは max_errors 件まで
+            assert count_errors(batch_results(response)[0]["errors"]) == max_errors
+
+        response = self.client.post("/validate/batch", content=body, headers=NDJSON, params={"mode": "exhaustive"})
+        errors = batch_results(response)[0]["errors"]
+        assert set(errors) == {"openapi", "user_defined", "user_provided"}
+        assert count_errors(errors) == 9
+
+        response = self.client.post("/validate/batch", content=body, headers=NDJSON, params={"max_errors": 0})
+        assert response.status_code == 422
+
+
+class TestLoadShedding(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(main.app)
+        self.executor = BoundedExecutor("thread", max_workers=1, max_in_flight=1)
+        self.release = threading.Event()
+        patcher = unittest.mock.patch.object(main, "validation_executor", self.executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.executor.shutdown)
+        self.addCleanup(self.release.set)
+
+    def test_busy_executor_returns_503(self):
+        self.executor.submit(self.release.wait)
+        response = self.client.post("/validate", json={"yaml_content": "{}"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == str(main.RETRY_AFTER_SECONDS)
+        assert response.json()["message"] == "Server busy"
+        assert response.json()["in_flight"] == 1
+
+        response = self.client.post("/validate/batch", content=b'"{}"\n', headers=NDJSON)
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == str(main.RETRY_AFTER_SECONDS)
+
+        # 空きができれば受け付ける (完了コールバックは result() の後に走ることがある)
+        self.release.set()
+        deadline = time.monotonic() + 5
+        while self.executor.in_flight and time.monotonic() < deadline:
+            time.sleep(0.01)
+        response = self.client.post("/validate", json={"yaml_content": "{}"})
+        assert response.status_code == 200
+
+
+class TestBundleGuardian(unittest.TestCase):
+    def test_bundle_from_other_compiler_is_not_served(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            schema_file = os.path.join(tmp_dir, "schema.yaml")
+            with open(schema_file, "w", encoding="utf-8") as f:
+                f.write("type: object\n")
+            bundle_path = os.path.join(tmp_dir, "rules.ygb")
+            compile_bundle(schema_file=schema_file).save(bundle_path)
+
+            with (
+                unittest.mock.patch.object(main, "BUNDLE_PATH", bundle_path),
+                unittest.mock.patch.object(main, "CHECK_BUNDLE", False),
+                unittest.mock.patch("builtins.print"),
+            ):
+                assert main.load_bundle_guardian() is not None
+                # YAMLGUARDIAN_BUNDLE_CHECK を指定しなくても、別のコードでコンパイルしたバンドルは使わない
+                with unittest.mock.patch.object(rule_bundle, "_compiler_fingerprint", b"\1" * 16):
+                    assert main.load_bundle_guardian() is None
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+import pytest
+
+from yamlguardian import page_rules as page_rules_module
+from yamlguardian.core import YamlGuardian
+from yamlguardian.page_rules import PageRuleCache, page_rule_cache, resolve_page_dir
+from yamlguardian.rule_watcher import stop_watching, watch_rules
+
+COMMON = """
+common_elements:
+  - name: commonLabel
+    description: 共通ラベル
+"""
+
+FORM = """
+root_element:
+  name: FormA
+  elements:
+    - name: commonLabel
+      description: 共通ラベル
+      uses_common: true
+    - name: age
+      type: integer
+      description: Age
+      required: true
+"""
+
+JSON_SCHEMA = """
+type: object
+properties:
+  name:
+    type: string
+"""
+
+SUCCESS = {"message": "Validation successful"}
+
+
+class TestPageRules(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp_dir.name, "rule_config")
+        self.write("common_definitions/common.yaml", COMMON)
+        self.write("page_definitions/page1/form.yaml", FORM)
+        self.write("page_definitions/page1/schema.yaml", JSON_SCHEMA)
+        self.cache = PageRuleCache()
+        self.guardian = YamlGuardian.from_definitions({}, rule_dir=self.root)
+        # ページ定義に依存しないステージは検証の対象外にする
+        patcher = unittest.mock.patch.multiple(
+            "yamlguardian.core",
+            validate_openapi_schema=unittest.mock.DEFAULT,
+            validate_user_defined_yaml=unittest.mock.DEFAULT,
+            validate_user_provided_yaml=unittest.mock.DEFAULT,
+        )
+        self.stages = patcher.start()
+        for stage in self.stages.values():
+            stage.return_value = SUCCESS
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        stop_watching()
+        page_rule_cache.invalidate()
+        self.tmp_dir.cleanup()
+
+    def path(self, relative_path):
+        return os.path.abspath(os.path.join(self.root, relative_path))
+
+    def write(self, relative_path, content):
+        path = self.path(relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        # 同じ mtime にならないよう明示的にずらす
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    def test_effective_rule_set(self):
+        rules = self.cache.get(self.path("page_definitions/page1"))
+        assert set(rules.definitions) == {
+            self.path("page_definitions/page1/form.yaml"),
+            self.path("page_definitions/page1/schema.yaml"),
+        }
+        assert "commonLabel" in rules.common_index
+        form = self.path("page_definitions/page1/form.yaml")
+        schema = self.path("page_definitions/page1/schema.yaml")
+        assert rules.validate_definition(form, {"age": 1}) == []
+        assert rules.validate_definition(form, {"age": "x"}) == ["Age は整数である必要があります。"]
+        errors = rules.validate_definition(schema, {"name": 1})
+        assert len(errors) == 1
+        assert errors[0].startswith("1 is not of type 'string'")
+
+    def test_cached_until_files_change(self):
+        page_dir = self.path("page_definitions/page1")
+        rules = self.cache.get(page_dir)
+        with unittest.mock.patch.object(page_rules_module, "build_page_rules", side_effect=AssertionError):
+            assert self.cache.get(page_dir) is rules
+
+        self.write("page_definitions/page1/form.yaml", FORM.replace("integer", "string"))
+        changed = self.cache.get(page_dir)
+        assert changed is not rules
+        assert changed.validate_definition(self.path("page_definitions/page1/form.yaml"), {"age": 1})
+
+        self.write("page_definitions/page1/extra.yaml", JSON_SCHEMA)
+        assert self.path("page_definitions/page1/extra.yaml") in self.cache.get(page_dir).definitions
+
+    def test_common_definitions_change_invalidates_pages(self):
+        page_dir = self.path("page_definitions/page1")
+        form = self.path("page_definitions/page1/form.yaml")
+        assert self.cache.get(page_dir).validate_definition(form, {"age": 1}) == []
+        self.write("common_definitions/common.yaml", "common_elements: []\n")
+        errors = self.cache.get(page_dir).validate_definition(form, {"age": 1})
+        assert errors == ["共通ラベル は共通要素として定義されていません。"]
+
+    def test_page_common_definitions_override(self):
+        self.write("common_definitions/common.yaml", "common_elements: []\n")
+        self.write("page_definitions/page1/common.yaml", COMMON)
+        rules = self.cache.get(self.path("page_definitions/page1"))
+        assert rules.validate_definition(self.path("page_definitions/page1/form.yaml"), {"age": 1}) == []
+
+    def test_uses_active_watcher(self):
+        watch_rules(self.root, use_inotify=False, poll_interval=10)
+        with unittest.mock.patch.object(page_rules_module, "load_definitions", side_effect=AssertionError):
+            rules = self.cache.get(self.path("page_definitions/page1"))
+        assert rules.signature[0] == "watch"
+        assert "commonLabel" in rules.common_index
+
+    def test_resolve_page_dir(self):
+        assert resolve_page_dir("page1", self.root) == self.path("page_definitions/page1")
+        assert resolve_page_dir(self.path("page_definitions/page1")) == self.path("page_definitions/page1")
+        with pytest.raises(ValueError):
+            resolve_page_dir("missing", self.root)
+
+    def test_validate_page(self):
+        assert self.guardian.validate_page({"age": 1, "name": "a"}, "page1") == SUCCESS
+        assert self.guardian.validate_page({"age": "x"}, "page1") == "Age は整数である必要があります。"
+        assert self.guardian.validate_page({"age": 1, "name": 1}, self.path("page_definitions/page1")) != SUCCESS
+        # 2 回目以降はディレクトリを読み直さない
+        with unittest.mock.patch.object(page_rules_module, "load_definitions", side_effect=AssertionError):
+            assert self.guardian.validate_page({"age": 1}, "page1") == SUCCESS
+
+    def test_routing(self):
+        self.write("page_definitions/page1/form_b.yaml", FORM.replace("FormA", "FormB"))
+        self.write("page_definitions/page1/by_type.yaml", "root_element:\n  type: dialog\n  elements: []\n")
+        self.write("page_definitions/page1/declared.yaml", "targets: [FormA]\n" + JSON_SCHEMA)
+        self.write("page_definitions/page1/relations.yaml", "root_element_relations:\n  - source: FormB\n")
+        rules = self.cache.get(self.path("page_definitions/page1"))
+
+        def applicable(document):
+            return [os.path.basename(path) for path in rules.applicable(document)]
+
+        form_a = {"root_element": {"name": "FormA", "type": "form"}}
+        assert applicable(form_a) == ["declared.yaml", "form.yaml", "schema.yaml"]
+        assert applicable({"root_element": {"name": "FormB"}}) == ["form_b.yaml", "relations.yaml", "schema.yaml"]
+        assert applicable({"root_element": {"name": "Other", "type": "dialog"}}) == ["by_type.yaml", "schema.yaml"]
+        assert applicable({"root_element": {"name": "Unknown"}}) == ["schema.yaml"]
+        # 振り分けられないドキュメントにはすべての定義を適用する
+        assert len(applicable({"age": 1})) == 6
+        # 索引にない name は 1 つの経路にまとめてキャッシュされる
+        applicable({"root_element": {"name": "Unknown2"}})
+        assert len(rules._routes) == 5
+
+    def test_validate_page_runs_independent_stages_once(self):
+        for i in range(5):
+            self.write(f"page_definitions/page1/form{i}.yaml", FORM.replace("FormA", f"Form{i}"))
+        document = {"root_element": {"name": "FormA"}, "age": 1}
+        with unittest.mock.patch.object(page_rules_module.PageRules, "validate_definition", return_value=[]) as check:
+            assert self.guardian.validate_page(document, "page1") == SUCCESS
+        assert check.call_count == 2
+        for stage in self.stages.values():
+            assert stage.call_count == 1
+
+
+if __name__ == "__main__":
+    unittest.main()
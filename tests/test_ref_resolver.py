@@ -0,0 +1,149 @@
+import copy
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+import pytest
+
+from yamlguardian import yaml_to_json_schema as yaml_to_json_schema_module
+from yamlguardian.ref_resolver import RefResolver, resolve_refs, schema_size
+from yamlguardian.yaml_to_json_schema import merge_yaml_schemas, resolve_merged_json_schema, schema_size_report
+
+
+def doubling_schema(depth):
+    """各定義が 1 つ前の定義を 2 回参照する (展開すると 2**depth に膨らむ) スキーマ"""
+    defs = {"d0": {"type": "string"}}
+    for i in range(1, depth):
+        ref = {"$ref": f"#/$defs/d{i - 1}"}
+        defs[f"d{i}"] = {"type": "object", "properties": {"a": dict(ref), "b": dict(ref)}}
+    return {"$defs": defs, "properties": {"top": {"$ref": f"#/$defs/d{depth - 1}"}}}
+
+
+class TestRefResolver(unittest.TestCase):
+    def test_resolves_nested_refs(self):
+        schema = {
+            "$defs": {
+                "name": {"type": "string"},
+                "person": {"type": "object", "properties": {"name": {"$ref": "#/$defs/name"}}},
+            },
+            "properties": {"owner": {"$ref": "#/$defs/person"}, "tags": [{"$ref": "#/$defs/name"}]},
+        }
+        original = copy.deepcopy(schema)
+        resolved = resolve_refs(schema)
+        assert resolved["properties"]["owner"] == {"type": "object", "properties": {"name": {"type": "string"}}}
+        assert resolved["properties"]["tags"] == [{"type": "string"}]
+        assert resolved["$defs"]["person"] == resolved["properties"]["owner"]
+        assert schema == original
+
+    def test_memoizes_targets(self):
+        schema = {"$defs": {"a": {"type": "string"}}, "properties": {"x": {"$ref": "#/$defs/a"}}}
+        resolver = RefResolver(schema)
+        resolved = resolver.resolve()
+        with unittest.mock.patch.object(resolver, "lookup", side_effect=AssertionError):
+            assert resolver.resolve_ref("#/$defs/a") is resolved["properties"]["x"]
+
+    def test_json_pointer_escapes(self):
+        schema = {"$defs": {"a/b": {"c~d": [1, {"type": "integer"}]}}, "x": {"$ref": "#/$defs/a~1b/c~0d/1"}}
+        assert resolve_refs(schema)["x"] == {"type": "integer"}
+
+    def test_external_refs_become_empty(self):
+        assert resolve_refs({"x": {"$ref": "http://example.com/schema.json"}}) == {"x": {}}
+
+    def test_missing_target(self):
+        with pytest.raises(ValueError, match="見つかりません"):
+            resolve_refs({"x": {"$ref": "#/$defs/missing"}})
+
+    def test_cycle(self):
+        schema = {"$defs": {"a": {"items": {"$ref": "#/$defs/b"}}, "b": {"items": {"$ref": "#/$defs/a"}}}}
+        with pytest.raises(ValueError, match="循環"):
+            resolve_refs(schema)
+
+    def test_merged_schema_is_resolved_in_memory(self):
+        merged = merge_yaml_schemas({"form": {"name": "FormA"}})
+        with unittest.mock.patch.object(tempfile, "NamedTemporaryFile", side_effect=AssertionError):
+            resolved = resolve_merged_json_schema(merged)
+        assert type(resolved) is dict
+        assert resolved["properties"]["form"] == resolved["$defs"]["form"]
+
+
+class TestResolveModes(unittest.TestCase):
+    def test_copy_mode_materializes_independent_copies(self):
+        resolved = resolve_refs(doubling_schema(4), mode="copy")
+        properties = resolved["properties"]["top"]["properties"]
+        assert properties["a"] == properties["b"]
+        assert properties["a"] is not properties["b"]
+
+    def test_shared_mode_shares_targets(self):
+        resolved = resolve_refs(doubling_schema(4), mode="shared")
+        properties = resolved["properties"]["top"]["properties"]
+        assert properties["a"] is properties["b"]
+        assert resolved["properties"]["top"] is resolved["$defs"]["d3"]
+
+    def test_shared_mode_stays_small(self):
+        schema = doubling_schema(30)
+        size = schema_size(resolve_refs(schema, mode="shared"))
+        assert size["unique_nodes"] < 100
+        assert size["expanded_nodes"] > 2**30
+
+    def test_defs_mode_keeps_local_refs(self):
+        schema = doubling_schema(30)
+        resolved = resolve_refs(schema, mode="defs")
+        assert resolved == schema
+        assert resolved is not schema
+        assert schema_size(resolved)["expanded_nodes"] == schema_size(schema)["expanded_nodes"]
+
+    def test_defs_mode_hoists_other_refs(self):
+        schema = {
+            "$defs": {"a": {"type": "string"}},
+            "properties": {"x": {"type": "object"}, "y": {"$ref": "#/properties/x"}, "z": {"$ref": "#/properties/x"}},
+        }
+        resolved = resolve_refs(schema, mode="defs")
+        assert resolved["properties"]["y"] == {"$ref": "#/$defs/properties_x"}
+        assert resolved["properties"]["z"] == {"$ref": "#/$defs/properties_x"}
+        assert resolved["$defs"] == {"a": {"type": "string"}, "properties_x": {"type": "object"}}
+
+    def test_defs_mode_allows_cycles(self):
+        schema = {"$defs": {"a": {"items": {"$ref": "#/$defs/b"}}, "b": {"items": {"$ref": "#/$defs/a"}}}}
+        assert resolve_refs(schema, mode="defs") == schema
+        with pytest.raises(ValueError):
+            resolve_refs({"x": {"$ref": "#/$defs/missing"}}, mode="defs")
+
+    def test_invalid_mode(self):
+        with pytest.raises(ValueError):
+            RefResolver({}, mode="inline")
+
+    def test_size_report(self):
+        merged = doubling_schema(10)
+        report = schema_size_report(merged, resolve_merged_json_schema(merged, "copy"))
+        assert report["before"]["expanded_nodes"] == schema_size(merged)["expanded_nodes"]
+        assert report["after"]["unique_nodes"] == report["after"]["expanded_nodes"]
+        assert report["after"]["expanded_nodes"] > 2**10
+
+
+class TestSerializedSchema(unittest.TestCase):
+    def written_size(self, mode=None) -> int:
+        """参照の多いスキーマを yaml_to_json_schema で書き出したファイルの大きさ"""
+        kwargs = {} if mode is None else {"mode": mode}
+        with (
+            tempfile.TemporaryDirectory() as tmp_dir,
+            unittest.mock.patch.object(yaml_to_json_schema_module, "load_yaml_schemas", return_value={}),
+            unittest.mock.patch.object(
+                yaml_to_json_schema_module, "merge_yaml_schemas", return_value=doubling_schema(14)
+            ),
+            unittest.mock.patch("builtins.print"),
+        ):
+            yaml_to_json_schema_module.yaml_to_json_schema(os.path.join(tmp_dir, "rules"), tmp_dir, **kwargs)
+            return os.path.getsize(os.path.join(tmp_dir, "rules.json"))
+
+    def test_shared_mode_is_not_expanded_in_json(self):
+        defs_size = self.written_size("defs")
+        # 展開すると 2**14 個の葉を書き出す
+        assert self.written_size("copy") > defs_size * 100
+        assert self.written_size("shared") == defs_size
+        assert self.written_size() == defs_size
+        assert defs_size < 10_000
+
+
+if __name__ == "__main__":
+    unittest.main()
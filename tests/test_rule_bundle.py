@@ -0,0 +1,142 @@
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+import pytest
+
+from yamlguardian import rule_bundle
+from yamlguardian.cli import main
+from yamlguardian.core import YamlGuardian
+from yamlguardian.directory_analyzer import DirectoryAnalyzer
+from yamlguardian.rule_bundle import BUNDLE_HEADER, BUNDLE_MAGIC, compile_bundle, load_bundle
+from yamlguardian.rule_watcher import relative_schema_dict
+
+SCHEMA = """
+root_element:
+  - name: age
+    type: integer
+    description: Age
+    required: true
+"""
+
+
+class TestRuleBundle(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.rule_dir = os.path.join(self.tmp_dir.name, "sample_html")
+        shutil.copytree("rule_config/sample_html", self.rule_dir)
+        # CLI が保存する DirectoryAnalyzer のキャッシュをユーザーのキャッシュディレクトリに書かない
+        patcher = unittest.mock.patch.object(
+            DirectoryAnalyzer, "cache_file", os.path.join(self.tmp_dir.name, "cache.bin")
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.schema_file = os.path.join(self.tmp_dir.name, "schema.yaml")
+        with open(self.schema_file, "w", encoding="utf-8") as f:
+            f.write(SCHEMA)
+        self.bundle_path = os.path.join(self.tmp_dir.name, "rules.ygb")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def compile(self):
+        compile_bundle(self.rule_dir, self.schema_file).save(self.bundle_path)
+        return load_bundle(self.bundle_path)
+
+    def test_round_trip(self):
+        bundle = self.compile()
+        assert bundle.rule_dir == os.path.abspath(self.rule_dir)
+        assert set(bundle.schema_dict) == {
+            "common_definitions/common_definitions",
+            "page_definitions/page1/form1",
+            "page_definitions/page1/root_element_relations",
+            "page_definitions/page2/form1",
+            "page_definitions/page2/root_element_relations",
+        }
+        assert bundle.json_schema["title"] == "test"
+        assert "$defs" in bundle.resolved_schema
+        assert "commonLabel" in bundle.common_index
+        assert os.path.abspath(self.schema_file) in bundle.sources
+        assert not bundle.is_stale()
+
+    def test_guardian_from_bundle_matches_sources(self):
+        self.compile()
+        guardian = YamlGuardian.from_bundle(self.bundle_path)
+        expected = YamlGuardian(self.schema_file)
+        assert guardian.schema == expected.schema
+        for data in ({"age": 1}, {"age": "x"}, {}):
+            assert guardian.rule_manager.validate(data) == expected.rule_manager.validate(data)
+
+    def test_stale_sources(self):
+        bundle = self.compile()
+        form = os.path.abspath(os.path.join(self.rule_dir, "page_definitions/page1/form1.yaml"))
+        with open(form, "a", encoding="utf-8") as f:
+            f.write("\n# changed\n")
+        added = os.path.abspath(os.path.join(self.rule_dir, "page_definitions/page3/form1.yaml"))
+        os.makedirs(os.path.dirname(added))
+        shutil.copy(form, added)
+        os.remove(self.schema_file)
+        assert bundle.stale_sources() == sorted([form, added, os.path.abspath(self.schema_file)])
+
+    def test_bundle_from_other_compiler_is_stale(self):
+        compile_bundle(self.rule_dir, self.schema_file).save(self.bundle_path)
+        with unittest.mock.patch.object(rule_bundle, "_compiler_fingerprint", b"\1" * 16):
+            bundle = load_bundle(self.bundle_path)
+            assert bundle.stale_sources() == []
+            assert bundle.compiler_changed()
+            assert bundle.is_stale()
+            with unittest.mock.patch("builtins.print") as mock_print:
+                main(["-b", self.bundle_path])
+        printed = "\n".join(str(call.args[0]) for call in mock_print.call_args_list if call.args)
+        assert "compiled by a different version" in printed
+
+    def test_invalid_bundle(self):
+        with open(self.bundle_path, "wb") as f:
+            f.write(b"not a bundle")
+        with pytest.raises(ValueError):
+            load_bundle(self.bundle_path)
+        with open(self.bundle_path, "wb") as f:
+            f.write(BUNDLE_HEADER.pack(BUNDLE_MAGIC, 0, b""))
+        with pytest.raises(ValueError):
+            load_bundle(self.bundle_path)
+
+    def test_bundle_without_schema(self):
+        compile_bundle(self.rule_dir).save(self.bundle_path)
+        with pytest.raises(ValueError):
+            YamlGuardian.from_bundle(self.bundle_path)
+
+    def test_cli_compile_and_validate(self):
+        main(["compile", "-i", self.rule_dir, "-s", self.schema_file, "-o", self.bundle_path])
+        assert load_bundle(self.bundle_path).schema_file == os.path.abspath(self.schema_file)
+        with unittest.mock.patch("builtins.print") as mock_print:
+            main(["-b", self.bundle_path])
+        printed = "\n".join(str(call.args[0]) for call in mock_print.call_args_list if call.args)
+        assert "Validation failed for page_definitions/page1/form1" in printed
+        assert "is stale" not in printed
+
+    def test_bundled_schema_dict_matches_sources(self):
+        # page1 と page2 に同じ名前のファイルがあるので、ファイル名だけのキーでは上書きし合う
+        main(["compile", "-i", self.rule_dir, "-s", self.schema_file, "-o", self.bundle_path])
+        bundle = load_bundle(self.bundle_path)
+        analyzer = DirectoryAnalyzer()
+        analyzer.analyze_directory_structure(self.rule_dir)
+        assert bundle.schema_dict == relative_schema_dict(analyzer.validation_rules, self.rule_dir)
+        assert len(bundle.schema_dict) == 5
+        assert set(bundle.resolved_schema["properties"]) == set(bundle.schema_dict)
+
+        def printed_lines(argv):
+            with unittest.mock.patch("builtins.print") as mock_print:
+                main(argv)
+            return [str(call.args[0]) for call in mock_print.call_args_list if call.args]
+
+        # バンドルは -i を省略できるので、入力のパスを含む openapi_schema の行だけが違う
+        bundled = [line for line in printed_lines(["-b", self.bundle_path]) if "openapi_schema" not in line]
+        unbundled = printed_lines(["-i", self.rule_dir, "-s", self.schema_file])
+        assert bundled == [line for line in unbundled if "openapi_schema" not in line]
+        assert "Validation failed for page_definitions/page2/form1 with the following errors:" in bundled
+
+
+if __name__ == "__main__":
+    unittest.main()
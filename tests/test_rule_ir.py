@@ -0,0 +1,234 @@
+import random
+import unittest
+import unittest.mock
+
+import pytest
+
+from yamlguardian import core as core_module
+from yamlguardian import validate as validate_module
+from yamlguardian.cerberus_adapter import CompiledCerberusSchema
+from yamlguardian.core import YamlGuardian
+from yamlguardian.rule_ir import (
+    RuleOutcome,
+    RuleProgram,
+    UnsupportedRuleError,
+    compile_cerberus_schema,
+    compile_json_schema,
+    compile_plan,
+    rule_programs,
+)
+from yamlguardian.validate import compile_json_schema_validator, validate_context
+from yamlguardian.validation_context import ValidationContext
+from yamlguardian.validator import Validator
+
+JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string", "minLength": 1, "pattern": "^[a-z]"},
+        "age": {"type": "integer", "minimum": 0, "maximum": 150},
+        "tags": {"type": "array", "items": {"enum": ["a", "b"]}, "maxItems": 2},
+    },
+    "required": ["name"],
+    "additionalProperties": False,
+}
+
+CERBERUS_SCHEMA = {
+    "name": {"type": "string", "required": True, "regex": "[a-z]+"},
+    "age": {"type": "integer", "min": 0, "nullable": True},
+    "address": {"type": "dict", "schema": {"city": {"type": "string", "allowed": ["tokyo", "osaka"]}}},
+    "tags": {"type": "list", "schema": {"type": "string", "maxlength": 3}},
+}
+
+ROOT_ELEMENT_SCHEMA = {
+    "type": "object",
+    "root_element": [
+        {"name": "name", "description": "名前", "type": "string", "required": True},
+        {"name": "age", "description": "年齢", "type": "integer"},
+        {"name": "tags", "description": "タグ", "type": "list"},
+        {"name": "secret", "description": "秘密", "prohibited": True},
+        {"name": "label", "description": "ラベル", "uses_common": True},
+    ],
+}
+
+VALUES = [None, True, 0, 1, -1, 200, 1.5, "", "a", "abc", "Abc", "tokyo", "abcd", [], ["a"], ["a", "b", "c"], {}]
+
+
+def random_document(rng, depth=0):
+    document = {}
+    for key in ("name", "age", "tags", "address", "secret", "label", "extra"):
+        if rng.random() < 0.6:
+            if key == "address" and depth < 1 and rng.random() < 0.7:
+                document[key] = {"city": rng.choice(VALUES)} if rng.random() < 0.8 else random_document(rng, depth + 1)
+            elif key == "tags" and rng.random() < 0.5:
+                document[key] = [rng.choice(VALUES) for _ in range(rng.randint(0, 3))]
+            else:
+                document[key] = rng.choice(VALUES)
+    return document
+
+
+def evaluate(trees, document):
+    return RuleProgram(trees).evaluate(document)
+
+
+class TestCompile(unittest.TestCase):
+    def test_json_schema(self):
+        tree = compile_json_schema(JSON_SCHEMA, "json")
+        assert evaluate({"json": tree}, {"name": "a", "age": 3, "tags": ["a"]}).passed == {"json"}
+        for document in (
+            {"age": 3},
+            {"name": ""},
+            {"name": "A"},
+            {"name": "a", "age": True},
+            {"name": "a", "age": 151},
+            {"name": "a", "tags": ["c"]},
+            {"name": "a", "tags": ["a", "a", "a"]},
+            {"name": "a", "other": 1},
+            ["name"],
+        ):
+            assert evaluate({"json": tree}, document).failed == {"json"}, document
+
+    def test_json_schema_unsupported(self):
+        for schema in (
+            {"$ref": "#/definitions/x"},
+            {"properties": {"a": {"anyOf": [{"type": "string"}]}}},
+            {"items": [{"type": "string"}]},
+            {"additionalProperties": {"type": "string"}},
+            {"$schema": "http://json-schema.org/draft-04/schema#", "type": "object"},
+        ):
+            with pytest.raises(UnsupportedRuleError):
+                compile_json_schema(schema, "json")
+        # 検証に使わないキーワードは無視する
+        assert evaluate({"json": compile_json_schema({"description": "x", "title": "y"}, "json")}, 1).passed
+
+    def test_cerberus_schema(self):
+        tree = compile_cerberus_schema(CERBERUS_SCHEMA, "cerberus")
+        assert evaluate({"cerberus": tree}, {"name": "a", "age": None, "address": {"city": "tokyo"}}).passed
+        for document in (
+            {},
+            {"name": "a", "age": -1},
+            {"name": "a1"},
+            {"name": "a", "address": {"city": "kyoto"}},
+            {"name": "a", "address": {"town": "tokyo"}},
+            {"name": "a", "tags": ["abcd"]},
+            {"name": "a", "other": 1},
+            "name",
+        ):
+            assert evaluate({"cerberus": tree}, document).failed == {"cerberus"}, document
+
+    def test_cerberus_schema_unsupported(self):
+        for schema in (
+            {"a": {"coerce": int}},
+            {"a": {"type": "datetime"}},
+            {"a": {"anyof": [{"type": "string"}]}},
+            {"a": {"schema": {"b": {"type": "string"}}}},
+            [],
+        ):
+            with pytest.raises(UnsupportedRuleError):
+                compile_cerberus_schema(schema, "cerberus")
+
+    def test_plan_errors_match_validator(self):
+        validator = Validator(ROOT_ELEMENT_SCHEMA)
+        program = RuleProgram({"rules": compile_plan(validator.plan, "rules")})
+        rng = random.Random(0)
+        for _ in range(200):
+            document = random_document(rng)
+            assert program.evaluate(document).errors == validator.validate(document)
+
+    def test_plan_with_custom_rules_is_unsupported(self):
+        schema = {"root_element": [{"name": "a", "description": "A", "custom_rules": [bool]}]}
+        with pytest.raises(UnsupportedRuleError):
+            compile_plan(Validator(schema).plan, "rules")
+
+    def test_opaque_family_fails(self):
+        outcome = evaluate({"json": compile_json_schema({}, "json"), "cerberus": None}, {})
+        assert outcome.passed == {"json"}
+        assert outcome.failed == {"cerberus"}
+
+    def test_program_cache(self):
+        trees = {"json": compile_json_schema(JSON_SCHEMA, "json")}
+        assert rule_programs.get(dict(trees)) is rule_programs.get(dict(trees))
+
+
+class TestEquivalence(unittest.TestCase):
+    """IR で合格したドキュメントはエンジンでも合格する"""
+
+    def test_random_documents(self):
+        json_validator = compile_json_schema_validator(JSON_SCHEMA)
+        cerberus_schema = CompiledCerberusSchema(CERBERUS_SCHEMA)
+        program = RuleProgram(
+            {
+                "json": compile_json_schema(JSON_SCHEMA, "json"),
+                "cerberus": compile_cerberus_schema(cerberus_schema.schema, "cerberus"),
+            }
+        )
+        rng = random.Random(1)
+        passed = set()
+        for _ in range(1000):
+            document = random_document(rng)
+            outcome = program.evaluate(document)
+            if "json" in outcome.passed:
+                assert json_validator.is_valid(document), document
+                passed.add("json")
+            if "cerberus" in outcome.passed:
+                assert cerberus_schema.validate(document) is None, document
+                passed.add("cerberus")
+        assert passed == {"json", "cerberus"}
+
+    def test_guardian_results_unchanged(self):
+        guardian = YamlGuardian.from_definitions(ROOT_ELEMENT_SCHEMA)
+        rng = random.Random(2)
+        documents = [random_document(rng) for _ in range(200)] + [[1], "text", None]
+
+        def results(mode, max_errors):
+            outcomes = []
+            for document in documents:
+                try:
+                    outcomes.append(guardian.validate(document, mode, max_errors))
+                except Exception as e:
+                    # dict 以外のドキュメントでは root_element のチェッカーが例外になる
+                    outcomes.append(type(e))
+            return outcomes
+
+        for mode, max_errors in (("fail_fast", None), ("max_errors", 2), ("exhaustive", None)):
+            with_ir = results(mode, max_errors)
+            # IR ではすべて不合格として、エンジンだけで検証した結果と比べる
+
+            def all_failed(program, document):
+                return RuleOutcome(set(program.families), frozenset(), [])
+
+            with unittest.mock.patch.object(RuleProgram, "evaluate", autospec=True, side_effect=all_failed):
+                without_ir = results(mode, max_errors)
+            assert with_ir == without_ir
+
+
+class TestStages(unittest.TestCase):
+    def test_passed_stage_skips_engine(self):
+        schema = {"name": {"type": "string"}}
+        trees = {stage: compile_cerberus_schema(schema, stage) for stage in validate_module.STAGE_SCHEMAS}
+        with (
+            unittest.mock.patch.object(validate_module, "stage_rule_trees", return_value=trees),
+            unittest.mock.patch.object(
+                validate_module.schema_registry, "get_cerberus_schema", side_effect=AssertionError
+            ) as engine,
+        ):
+            context = ValidationContext({"name": "a"})
+            assert validate_context(context) == {"message": "Validation successful"}
+            assert context.results["openapi"] == {"message": "Validation successful"}
+            engine.assert_not_called()
+
+            # IR で不合格のステージはエンジンで検証する
+            context = ValidationContext({"name": 1})
+            validate_context(context)
+            assert context.results["openapi"]["message"] == "Validation error"
+            assert engine.called
+
+    def test_guardian_skips_json_schema_engine(self):
+        guardian = YamlGuardian.from_definitions({"type": "object", "required": ["name"]})
+        with unittest.mock.patch.object(core_module, "data_errors", side_effect=AssertionError):
+            result = guardian.validate({"name": "a"})
+        assert result == guardian.validate({"name": "a"})
+        assert guardian.validate({})["errors"].startswith("'name' is a required property")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+import os
+import tempfile
+import threading
+import unittest
+
+import pytest
+
+from yamlguardian.directory_analyzer import DirectoryAnalyzer
+from yamlguardian.rule_watcher import (
+    InotifyWatch,
+    PollingWatch,
+    RuleSetWatcher,
+    _load_libc,
+    active_watcher,
+    stop_watching,
+    watch_rules,
+)
+from yamlguardian.validate import load_validation_rules
+
+COMMON = """
+common_elements:
+  - name: commonLabel
+    description: 共通ラベル
+"""
+
+FORM = """
+root_element:
+  name: FormA
+  elements:
+    - name: commonLabel
+      description: 共通ラベル
+      uses_common: true
+"""
+
+PLAIN = """
+root_element:
+  - name: age
+    type: integer
+    description: Age
+"""
+
+
+class TestRuleSetWatcher(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp_dir.name, "rule_config")
+        self.write("common_definitions/common.yaml", COMMON)
+        self.write("page_definitions/page1/form.yaml", FORM)
+        self.write("page_definitions/page1/plain.yaml", PLAIN)
+
+    def tearDown(self):
+        stop_watching()
+        self.tmp_dir.cleanup()
+
+    def path(self, relative_path):
+        return os.path.abspath(os.path.join(self.root, relative_path))
+
+    def write(self, relative_path, content):
+        path = self.path(relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+
+    def watcher(self, **kwargs):
+        analyzer = DirectoryAnalyzer(os.path.join(self.tmp_dir.name, "cache.bin"))
+        return RuleSetWatcher(self.root, analyzer=analyzer, **kwargs)
+
+    def test_initial_build(self):
+        rule_set = self.watcher().rule_set
+        assert set(rule_set.rules) == {
+            self.path("common_definitions/common.yaml"),
+            self.path("page_definitions/page1/form.yaml"),
+            self.path("page_definitions/page1/plain.yaml"),
+        }
+        assert set(rule_set.validators) == {
+            self.path("page_definitions/page1/form.yaml"),
+            self.path("page_definitions/page1/plain.yaml"),
+        }
+        # 共通定義が解決されているので form のプランは空
+        assert rule_set.validators[self.path("page_definitions/page1/form.yaml")].validate({}) == []
+        assert "page_definitions/page1/plain" in rule_set.schema_dict
+
+    def test_refresh_recompiles_only_changed_files(self):
+        watcher = self.watcher()
+        before = watcher.rule_set
+        assert not watcher.refresh()
+        assert watcher.rule_set is before
+
+        self.write("page_definitions/page1/plain.yaml", PLAIN.replace("integer", "string"))
+        change_set = watcher.refresh()
+        assert change_set.changed == {self.path("page_definitions/page1/plain.yaml")}
+        after = watcher.rule_set
+        assert after.version == before.version + 1
+        form = self.path("page_definitions/page1/form.yaml")
+        assert after.validators[form] is before.validators[form]
+        assert after.validators[self.path("page_definitions/page1/plain.yaml")].validate({"age": 1})
+
+    def test_common_definitions_change_recompiles_dependents(self):
+        watcher = self.watcher()
+        before = watcher.rule_set
+        self.write("common_definitions/common.yaml", "common_elements: []\n")
+        watcher.refresh()
+        after = watcher.rule_set
+        form = self.path("page_definitions/page1/form.yaml")
+        plain = self.path("page_definitions/page1/plain.yaml")
+        assert after.validators[form] is not before.validators[form]
+        assert after.validators[form].validate({}) == ["共通ラベル は共通要素として定義されていません。"]
+        assert after.validators[plain] is before.validators[plain]
+
+    def test_deleted_files_are_dropped(self):
+        watcher = self.watcher()
+        os.remove(self.path("page_definitions/page1/plain.yaml"))
+        change_set = watcher.refresh()
+        assert change_set.deleted == {self.path("page_definitions/page1/plain.yaml")}
+        assert self.path("page_definitions/page1/plain.yaml") not in watcher.rule_set.rules
+        assert self.path("page_definitions/page1/plain.yaml") not in watcher.rule_set.validators
+
+    def check_background_refresh(self, **kwargs):
+        watcher = self.watcher(poll_interval=0.05, **kwargs)
+        changed = threading.Event()
+        watcher.add_listener(lambda change_set: changed.set())
+        watcher.start()
+        try:
+            self.write("page_definitions/page2/new.yaml", PLAIN)
+            assert changed.wait(5)
+            assert self.path("page_definitions/page2/new.yaml") in watcher.rule_set.validators
+        finally:
+            watcher.stop()
+        assert not watcher.running
+        return watcher
+
+    def test_polling_watch(self):
+        watcher = self.check_background_refresh(use_inotify=False)
+        assert watcher._watch is None
+
+    @pytest.mark.skipif(_load_libc() is None, reason="inotify is not available")
+    def test_inotify_watch(self):
+        watch = InotifyWatch(self.root)
+        try:
+            assert not watch.wait(0.01)
+            self.write("page_definitions/page1/plain.yaml", PLAIN)
+            assert watch.wait(1)
+        finally:
+            watch.close()
+        self.check_background_refresh(use_inotify=True)
+
+    def test_polling_watch_close_wakes_waiter(self):
+        watch = PollingWatch()
+        watch.close()
+        assert not watch.wait(10)
+
+    def test_load_validation_rules_uses_active_watcher(self):
+        watcher = watch_rules(self.root, use_inotify=False, poll_interval=10)
+        assert active_watcher(self.path("page_definitions")) is watcher
+        rules = load_validation_rules(self.path("page_definitions"))
+        assert set(rules) == {
+            self.path("page_definitions/page1/form.yaml"),
+            self.path("page_definitions/page1/plain.yaml"),
+        }
+        stop_watching(self.root)
+        assert active_watcher(self.root) is None
+
+
+if __name__ == "__main__":
+    unittest.main()
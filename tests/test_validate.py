@@ -1,15 +1,28 @@
+import os
+import tempfile
 import unittest
+import unittest.mock
+
+import pytest
 
 from yamlguardian.core import YamlGuardian
 from yamlguardian.rules import RuleManager
+from yamlguardian.save_load_yaml import format_errors
+from yamlguardian.schema_registry import SchemaRegistry
 from yamlguardian.validate import (
-    format_errors,
+    JsonSchemaValidatorCache,
+    count_errors,
+    json_schema_stage,
+    json_schema_validators,
+    limit_errors,
     load_validation_rules,
     validate_data,
     validate_openapi_schema,
     validate_user_defined_yaml,
     validate_user_provided_yaml,
+    validate_yaml_data,
 )
+from yamlguardian.validation_context import ValidationContext, error_limit
 from yamlguardian.validator import Validator
 
 
@@ -30,6 +43,169 @@ class TestValidate(unittest.TestCase):
         errors = validate_data(data, schema)
         assert errors is not None
 
+    def test_validate_data_reuses_compiled_validator(self):
+        schema = {"type": "object", "properties": {"age": {"type": "integer"}}, "required": ["age"]}
+        json_schema_validators.clear()
+        assert validate_data({"age": 1}, dict(schema)) == []
+        errors = validate_data({}, dict(schema))
+        assert len(errors) == 1
+        assert errors[0].startswith("'age' is a required property")
+        info = json_schema_validators.info()
+        assert info["misses"] == 1
+        assert info["hits"] == 1
+
+    def test_json_schema_validator_cache_register_and_evict(self):
+        cache = JsonSchemaValidatorCache(maxsize=1)
+        registered = {"type": "string"}
+        validator = cache.register(registered)
+        assert cache.get(registered) is validator
+        cache.get({"type": "integer"})
+        cache.get({"type": "number"})
+        info = cache.info()
+        assert info["size"] == 1
+        assert info["registered"] == 1
+        assert cache.get(registered) is validator
+
+    def test_schema_registry_reloads_only_on_change(self):
+        loads = []
+
+        def loader(path):
+            loads.append(path)
+            return load_validation_rules(path)
+
+        registry = SchemaRegistry(loader, JsonSchemaValidatorCache())
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "schema.yaml")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("name:\n  type: string\n")
+            schema = registry.get_schema(path)
+            assert registry.get_schema(path) is schema
+            assert registry.get_cerberus_validator(path).validate({"name": "John"})
+            compiled = registry.get_cerberus_schema(path)
+            assert registry.get_cerberus_schema(path) is compiled
+            assert len(loads) == 1
+
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("name:\n  type: integer\n")
+            os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1_000_000_000))
+            assert not registry.get_cerberus_validator(path).validate({"name": "John"})
+            assert registry.get_cerberus_schema(path) is not compiled
+            assert len(loads) == 2
+
+    def test_validation_context_parses_once(self):
+        context = ValidationContext.from_input("name: John\nage: 30\n")
+        assert context.document == {"name": "John", "age": 30}
+        assert ValidationContext.from_input(context) is context
+        assert ValidationContext.from_input({"name": "John"}).document == {"name": "John"}
+
+        result = json_schema_stage(context)
+        assert context.results["json_schema"] is result
+
+    def test_validate_data_modes(self):
+        schema = {"type": "object", "required": ["name", "age", "city"]}
+        assert len(validate_data({}, schema)) == 1
+        assert len(validate_data({}, schema, mode="fail_fast")) == 1
+        assert len(validate_data({}, schema, max_errors=2)) == 2
+        assert len(validate_data({}, schema, mode="exhaustive")) == 3
+
+    def test_max_errors_caps_stage_errors(self):
+        document = "a: s\nb: s\nc: s\nd: s\n"
+        for max_errors in (1, 2, 5):
+            result = validate_yaml_data(document, max_errors=max_errors)
+            assert count_errors(result["errors"]) == max_errors
+        # max_errors=1 は fail_fast と違い、ステージ名ごとにまとめて上限まで切り詰める
+        assert validate_yaml_data(document, max_errors=1)["errors"] == {"openapi": {"a": ["unknown field"]}}
+        assert count_errors(validate_yaml_data(document)["errors"]) == 4
+        assert count_errors(validate_yaml_data(document, mode="exhaustive")["errors"]) == 12
+
+    def test_limit_errors(self):
+        errors = {"a": ["x", {"b": ["y", "z"]}], "c": ["w"]}
+        assert count_errors(errors) == 4
+        assert limit_errors(errors, 2) == ({"a": ["x", {"b": ["y"]}]}, 2)
+        assert limit_errors(errors, None) == (errors, 4)
+        assert limit_errors(["m1", "m2"], 1) == (["m1"], 1)
+
+    def test_fail_fast_reports_best_match(self):
+        # 最初に見つかるのは a の型のエラーだが、best_match は浅い位置の required のエラーを選ぶ
+        schema = {"properties": {"a": {"type": "integer"}}, "required": ["b"]}
+        errors = validate_data({"a": "x"}, schema, mode="exhaustive")
+        assert errors[0].startswith("'x' is not of type 'integer'")
+        assert validate_data({"a": "x"}, schema) == [errors[1]]
+        assert validate_data({"a": 1, "b": 2}, schema) == []
+
+    def test_validate_data_does_not_print(self):
+        with unittest.mock.patch("builtins.print") as mock_print:
+            validate_data({}, {"required": ["a"]})
+        mock_print.assert_not_called()
+
+    def test_error_limit_rejects_unknown_mode(self):
+        assert error_limit() == 1
+        assert error_limit("exhaustive") is None
+        assert error_limit(max_errors=5) == 5
+        with pytest.raises(ValueError):
+            error_limit("sometimes")
+        with pytest.raises(ValueError):
+            error_limit("max_errors")
+
+    def test_validator_stops_after_max_errors(self):
+        schema = {
+            "root_element": [
+                {"name": "name", "type": "string", "required": True, "description": "Name"},
+                {"name": "age", "type": "integer", "required": True, "description": "Age"},
+            ]
+        }
+        validator = Validator(schema)
+        assert len(validator.validate({})) == 4
+        assert validator.validate({}, max_errors=1) == ["Name が存在しません。"]
+
+    def test_validate_many_matches_sequential_validation(self):
+        schema = {
+            "type": "object",
+            "required": ["name"],
+            "root_element": [{"name": "age", "type": "integer", "description": "Age"}],
+        }
+        guardian = YamlGuardian.from_definitions(schema)
+        documents = [{"name": "John", "age": i} if i % 3 else {"age": str(i)} for i in range(20)]
+        expected = [guardian.validate(data) for data in documents]
+
+        assert list(guardian.validate_many(documents, workers=2, chunksize=3)) == expected
+        unordered = dict(guardian.validate_many(documents, workers=2, chunksize=3, ordered=False))
+        assert [unordered[i] for i in range(len(documents))] == expected
+
+    def test_validate_many_reuses_pool(self):
+        schema = {"type": "object", "required": ["name"]}
+        documents = [{"name": "John"}, {}] * 5
+        with YamlGuardian.from_definitions(schema) as guardian:
+            expected = [guardian.validate(data) for data in documents]
+            assert list(guardian.validate_many(documents, workers=2, chunksize=2)) == expected
+            pool = guardian._pool
+            # モードはタスクごとに渡すので、同じプールで別のモードも検証できる
+            exhaustive = [guardian.validate(data, "exhaustive") for data in documents]
+            assert list(guardian.validate_many(documents, workers=2, chunksize=2, mode="exhaustive")) == exhaustive
+            assert guardian._pool is pool
+        assert guardian._pool is None
+
+    def test_validate_many_checks_arguments_eagerly(self):
+        guardian = YamlGuardian.from_definitions({"type": "object"})
+        with pytest.raises(ValueError):
+            guardian.validate_many([{}], workers=2, mode="sometimes")
+        with pytest.raises(ValueError):
+            guardian.validate_many([{}], workers=1, max_errors=0)
+        assert guardian._pool is None
+
+    def test_uses_common_resolved_against_index(self):
+        schema = {
+            "root_element": [
+                {"name": "commonLabel", "uses_common": True, "description": "Common Label"},
+                {"name": "missingLabel", "uses_common": True, "description": "Missing Label"},
+            ]
+        }
+        common_definitions = {"common_elements": [{"name": "commonLabel", "type": "label"}]}
+        rule_manager = RuleManager(schema, common_definitions=common_definitions)
+        assert set(rule_manager.common_index) == {"commonLabel"}
+        assert rule_manager.validator.common_index is rule_manager.common_index
+        assert rule_manager.validate({}) == ["Missing Label は共通要素として定義されていません。"]
+
     def test_format_errors(self):
         errors = {"name": ["required field"], "age": ["min value is 18"]}
         formatted_errors = format_errors(errors)
@@ -50,6 +226,29 @@ class TestValidate(unittest.TestCase):
         errors = validator.validate(data)
         assert errors == []
 
+    def test_validator_bound_rules(self):
+        schema = {
+            "root_element": [
+                {"name": "age", "type": "integer", "min": 0, "max": 150, "description": "Age"},
+                {"name": "name", "type": "string", "minlength": 1, "maxlength": 3, "description": "Name"},
+            ]
+        }
+        validator = Validator(schema)
+        assert validator.validate({"age": 0, "name": "abc"}) == []
+        assert validator.validate({"age": -1, "name": ""}) == [
+            "Age は 0 以上である必要があります。",
+            "Name の長さは 1 以上である必要があります。",
+        ]
+        assert validator.validate({"age": 151, "name": "abcd"}) == [
+            "Age は 150 以下である必要があります。",
+            "Name の長さは 3 以下である必要があります。",
+        ]
+        # 対象の型でない値は type のチェックだけが報告する
+        assert validator.validate({"age": "x", "name": 1}) == [
+            "Age は整数である必要があります。",
+            "Name は文字列である必要があります。",
+        ]
+
     def test_rule_manager_custom_rules(self):
         def custom_rule(value):
             return value == "custom_value"
@@ -74,6 +273,24 @@ class TestValidate(unittest.TestCase):
         errors_invalid = rule_manager.validate(data_invalid)
         assert errors_invalid != []
 
+    def test_validator_compiles_plan_once(self):
+        schema = {
+            "root_element": [
+                {"name": "name", "type": "string", "required": True, "description": "Name"},
+                {"name": "secret", "prohibited": True, "description": "Secret"},
+            ]
+        }
+        validator = Validator(schema)
+        assert len(validator.plan) == 3
+        errors = validator.validate({"secret": "x"})
+        assert errors == ["Name が存在しません。", "Name は文字列である必要があります。", "Secret は選択できません。"]
+
+    def test_rule_manager_reports_type_error_once(self):
+        schema = {"root_element": [{"name": "age", "type": "integer", "description": "Age"}]}
+        rule_manager = RuleManager(schema)
+        errors = rule_manager.validate({"age": "thirty"})
+        assert errors == ["Age は整数である必要があります。"]
+
     def test_yaml_guardian_page_definitions(self):
         yaml_guardian = YamlGuardian(
             schema_file="rule_config/common_definitions/common_definitions.yaml",
@@ -0,0 +1,71 @@
+import os
+import unittest
+import unittest.mock
+
+import pytest
+
+from yamlguardian import yaml_loader
+
+DOCUMENT = """
+# comment
+name: form1
+items:
+  - 1
+  - two
+nested: {enabled: true}
+"""
+
+
+class TestYamlLoader(unittest.TestCase):
+    def setUp(self):
+        self.backend = yaml_loader._backend
+        self.env = os.environ.get(yaml_loader.BACKEND_ENV)
+
+    def tearDown(self):
+        yaml_loader._backend = self.backend
+        if self.env is None:
+            os.environ.pop(yaml_loader.BACKEND_ENV, None)
+        else:
+            os.environ[yaml_loader.BACKEND_ENV] = self.env
+
+    def test_resolve_backend(self):
+        fast = yaml_loader.C if yaml_loader.HAS_LIBYAML else yaml_loader.SAFE
+        assert yaml_loader.resolve_backend("auto") == fast
+        assert yaml_loader.resolve_backend("c") == fast
+        assert yaml_loader.resolve_backend("safe") == "safe"
+        assert yaml_loader.resolve_backend("roundtrip") == "roundtrip"
+        with pytest.raises(ValueError):
+            yaml_loader.resolve_backend("fast")
+
+    def test_resolve_backend_without_libyaml(self):
+        with unittest.mock.patch.object(yaml_loader, "HAS_LIBYAML", False):
+            assert yaml_loader.resolve_backend("c") == "safe"
+            assert "c" not in yaml_loader.available_backends()
+
+    def test_backends_load_the_same_data(self):
+        expected = {"name": "form1", "items": [1, "two"], "nested": {"enabled": True}}
+        for backend in yaml_loader.available_backends():
+            assert yaml_loader.load(DOCUMENT, backend) == expected
+            assert yaml_loader.load(DOCUMENT.encode(), backend) == expected
+
+    def test_errors_are_yaml_errors(self):
+        for backend in yaml_loader.available_backends():
+            with pytest.raises(yaml_loader.YAMLError):
+                yaml_loader.load("key: [unclosed", backend)
+
+    def test_set_backend(self):
+        assert yaml_loader.set_backend("safe") == "safe"
+        assert yaml_loader.get_backend() == "safe"
+        assert os.environ[yaml_loader.BACKEND_ENV] == "safe"
+        with unittest.mock.patch.object(yaml_loader.yaml, "load", side_effect=AssertionError):
+            assert yaml_loader.load(DOCUMENT, "roundtrip")["name"] == "form1"
+
+    def test_benchmark(self):
+        path = os.path.join("rule_config", "sample_html", "page_definitions", "page1", "form1.yaml")
+        results = yaml_loader.benchmark([path], repeat=1)
+        assert set(results) == set(yaml_loader.available_backends())
+        assert all(seconds >= 0 for seconds in results.values())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import io
+import unittest
+
+import yaml
+
+from yamlguardian.core import NOT_MAPPING_MESSAGE, YamlGuardian
+from yamlguardian.yaml_stream import iter_yaml_documents
+
+
+class TestIterYamlDocuments(unittest.TestCase):
+    def test_matches_safe_load_all(self):
+        contents = [
+            "name: John\n",
+            "# comment\n%YAML 1.1\n---\nname: John\n---\nname: Jane\n...\n---\n- item\n",
+            "---\n---\n",
+            "text: |\n  ---\n  block\n--- plain\n",
+        ]
+        for content in contents:
+            documents = [document for _, _, document in iter_yaml_documents(io.BytesIO(content.encode("utf-8")))]
+            assert documents == list(yaml.safe_load_all(content))
+
+    def test_reports_index_and_byte_offset(self):
+        content = "name: ジョン\n---\nname: Jane\n"
+        documents = list(iter_yaml_documents(io.BytesIO(content.encode("utf-8"))))
+        assert documents == [(0, 0, {"name": "ジョン"}), (1, len("name: ジョン\n".encode()), {"name": "Jane"})]
+
+
+class TestValidateStream(unittest.TestCase):
+    def test_validate_stream(self):
+        guardian = YamlGuardian.from_definitions({"type": "object", "required": ["name"]})
+        stream = io.StringIO("name: John\n---\nage: 30\n")
+        results = list(guardian.validate_stream(stream))
+        assert [(index, offset) for index, offset, _ in results] == [(0, 0), (1, 11)]
+        assert "'name' is a required property" in results[1][2]["errors"]
+
+    def test_non_mapping_document_fails(self):
+        schema = {"root_element": [{"name": "age", "type": "integer", "description": "Age"}]}
+        guardian = YamlGuardian.from_definitions(schema)
+        results = [result for _, _, result in guardian.validate_stream(io.StringIO("age: 1\n---\n- a\n"), "exhaustive")]
+        assert results[1] == {"message": "Validation failed", "errors": NOT_MAPPING_MESSAGE}
+        assert list(guardian.validate_many([{"age": 1}, ["a"]], workers=1, mode="exhaustive")) == results
+        assert guardian.validate("text")["errors"] == NOT_MAPPING_MESSAGE
+
+    def test_malformed_document_does_not_stop_the_stream(self):
+        guardian = YamlGuardian.from_definitions({"type": "object", "required": ["name"]})
+        stream = io.StringIO("name: John\n---\nage: [\n---\nage: 30\n")
+        results = list(guardian.validate_stream(stream))
+        assert [index for index, _, _ in results] == [0, 1, 2]
+        assert results[1][2]["message"] == "Validation error"
+        assert results[1][2]["detail"].startswith("YAML読み込みエラー")
+        assert "'name' is a required property" in results[2][2]["errors"]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+EXECUTOR_CLASSES = {"thread": ThreadPoolExecutor, "process": ProcessPoolExecutor}
+
+
+class ExecutorSaturatedError(RuntimeError):
+    """同時実行数の上限に達しているためタスクを受け付けられない"""
+
+
+class BoundedExecutor:
+    """実行中 + 待機中のタスク数に上限を持つ Executor
+
+    上限に達している場合、submit は待たずに ExecutorSaturatedError を送出する。
+    呼び出し側はこれを受けて 503/429 などで負荷を逃がす。
+    """
+
+    def __init__(self, kind="thread", max_workers=None, max_in_flight=None):
+        if kind not in EXECUTOR_CLASSES:
+            raise ValueError(f"不明な executor の種類です: {kind}")
+        self.kind = kind
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight or self.max_workers * 2
+        self._executor = EXECUTOR_CLASSES[kind](max_workers=self.max_workers)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._in_flight >= self.max_in_flight:
+                raise ExecutorSaturatedError(f"実行中のタスクが上限 ({self.max_in_flight}) に達しています")
+            self._in_flight += 1
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future=None):
+        with self._lock:
+            self._in_flight -= 1
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        """ワーカーの空きを待っているタスク数"""
+        return max(0, self._in_flight - self.max_workers)
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+        }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
@@ -1,18 +1,160 @@
+import threading
+
+# YAML ルールの型名 -> Cerberus の型名 (Cerberus の型名はそのまま使える)
+TYPE_ALIASES = {
+    "str": "string",
+    "int": "integer",
+    "bool": "boolean",
+    "object": "dict",
+    "mapping": "dict",
+    "array": "list",
+    "sequence": "list",
+}
+
+# 検証に使わない注釈のキー (Cerberus には渡さない)
+ANNOTATION_KEYS = frozenset(("description", "title", "example", "examples", "$comment"))
+
+# 下で構造を変換するキー
+STRUCTURE_KEYS = frozenset(("schema", "properties", "items"))
+
+# 別名 (JSON Schema 風の名前など) -> Cerberus のルール名
+RULE_ALIASES = {
+    "enum": "allowed",
+    "pattern": "regex",
+    "minimum": "min",
+    "maximum": "max",
+    "minLength": "minlength",
+    "maxLength": "maxlength",
+    "minItems": "minlength",
+    "maxItems": "maxlength",
+    "keyschema": "keysrules",
+    "valueschema": "valuesrules",
+}
+
+# 値が 1 つのルールセットになるルールと、ルールセットのリストになるルール
+RULE_SET_RULES = ("keysrules", "valuesrules")
+RULE_SET_LIST_RULES = ("anyof", "allof", "oneof", "noneof")
+
+
+# 正規化 (文書の書き換え) を伴う Cerberus のルール
+NORMALIZATION_RULES = frozenset(
+    ("coerce", "default", "default_setter", "rename", "rename_handler", "purge_unknown", "purge_readonly", "readonly")
+)
+
+
+def convert_type(value):
+    if isinstance(value, list):
+        return [TYPE_ALIASES.get(item, item) for item in value]
+    return TYPE_ALIASES.get(value, value)
+
+
+def convert_rules(rules) -> dict:
+    """1 フィールド分の YAML ルールを Cerberus のルールセットにする
+
+    文字列は型の省略形として扱う。別名と型名を置き換え、description などの注釈を捨てる以外は
+    そのまま渡す (anyof_type や check_with などの Cerberus のルールは変換しない)。
+    入れ子の properties と、type が dict の schema (dict のフィールド)、type が list の items / schema
+    (list の要素) も再帰的に変換する。type を書いていない schema は Cerberus の解釈に任せてそのまま渡す。
+    """
+    if isinstance(rules, str):
+        return {"type": convert_type(rules)}
+    if not isinstance(rules, dict):
+        return {}
+    cerberus_rules = {}
+    for rule, value in rules.items():
+        rule = RULE_ALIASES.get(rule, rule)
+        if rule in ANNOTATION_KEYS or rule in STRUCTURE_KEYS:
+            continue
+        if rule == "type":
+            cerberus_rules["type"] = convert_type(value)
+        elif rule == "required" and isinstance(value, list):
+            # 項目のリストとしての required (JSON Schema 風) は下でフィールドに移す
+            continue
+        elif rule in RULE_SET_RULES:
+            cerberus_rules[rule] = convert_rules(value)
+        elif rule in RULE_SET_LIST_RULES and isinstance(value, list):
+            cerberus_rules[rule] = [convert_rules(item) for item in value]
+        else:
+            cerberus_rules[rule] = value
+
+    value_type = cerberus_rules.get("type")
+    fields = rules.get("properties")
+    if fields is None and value_type == "dict":
+        fields = rules.get("schema")
+    if isinstance(fields, dict):
+        schema = convert_yaml_to_cerberus(fields)
+        required = rules.get("required")
+        for name in required if isinstance(required, list) else ():
+            schema.setdefault(name, {})["required"] = True
+        cerberus_rules["schema"] = schema
+    elif "schema" in rules and value_type not in ("dict", "list"):
+        cerberus_rules["schema"] = rules["schema"]
+
+    items = rules.get("items")
+    if value_type == "list" and items is None:
+        items = rules.get("schema")
+    if isinstance(items, dict):
+        # 全要素に適用するルール
+        cerberus_rules["schema"] = convert_rules(items)
+    elif isinstance(items, list):
+        # 位置ごとのルール
+        cerberus_rules["items"] = [convert_rules(item) for item in items]
+    return cerberus_rules
+
+
 def convert_yaml_to_cerberus(yaml_schema):
-    cerberus_schema = {}
-    for field, rules in yaml_schema.items():
-        cerberus_rules = {}
-        for rule, value in rules.items():
-            if rule == "type":
-                cerberus_rules["type"] = value
-            elif rule == "minlength":
-                cerberus_rules["minlength"] = value
-            elif rule == "maxlength":
-                cerberus_rules["maxlength"] = value
-            elif rule == "required":
-                cerberus_rules["required"] = value
-            elif rule == "min":
-                cerberus_rules["min"] = value
-            # Add more mappings as needed
-        cerberus_schema[field] = cerberus_rules
-    return cerberus_schema
+    """フィールド名 -> YAML ルールのスキーマを Cerberus のスキーマにする (dict 以外はそのまま返す)"""
+    if not isinstance(yaml_schema, dict):
+        return yaml_schema
+    return {field: convert_rules(rules) for field, rules in yaml_schema.items()}
+
+
+def needs_normalization(schema) -> bool:
+    """スキーマに正規化ルールが含まれるか (フィールド名が一致した場合も含むので、迷う場合は True)"""
+    stack = [schema]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            if NORMALIZATION_RULES.intersection(node):
+                return True
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+    return False
+
+
+class CompiledCerberusSchema:
+    """コンパイル済みの Cerberus スキーマ
+
+    convert=True なら YAML ルールとして変換してから、False なら Cerberus のスキーマのまま使う。
+
+    スキーマの変換と Cerberus による正規化・検証は構築時に一度だけ行う。Validator は
+    検証中の状態を持つためスレッドをまたいで共有できないが、validate() のたびに状態は
+    初期化されるので、スレッドごとに 1 つ作って使い回す。正規化ルールを含まないスキーマでは
+    検証のたびの正規化 (文書の複製) を省く。
+    """
+
+    def __init__(self, schema, convert=True):
+        from cerberus import Validator
+
+        self.schema = convert_yaml_to_cerberus(schema) if convert else schema
+        self._prototype = Validator(self.schema)
+        self.normalize = needs_normalization(self.schema)
+        self._local = threading.local()
+
+    def validator(self):
+        """このスレッド用の (再利用される) Validator を返す"""
+        from cerberus import Validator
+
+        validator = getattr(self._local, "validator", None)
+        if validator is None:
+            # 正規化済みの定義を渡すので、スキーマの正規化と検証は繰り返さない
+            validator = self._local.validator = Validator(self._prototype.schema)
+        return validator
+
+    def validate(self, document):
+        """document を検証し、エラーがあれば Cerberus の errors を、なければ None を返す"""
+        validator = self.validator()
+        if validator.validate(document, normalize=self.normalize):
+            return None
+        return validator.errors
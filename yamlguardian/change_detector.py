@@ -0,0 +1,108 @@
+import hashlib
+import os
+
+# ファイル状態: (size, mtime_ns, inode, ctime_ns, digest)
+SIZE, MTIME_NS, INODE, CTIME_NS, DIGEST = range(5)
+
+
+def stat_signature(path) -> tuple:
+    """1 回の stat から (size, mtime_ns, inode, ctime_ns) を得る"""
+    stat = os.stat(path)
+    return (stat.st_size, stat.st_mtime_ns, stat.st_ino, stat.st_ctime_ns)
+
+
+def content_digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def file_digest(path) -> str:
+    with open(path, "rb") as f:
+        return content_digest(f.read())
+
+
+class ChangeSet:
+    """追加・変更・削除されたファイルとディレクトリの集合
+
+    files は走査で見つかったすべてのファイル (変更の有無によらない、パス順)。
+    """
+
+    def __init__(self):
+        self.files = []
+        self.added = set()
+        self.modified = set()
+        self.deleted = set()
+        self.added_directories = set()
+        self.modified_directories = set()
+        self.deleted_directories = set()
+
+    @property
+    def changed(self) -> set:
+        return self.added | self.modified
+
+    def __bool__(self):
+        return bool(self.added or self.modified or self.deleted)
+
+    def to_rows(self) -> list[list[str]]:
+        """save_changes_to_csv 形式の [Type, Path] 行にする"""
+        rows = [["File", path] for path in sorted(self.changed)]
+        rows += [["Directory", path] for path in sorted(self.added_directories | self.modified_directories)]
+        rows += [["DeletedFile", path] for path in sorted(self.deleted)]
+        rows += [["DeletedDirectory", path] for path in sorted(self.deleted_directories)]
+        return rows
+
+
+class ChangeDetector:
+    """ルールファイルの変更検出
+
+    まず 1 回の stat で (size, mtime_ns, inode) を比べる。size が違えば変更、
+    すべて (ctime も含めて) 一致すれば未変更とみなす。size が同じで他が食い違う
+    場合や、touch -r などで ctime だけが変わった曖昧な場合に限り内容のハッシュを比べる。
+    """
+
+    def check(self, path, cached_state):
+        """ファイルの状態を判定し (is_changed, state) を返す
+
+        未変更なら state は最新の stat を反映したもの、変更ありなら None を返す
+        (新しい状態はファイルを読み込むときに求める)。
+        """
+        if cached_state is None or not isinstance(cached_state, tuple):
+            return True, None
+        signature = stat_signature(path)
+        if signature[SIZE] != cached_state[SIZE]:
+            return True, None
+        if signature == cached_state[:DIGEST]:
+            return False, cached_state
+        if file_digest(path) == cached_state[DIGEST]:
+            return False, signature + (cached_state[DIGEST],)
+        return True, None
+
+    def diff(self, root_dir, file_paths, changed_paths, cached_paths) -> ChangeSet:
+        """走査結果とキャッシュ済みのパスから ChangeSet を作る
+
+        Args:
+            root_dir: 走査したディレクトリ
+            file_paths: 今回見つかったファイル (絶対パス)
+            changed_paths: file_paths のうち追加または変更されたもの
+            cached_paths: キャッシュ済みのファイル (root_dir の外のものは無視する)
+        """
+        root = os.path.abspath(root_dir)
+        prefix = root.rstrip(os.sep) + os.sep
+        known = {path for path in cached_paths if path.startswith(prefix)}
+        found = set(file_paths)
+        known_directories = {os.path.dirname(path) for path in known}
+
+        change_set = ChangeSet()
+        change_set.files = list(file_paths)
+        for path in changed_paths:
+            (change_set.modified if path in known else change_set.added).add(path)
+        change_set.deleted = known - found
+
+        for path in change_set.changed | change_set.deleted:
+            directory = os.path.dirname(path)
+            if directory not in known_directories:
+                change_set.added_directories.add(directory)
+            elif os.path.isdir(directory):
+                change_set.modified_directories.add(directory)
+            else:
+                change_set.deleted_directories.add(directory)
+        return change_set
@@ -1,52 +1,284 @@
 import argparse
 import os
+import sys
+import time
 
+from yamlguardian import yaml_loader
+from yamlguardian.core import YamlGuardian
+from yamlguardian.frame_validator import is_frame_file
 from yamlguardian.json_schema_adapter import yaml_to_json_schema
-from yamlguardian.save_load_yaml import load_yaml
-from yamlguardian.validate import format_errors, validate_openapi_schema
-from yamlguardian.yaml_to_json_schema import load_yaml_schemas
+from yamlguardian.ref_resolver import RESOLVE_MODES
+from yamlguardian.rule_watcher import relative_schema_dict
+from yamlguardian.save_load_yaml import format_errors
+from yamlguardian.validate import validate_openapi_schema
+from yamlguardian.validation_context import VALIDATION_MODES
 
 
-def main():
+def validate_stream(args, guardian=None):
+    guardian = guardian or YamlGuardian(args.schema_file_or_dir)
+    failed = 0
+    for index, offset, result in guardian.validate_stream(
+        args.input_file_or_dir, mode=args.mode, max_errors=args.max_errors
+    ):
+        if result["message"] == "Validation successful":
+            print(f"Document {index} (offset {offset}): Validation succeeded.")
+        else:
+            failed += 1
+            print(f"Document {index} (offset {offset}): Validation failed with the following errors:")
+            print(format_errors(result.get("errors", result.get("detail", ""))))
+    if failed:
+        print(f"Validation failed for {failed} document(s) in {args.input_file_or_dir}.")
+    else:
+        print(f"Validation succeeded for {args.input_file_or_dir}.")
+
+
+# validate_frame_file で 1 つのルールについて表示する行番号の数
+MAX_ROWS_SHOWN = 20
+
+
+def validate_frame_file(args, guardian=None):
+    """CSV / JSONL の各行を root_element のルールで列ごとにまとめて検証する"""
+    guardian = guardian or YamlGuardian(args.schema_file_or_dir)
+    failures = guardian.validate_frame(guardian.read_frame(args.input_file_or_dir))
+    failed_rows = set()
+    for failure in failures:
+        rows = failure["rows"]
+        failed_rows.update(rows)
+        shown = ", ".join(str(row) for row in rows[:MAX_ROWS_SHOWN])
+        print(f"Rule '{failure['rule']}' of {failure['name']} failed for {len(rows)} row(s): {failure['message']}")
+        print(f"  rows: {shown}{' ...' if len(rows) > MAX_ROWS_SHOWN else ''}")
+    if failed_rows:
+        print(f"Validation failed for {len(failed_rows)} row(s) in {args.input_file_or_dir}.")
+    else:
+        print(f"Validation succeeded for {args.input_file_or_dir}.")
+
+
+def validate_schema_dict(args, schema_dict, json_schema=None, guardian=None):
+    if json_schema is None:
+        json_schema = yaml_to_json_schema(schema_dict, "test")
+    print("json_schema=", json_schema)
+    errors = validate_openapi_schema(json_schema)
+    if errors:
+        print(f"Validation openapi_schema failed for {args.input_file_or_dir} with the following errors:")
+        print(format_errors(errors))
+    else:
+        print(f"Validation succeeded for {args.input_file_or_dir}.")
+
+    # validate data against the schema file
+    if guardian is None and os.path.isfile(args.schema_file_or_dir):
+        guardian = YamlGuardian(args.schema_file_or_dir)
+    if guardian is not None:
+        for schema_name, data in schema_dict.items():
+            result = guardian.validate(data, mode=args.mode, max_errors=args.max_errors)
+            if result["message"] == "Validation successful":
+                print(f"Validation succeeded for {schema_name}.")
+            else:
+                print(f"Validation failed for {schema_name} with the following errors:")
+                print(format_errors(result.get("errors", result.get("detail", ""))))
+
+
+def watch(args):
+    """入力ディレクトリを監視し、変更があるたびに読み直したルールセットを検証する"""
+    from yamlguardian.rule_watcher import RuleSetWatcher
+
+    watcher = RuleSetWatcher(args.input_file_or_dir, jobs=args.jobs)
+
+    def on_change(change_set):
+        print(
+            f"Detected {len(change_set.changed)} changed and {len(change_set.deleted)} deleted file(s) "
+            f"in {args.input_file_or_dir}."
+        )
+        validate_schema_dict(args, watcher.rule_set.schema_dict)
+
+    validate_schema_dict(args, watcher.rule_set.schema_dict)
+    watcher.add_listener(on_change)
+    watcher.start()
+    print(f"Watching {args.input_file_or_dir} for changes. Press Ctrl+C to stop.")
+    try:
+        while watcher.running:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
+
+
+def add_yaml_backend_argument(parser):
+    parser.add_argument(
+        "--yaml-backend",
+        choices=yaml_loader.YAML_BACKENDS,
+        help="YAML loader: libyaml (c), pure Python (safe) or ruamel round-trip. "
+        f"Defaults to ${yaml_loader.BACKEND_ENV} or auto (c when libyaml is available).",
+        default=os.environ.get(yaml_loader.BACKEND_ENV, yaml_loader.AUTO),
+    )
+
+
+def compile_command(argv):
+    """ルールディレクトリとスキーマをコンパイルしてバンドルに書き出す"""
+    from yamlguardian.rule_bundle import compile_bundle
+
+    parser = argparse.ArgumentParser(
+        prog="yamlguardian compile", description="Compile a rule directory and schema into a rule bundle."
+    )
+    parser.add_argument("-i", "--input_dir", type=str, help="Path to the rule directory to compile.")
+    parser.add_argument("-s", "--schema_file", type=str, help="Path to the YAML schema file used by YamlGuardian.")
+    parser.add_argument("-r", "--relations_file", type=str, help="Path to the relations file.")
+    parser.add_argument("-c", "--common_definitions_file", type=str, help="Path to the common definitions file.")
+    parser.add_argument("-o", "--output", type=str, help="Path to the bundle to write.", required=True)
+    parser.add_argument("-j", "--jobs", type=int, help="Number of processes used to parse YAML files.", default=None)
+    parser.add_argument(
+        "--resolve-mode",
+        choices=RESOLVE_MODES,
+        help="How $refs in the merged schema are resolved: copied, shared, or kept as local $defs references.",
+        default="shared",
+    )
+    add_yaml_backend_argument(parser)
+    args = parser.parse_args(argv)
+    yaml_loader.set_backend(args.yaml_backend)
+    if not args.input_dir and not args.schema_file:
+        parser.error("at least one of -i/--input_dir and -s/--schema_file is required")
+
+    bundle = compile_bundle(
+        args.input_dir,
+        args.schema_file,
+        args.relations_file,
+        args.common_definitions_file,
+        jobs=args.jobs,
+        resolve_mode=args.resolve_mode,
+    )
+    bundle.save(args.output)
+    print(f"Compiled {len(bundle.sources)} source file(s) into {args.output}.")
+
+
+def load_bundle_guardian(args):
+    """-b のバンドルを読み込み、元ファイルが変わっていなければ (bundle, guardian) を返す
+
+    -i / -s が省略されていればバンドル作成時のパスを使う。古い場合は警告して元ファイルから読み直す。
+    """
+    from yamlguardian.rule_bundle import load_bundle
+
+    bundle = load_bundle(args.bundle)
+    if not args.input_file_or_dir and bundle.rule_dir:
+        args.input_file_or_dir = os.path.relpath(bundle.rule_dir)
+    args.schema_file_or_dir = args.schema_file_or_dir or bundle.schema_file
+    if bundle.compiler_changed():
+        print(f"Bundle {args.bundle} was compiled by a different version of yamlguardian; loading from the sources.")
+        return None, None
+    stale = bundle.stale_sources()
+    if stale:
+        print(f"Bundle {args.bundle} is stale ({len(stale)} source file(s) changed); loading from the sources.")
+        return None, None
+    guardian = YamlGuardian.from_bundle(bundle) if bundle.rule_manager is not None else None
+    return bundle, guardian
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "compile":
+        compile_command(argv[1:])
+        return
+
     parser = argparse.ArgumentParser(description="Validate data against a YAML schema.")
     parser.add_argument(
         "-i",
         "--input_file_or_dir",
         type=str,
-        help="Path to the YAML data file or directory to validate.",
-        required=True,
+        help="Path to the YAML data file or directory to validate (defaults to the bundle's rule directory). "
+        "CSV and JSONL files are validated row by row against the schema's root_element rules.",
+        required=False,
     )
     parser.add_argument(
         "-s",
         "--schema_file_or_dir",
         type=str,
         help="Path to the YAML schema file or directory.",
-        default="rule_config",
+        default=None,
         required=False,
     )
+    parser.add_argument(
+        "-b",
+        "--bundle",
+        type=str,
+        help="Path to a rule bundle written by the compile command. Stale bundles fall back to the sources. "
+        "Bundles are trusted input (they are unpickled): only load bundles you compiled yourself.",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--mode",
+        choices=VALIDATION_MODES,
+        help="Validation mode: stop at the first error, after --max-errors errors, or report every error.",
+        default=None,
+    )
+    parser.add_argument(
+        "--max-errors",
+        type=int,
+        help="Maximum number of errors to report (implies --mode max_errors).",
+        default=None,
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of processes used to parse YAML files when the input is a directory.",
+        default=None,
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Validate a multi-document ('---' separated) YAML file one document at a time.",
+    )
+
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and re-validate whenever the input directory changes (only changed files are re-parsed).",
+    )
+
+    add_yaml_backend_argument(parser)
+    args = parser.parse_args(argv)
+    yaml_loader.set_backend(args.yaml_backend)
+    bundle, guardian = load_bundle_guardian(args) if args.bundle else (None, None)
+    if not args.input_file_or_dir:
+        parser.error("the following arguments are required: -i/--input_file_or_dir")
+    args.schema_file_or_dir = args.schema_file_or_dir or "rule_config"
+    if args.watch and not os.path.isdir(args.input_file_or_dir):
+        parser.error("--watch requires a directory input")
+
+    if args.stream:
+        validate_stream(args, guardian)
+        return
+
+    if is_frame_file(args.input_file_or_dir):
+        validate_frame_file(args, guardian)
+        return
+
+    if args.watch:
+        watch(args)
+        return
 
-    args = parser.parse_args()
+    if bundle is not None and bundle.rule_dir == os.path.abspath(args.input_file_or_dir):
+        # コンパイル済みのルールをそのまま使う
+        validate_schema_dict(args, bundle.schema_dict, bundle.json_schema, guardian)
+        return
 
     # schema_dict
     if os.path.isdir(args.input_file_or_dir):
+        from yamlguardian.directory_analyzer import DirectoryAnalyzer
+
         input_dir = args.input_file_or_dir
-        schema_dict = load_yaml_schemas(input_dir)
+        analyzer = DirectoryAnalyzer()
+        analyzer.analyze_directory_structure(input_dir, args.jobs)
+        analyzer.save_cache()
+        schema_dict = relative_schema_dict(analyzer.validation_rules, input_dir)
     else:
         input_file = args.input_file_or_dir
         schema_name = os.path.splitext(os.path.basename(input_file))[0]
         schema_dict = {}
-        schema_dict[schema_name] = load_yaml(input_file)
-
-    json_schema = yaml_to_json_schema(schema_dict, "test")
-    print("json_schema=", json_schema)
-    errors = validate_openapi_schema(json_schema)
-    if errors:
-        print(f"Validation openapi_schema failed for {args.input_file_or_dir} with the following errors:")
-        print(format_errors(errors))
-    else:
-        print(f"Validation succeeded for {args.input_file_or_dir}.")
+        schema_dict[schema_name] = yaml_loader.load_file(input_file)
 
-    # TODO: validate data against json_schema
+    validate_schema_dict(args, schema_dict, guardian=guardian)
 
 
 if __name__ == "__main__":
@@ -1,79 +1,296 @@
 import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
 
-import yaml
-from fastapi import HTTPException
-
-from yamlguardian.directory_analyzer import DirectoryAnalyzer
+from yamlguardian import yaml_loader
+from yamlguardian.frame_validator import read_frame, validate_frame_plan
 from yamlguardian.hierarchy_merger import HierarchyMerger
 from yamlguardian.hierarchy_reader import HierarchyReader
+from yamlguardian.page_rules import page_rule_cache, resolve_page_dir
+from yamlguardian.rule_ir import UnsupportedRuleError, compile_json_schema, compile_plan, rule_programs
 from yamlguardian.rules import RuleManager
-from yamlguardian.validate import format_errors, load_validation_rules, validate_data
+from yamlguardian.save_load_yaml import format_errors
+from yamlguardian.validate import (
+    data_errors,
+    json_schema_validators,
+    stage_rule_trees,
+    validate_context,
+    validate_openapi_schema,
+    validate_user_defined_yaml,
+    validate_user_provided_yaml,
+)
+from yamlguardian.validation_context import ValidationContext, error_limit
+from yamlguardian.yaml_stream import iter_yaml_sources
+
+# root_element のルールがあるのにドキュメントがマッピングでない場合のエラー
+NOT_MAPPING_MESSAGE = "ドキュメントはマッピングである必要があります。"
+
+# validate_many のワーカープロセスごとに initializer で一度だけ構築される
+_worker_guardian = None
+
+
+def _init_worker(schema, relations, common_definitions):
+    global _worker_guardian
+    _worker_guardian = YamlGuardian.from_definitions(schema, relations, common_definitions)
+
+
+def _validate_chunk(chunk, mode, max_errors):
+    return [(index, _worker_guardian.validate(data, mode, max_errors)) for index, data in chunk]
+
+
+def _chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
 
 
 class YamlGuardian:
-    def __init__(self, schema_file, relations_file=None, common_definitions_file=None):
-        self.schema = self.load_yaml(schema_file)
-        self.relations = self.load_yaml(relations_file) if relations_file else None
-        self.common_definitions = self.load_yaml(common_definitions_file) if relations_file else None
-        self.rule_manager = RuleManager(self.schema, self.relations, self.common_definitions)
+    def __init__(self, schema_file, relations_file=None, common_definitions_file=None, rule_dir=None):
+        schema = self.load_yaml(schema_file)
+        relations = self.load_yaml(relations_file) if relations_file else None
+        common_definitions = self.load_yaml(common_definitions_file) if common_definitions_file else None
+        self._setup(schema, relations, common_definitions)
+        # validate_page でページ名から page_definitions/<page> を引くときの rule_config のルート
+        self.rule_dir = rule_dir
+
+    @classmethod
+    def from_definitions(cls, schema, relations=None, common_definitions=None, rule_dir=None):
+        """読み込み済みのスキーマ・リレーション・共通定義から構築する"""
+        guardian = cls.__new__(cls)
+        guardian._setup(schema, relations, common_definitions)
+        guardian.rule_dir = rule_dir
+        return guardian
+
+    @classmethod
+    def from_bundle(cls, bundle):
+        """compile サブコマンドで作ったバンドル (またはそのパス) から構築する
+
+        スキーマのパースとプランのコンパイルは済んでいるため、読み込むだけで検証できる。
+        """
+        from yamlguardian.rule_bundle import RuleBundle, load_bundle
+
+        if not isinstance(bundle, RuleBundle):
+            bundle = load_bundle(bundle)
+        if bundle.rule_manager is None:
+            raise ValueError("バンドルにスキーマが含まれていません (compile で -s を指定してください)")
+        guardian = cls.__new__(cls)
+        guardian._setup(bundle.schema, bundle.relations, bundle.common_definitions, bundle.rule_manager)
+        guardian.bundle = bundle
+        guardian.rule_dir = bundle.rule_dir
+        return guardian
+
+    def _setup(self, schema, relations, common_definitions, rule_manager=None):
+        self.schema = schema
+        self.relations = relations
+        self.common_definitions = common_definitions
+        self.rule_manager = rule_manager or RuleManager(self.schema, self.relations, self.common_definitions)
+        self.rule_dir = None
+        self.common_index = self.rule_manager.common_index
+        self._rule_trees = None
+        # validate_many のワーカープロセスのプール (最初の呼び出しで作り、close で終了する)
+        self._pool = None
+        self._pool_workers = None
         self.hierarchy_reader = HierarchyReader()
         self.hierarchy_merger = HierarchyMerger()
 
     def load_yaml(self, file_path):
         try:
-            with open(file_path, encoding="utf-8") as file:
-                return yaml.safe_load(file)
-        except yaml.YAMLError as e:
+            return yaml_loader.load_file(file_path)
+        except yaml_loader.YAMLError as e:
             raise ValueError(f"YAML読み込みエラー: {e}")
         except FileNotFoundError:
             raise ValueError(f"ファイルが見つかりません: {file_path}")
         except Exception as e:
             raise ValueError(f"予期しないエラーが発生しました: {e}")
 
-    def validate(self, data):
-        schema = load_validation_rules(self.schema)
-        errors = validate_data(data, schema)
+    def validate(self, data, mode=None, max_errors=None):
+        """データを検証する
+
+        mode は fail_fast / max_errors / exhaustive のいずれか (validation_context を参照)。
+        """
+        context = ValidationContext.from_input(data, mode, max_errors)
+        limit = context.error_limit
+        # スキーマ・root_element のルール・各ステージのルールを IR で 1 回だけ辿って評価する
+        program = rule_programs.get({**self.rule_trees(), **stage_rule_trees()})
+        outcome = program.evaluate(context.document)
+        context.passed = outcome.passed
+        errors = []
+        if "schema" not in outcome.passed:
+            errors += data_errors(context.document, self.schema, limit)
+        if limit is None or len(errors) < limit:
+            remaining = None if limit is None else limit - len(errors)
+            if "rules" in outcome.passed:
+                errors += outcome.errors[:remaining]
+            elif not isinstance(context.document, dict):
+                # root_element のルールはマッピングのキーを検証するので、リストや文字列には適用できない
+                errors.append(NOT_MAPPING_MESSAGE)
+            else:
+                errors += self.rule_manager.validate(context.document, remaining)
         if errors:
-            return format_errors(errors)
-        openapi_result = self.rule_manager.validate_openapi_schema(data)
-        if openapi_result["message"] == "Validation failed":
-            return openapi_result
-        user_defined_result = self.rule_manager.validate_user_defined_yaml(data)
-        if user_defined_result["message"] == "Validation failed":
-            return user_defined_result
-        user_provided_result = self.rule_manager.validate_user_provided_yaml(data)
-        if user_provided_result["message"] == "Validation failed":
-            return user_provided_result
-        return {"message": "Validation successful"}
+            return {"message": "Validation failed", "errors": format_errors(errors)}
+        return validate_context(context)
+
+    def validate_frame(self, df) -> list[dict]:
+        """DataFrame の各行を root_element のルールで列ごとにまとめて検証する (frame_validator を参照)"""
+        return validate_frame_plan(df, self.rule_manager.validator.plan)
+
+    def read_frame(self, path):
+        """CSV / JSONL を root_element の型に合わせた dtype で DataFrame に読み込む"""
+        return read_frame(path, self.rule_manager.validator.plan)
+
+    def rule_trees(self) -> dict:
+        """スキーマ (JSON Schema) と root_element のプランの IR の木 (IR にできないものは None)"""
+        if self._rule_trees is None:
+            trees = {}
+            try:
+                json_schema_validators.get(self.schema)
+                trees["schema"] = compile_json_schema(self.schema, "schema")
+            except Exception:
+                # 不正なスキーマのエラーは検証時に jsonschema が報告する
+                trees["schema"] = None
+            try:
+                trees["rules"] = compile_plan(self.rule_manager.validator.plan, "rules")
+            except UnsupportedRuleError:
+                trees["rules"] = None
+            self._rule_trees = trees
+        return self._rule_trees
+
+    def validate_many(self, documents, workers=None, chunksize=64, ordered=True, mode=None, max_errors=None):
+        """複数のドキュメントをワーカープロセスで並列に検証する
+
+        スキーマ・リレーション・共通定義は initializer でワーカーに一度だけ渡され、
+        タスクごとにはドキュメントのチャンクだけが送られる (custom_rules を使う場合は
+        pickle 可能な関数にすること)。ordered=True なら入力順に結果を、False なら
+        完了順に (index, result) を返す。
+        ワーカーのプールは呼び出しをまたいで再利用するので、使い終わったら close() を呼ぶこと。
+        引数の誤りは結果を読み出す前に ValueError になる。
+        """
+        error_limit(mode, max_errors)
+        workers = workers or os.cpu_count() or 1
+        if workers == 1:
+            return self._validate_sequential(documents, ordered, mode, max_errors)
+        return self._validate_parallel(
+            documents, self._get_pool(workers), workers, chunksize, ordered, mode, max_errors
+        )
+
+    def _validate_sequential(self, documents, ordered, mode, max_errors):
+        for index, data in enumerate(documents):
+            result = self.validate(data, mode, max_errors)
+            yield result if ordered else (index, result)
+
+    def _get_pool(self, workers):
+        if self._pool is not None and self._pool_workers != workers:
+            self.close()
+        if self._pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+
+            self._pool = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(self.schema, self.relations, self.common_definitions),
+            )
+            self._pool_workers = workers
+        return self._pool
+
+    def _validate_parallel(self, documents, pool, workers, chunksize, ordered, mode, max_errors):
+        chunks = _chunked(enumerate(documents), chunksize)
+        max_pending = workers * 2
+        pending = deque() if ordered else set()
+        try:
+            if ordered:
+                for chunk in chunks:
+                    pending.append(pool.submit(_validate_chunk, chunk, mode, max_errors))
+                    if len(pending) >= max_pending:
+                        for _, result in pending.popleft().result():
+                            yield result
+                while pending:
+                    for _, result in pending.popleft().result():
+                        yield result
+            else:
+                for chunk in chunks:
+                    pending.add(pool.submit(_validate_chunk, chunk, mode, max_errors))
+                    if len(pending) >= max_pending:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            yield from future.result()
+                for future in as_completed(pending):
+                    yield from future.result()
+        except BrokenProcessPool:
+            # ワーカーが異常終了したプールは使えないので、次の呼び出しで作り直す
+            if self._pool is pool:
+                self.close()
+            raise
+        finally:
+            # 途中で読むのをやめた場合、まだ始まっていないチャンクは実行しない (プールは残す)
+            for future in pending:
+                future.cancel()
+
+    def close(self):
+        """validate_many のワーカープロセスを終了する"""
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+            self._pool_workers = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def validate_stream(self, file_or_path, mode=None, max_errors=None):
+        """マルチドキュメント YAML を 1 ドキュメントずつ読み込んで検証する
+
+        YAML として読めないドキュメントは "Validation error" の結果になる。
+
+        Yields:
+            (index, offset, result): ドキュメント番号、先頭のバイトオフセット、検証結果
+        """
+        error_limit(mode, max_errors)
+        for index, offset, source in iter_yaml_sources(file_or_path):
+            try:
+                data = yaml_loader.load(source)
+            except yaml_loader.YAMLError as e:
+                # 壊れたドキュメントはそのドキュメントだけの失敗にして、後続のドキュメントの検証を続ける
+                yield index, offset, {"message": "Validation error", "detail": f"YAML読み込みエラー: {e}"}
+                continue
+            yield index, offset, self.validate(data, mode, max_errors)
+
+    def page_rules(self, page):
+        """ページの有効なルールセット (共通定義 + page_definitions/<page>/) をキャッシュから得る
+
+        page はページ名 (rule_dir/page_definitions/<page>) またはページ定義のディレクトリ。
+        """
+        try:
+            return page_rule_cache.get(resolve_page_dir(page, self.rule_dir))
+        except yaml_loader.YAMLError as e:
+            raise ValueError(f"YAML読み込みエラー: {e}")
 
     def load_page_definitions(self, page_definitions_dir):
-        page_definitions = {}
-        for root, _, files in os.walk(page_definitions_dir):
-            for file in files:
-                if file.endswith(".yaml"):
-                    file_path = os.path.join(root, file)
-                    page_definitions[file_path] = self.load_yaml(file_path)
-        return page_definitions
-
-    def validate_page(self, page_data, page_definitions_dir):
-        page_definitions = self.load_page_definitions(page_definitions_dir)
-        for file_path, definition in page_definitions.items():
-            schema = load_validation_rules(definition)
-            errors = validate_data(page_data, schema)
+        return self.page_rules(page_definitions_dir).definitions
+
+    def validate_page(self, page_data, page):
+        """page_data をページの定義のうち適用されるものだけで検証し、続けて定義に依存しないステージを一度だけ実行する"""
+        page_rules = self.page_rules(page)
+        for file_path in page_rules.applicable(page_data):
+            errors = page_rules.validate_definition(file_path, page_data)
             if errors:
                 return format_errors(errors)
-            openapi_result = self.rule_manager.validate_openapi_schema(page_data)
-            if openapi_result["message"] == "Validation failed":
-                return openapi_result
-            user_defined_result = self.rule_manager.validate_user_defined_yaml(page_data)
-            if user_defined_result["message"] == "Validation failed":
-                return user_defined_result
-            user_provided_result = self.rule_manager.validate_user_provided_yaml(page_data)
-            if user_provided_result["message"] == "Validation failed":
-                return user_provided_result
+        for stage in (validate_openapi_schema, validate_user_defined_yaml, validate_user_provided_yaml):
+            result = stage(page_data)
+            if result["message"] == "Validation failed":
+                return result
         return {"message": "Validation successful"}
 
     def analyze_and_save_directory_structure(self, root_dir, csv_file):
+        from yamlguardian.directory_analyzer import DirectoryAnalyzer
+
         analyzer = DirectoryAnalyzer()
         changes = analyzer.analyze_directory_structure(root_dir)
         analyzer.save_changes_to_csv(changes, csv_file)
@@ -82,10 +299,13 @@ class YamlGuardian:
     def read_hierarchy(self, file_path):
         return self.hierarchy_reader.read_hierarchy(file_path)
 
-    def merge_hierarchies(self, hierarchies):
-        return self.hierarchy_merger.merge_hierarchies(hierarchies)
+    def merge_hierarchies(self, hierarchies, jobs=None):
+        return self.hierarchy_merger.merge_hierarchies(hierarchies, jobs)
 
     def validate_yaml(self, input_data):
+        # FastAPI はサーバーから呼ばれるときだけ読み込む
+        from fastapi import HTTPException
+
         try:
             return self.validate_yaml_data(input_data.yaml_content)
         except Exception as e:
@@ -1,75 +1,419 @@
 import csv
+import datetime
+import json
+import marshal
+import mmap
 import os
+import sqlite3
+import struct
+import tempfile
 import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
 
-import pandas as pd
-import yaml
-
+from yamlguardian import yaml_loader
+from yamlguardian.change_detector import ChangeDetector, ChangeSet, content_digest, stat_signature
 from yamlguardian.hierarchy_merger import HierarchyMerger
 from yamlguardian.hierarchy_reader import HierarchyReader
 
 
+def default_cache_file() -> str:
+    """ユーザーごとのキャッシュディレクトリにあるキャッシュファイルのパス
+
+    カレントディレクトリに置かないことで、チェックアウトに含まれたファイルを読み込まないようにする。
+    """
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser(os.path.join("~", "AppData", "Local"))
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser(os.path.join("~", ".cache"))
+    return os.path.join(base, "yamlguardian", "cache.bin")
+
+
+# marshal で扱えない YAML の値は (タグ, 文字列) のタプルにする (safe_load の結果にタプルは現れない)
+DATETIME_TAG = "datetime"
+DATE_TAG = "date"
+
+
+def _encode_value(value):
+    if value is None or type(value) in (str, int, float, bool, bytes):
+        return value
+    if isinstance(value, dict):
+        return {_encode_value(key): _encode_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_encode_value(item) for item in value]
+    if isinstance(value, (set, frozenset)):
+        return {_encode_value(item) for item in value}
+    if isinstance(value, datetime.datetime):
+        return (DATETIME_TAG, value.isoformat())
+    if isinstance(value, datetime.date):
+        return (DATE_TAG, value.isoformat())
+    # ruamel のラウンドトリップ形式などのスカラーのサブクラス
+    for scalar_type in (bool, int, float, str, bytes):
+        if isinstance(value, scalar_type):
+            return scalar_type(value)
+    raise ValueError(f"キャッシュできない値です: {type(value).__name__}")
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        return {_decode_value(key): _decode_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode_value(item) for item in value]
+    if isinstance(value, (set, frozenset)):
+        return {_decode_value(item) for item in value}
+    if isinstance(value, tuple):
+        tag, text = value
+        if tag == DATETIME_TAG:
+            return datetime.datetime.fromisoformat(text)
+        return datetime.date.fromisoformat(text)
+    return value
+
+
+def encode_content(content) -> bytes | None:
+    """パース済みの YAML を marshal でバイト列にする (キャッシュできない値を含む場合は None)
+
+    pickle と違い、読み込むときに任意のコードが実行されることはない。
+    """
+    try:
+        return marshal.dumps(_encode_value(content))
+    except ValueError:
+        return None
+
+
+def decode_content(blob: bytes):
+    return _decode_value(marshal.loads(blob))
+
+
+def encode_state(state) -> str:
+    return json.dumps(state)
+
+
+def _state_tuple(state):
+    """JSON から読んだファイル状態をタプル (change_detector を参照) に戻す"""
+    return tuple(state) if isinstance(state, list) else state
+
+
+def decode_state(text):
+    return _state_tuple(json.loads(text))
+
+
+class CacheStore(ABC):
+    """DirectoryAnalyzer のキャッシュバックエンド
+
+    パース済みの YAML を marshal で、ファイル状態を JSON で保存し (どちらも読み込みでコードは実行されない)、
+    内容は path ごとに遅延して読み込める。states() は内容を読まずに path -> ファイル状態
+    (change_detector を参照) の索引だけを返す。キャッシュできない値を含む内容は保存しない。
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    @abstractmethod
+    def states(self) -> dict:
+        pass
+
+    @abstractmethod
+    def get(self, path):
+        pass
+
+    @abstractmethod
+    def save(self, entries: dict, deleted=()):
+        """path -> (content, state) のエントリを書き込み、deleted のエントリを消す (他のエントリは保持する)"""
+
+    @abstractmethod
+    def close(self):
+        pass
+
+    def _make_parent(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+
+
+class SqliteCacheStore(CacheStore):
+    """SQLite のテーブルにエントリごとの内容を保存するキャッシュ"""
+
+    # 形式を変えたときはテーブル名を変える (古い形式のテーブルは読まない)
+    TABLE = "entries_v2"
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._connection = None
+
+    def _connect(self):
+        if self._connection is None:
+            self._make_parent()
+            self._connection = sqlite3.connect(self.path)
+            self._connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.TABLE} (path TEXT PRIMARY KEY, state TEXT, content BLOB)"
+            )
+        return self._connection
+
+    def states(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        rows = self._connect().execute(f"SELECT path, state FROM {self.TABLE}")
+        return {path: decode_state(state) for path, state in rows}
+
+    def get(self, path):
+        row = self._connect().execute(f"SELECT content FROM {self.TABLE} WHERE path = ?", (path,)).fetchone()
+        return decode_content(row[0]) if row else None
+
+    def save(self, entries: dict, deleted=()):
+        rows, uncached = [], list(deleted)
+        for path, (content, state) in entries.items():
+            blob = encode_content(content)
+            if blob is None:
+                uncached.append(path)
+            else:
+                rows.append((path, encode_state(state), blob))
+        connection = self._connect()
+        with connection:
+            connection.executemany(f"INSERT OR REPLACE INTO {self.TABLE} (path, state, content) VALUES (?, ?, ?)", rows)
+            connection.executemany(f"DELETE FROM {self.TABLE} WHERE path = ?", [(path,) for path in uncached])
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class BinaryCacheStore(CacheStore):
+    """1 ファイルのバイナリ形式のキャッシュ
+
+    形式: MAGIC, marshal した各エントリの内容, 索引 {path: [offset, length, state]} の JSON,
+    索引のオフセット (8 バイト)。内容は mmap から必要なものだけ読み込む。
+    """
+
+    MAGIC = b"YGCACHE3"
+    FOOTER = struct.Struct("<Q")
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._index = None
+        self._map = None
+
+    def _open(self):
+        if self._index is not None:
+            return
+        self._index = {}
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < len(self.MAGIC) + self.FOOTER.size:
+            return
+        with open(self.path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._index = self._read_index()
+        except (ValueError, struct.error, KeyError, TypeError, AttributeError):
+            # 形式が違う・途中で切れている・壊れているファイルは空のキャッシュとして扱う (次の save で作り直す)
+            self.close()
+            self._index = {}
+
+    def _read_index(self) -> dict:
+        if self._map[: len(self.MAGIC)] != self.MAGIC:
+            raise ValueError("キャッシュファイルの形式が違います")
+        (index_offset,) = self.FOOTER.unpack(self._map[-self.FOOTER.size :])
+        end = len(self._map) - self.FOOTER.size
+        if not len(self.MAGIC) <= index_offset <= end:
+            raise ValueError("キャッシュファイルの索引の位置が正しくありません")
+        index = {}
+        for path, (offset, length, state) in json.loads(self._map[index_offset:end]).items():
+            if not (len(self.MAGIC) <= offset and length >= 0 and offset + length <= index_offset):
+                raise ValueError("キャッシュファイルのエントリの位置が正しくありません")
+            index[path] = (offset, length, _state_tuple(state))
+        return index
+
+    def _raw(self, path) -> bytes:
+        offset, length, _ = self._index[path]
+        return self._map[offset : offset + length]
+
+    def states(self) -> dict:
+        self._open()
+        return {path: state for path, (_, _, state) in self._index.items()}
+
+    def get(self, path):
+        self._open()
+        if path not in self._index:
+            return None
+        return decode_content(self._raw(path))
+
+    def save(self, entries: dict, deleted=()):
+        self._open()
+        self._make_parent()
+        # キャッシュはユーザーのプロセスで共有するので、一時ファイルはプロセスごとに別の名前にする
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix=".tmp")
+        try:
+            self._write(fd, entries, deleted)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self.close()
+        os.replace(tmp_path, self.path)
+
+    def _write(self, fd, entries, deleted):
+        index = {}
+        with open(fd, "wb") as f:
+            f.write(self.MAGIC)
+            for path in sorted((self._index.keys() | entries.keys()) - set(deleted)):
+                if path in entries:
+                    content, state = entries[path]
+                    blob = encode_content(content)
+                    if blob is None:
+                        continue
+                else:
+                    # 読み込んでいないエントリはデコードせずにそのまま写す
+                    blob = self._raw(path)
+                    state = self._index[path][2]
+                index[path] = (f.tell(), len(blob), state)
+                f.write(blob)
+            index_offset = f.tell()
+            f.write(json.dumps(index).encode("utf-8"))
+            f.write(self.FOOTER.pack(index_offset))
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._index = None
+
+
+CACHE_STORES = {".db": SqliteCacheStore, ".sqlite": SqliteCacheStore, ".sqlite3": SqliteCacheStore}
+
+
+def open_cache_store(cache_file) -> CacheStore:
+    """拡張子からキャッシュバックエンドを選ぶ (SQLite 以外はバイナリ形式)"""
+    store_class = CACHE_STORES.get(os.path.splitext(cache_file)[1], BinaryCacheStore)
+    return store_class(cache_file)
+
+
+def scan_yaml_files(root_dir) -> list[str]:
+    """os.scandir で root_dir 配下の .yaml ファイルを再帰的に集め、絶対パスの昇順で返す"""
+    yaml_files = []
+    directories = [root_dir]
+    while directories:
+        directory = directories.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(entry.path)
+                    elif entry.name.endswith(".yaml") and entry.is_file():
+                        yaml_files.append(os.path.abspath(entry.path))
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            continue
+    yaml_files.sort()
+    return yaml_files
+
+
+def parse_yaml_file(file_path) -> tuple[dict, tuple]:
+    """YAML ファイルをパースし、内容とファイル状態を返す (ワーカープロセスからも呼ばれる)
+
+    stat は読み込み前に取るため、読み込み中に書き換えられても次回の走査で検出される。
+    """
+    signature = stat_signature(file_path)
+    with open(file_path, "rb") as file:
+        data = file.read()
+    return yaml_loader.load(data), signature + (content_digest(data),)
+
+
 class DirectoryAnalyzer:
-    cache_file = "cache.csv"
+    # None ならユーザーごとのキャッシュディレクトリ (default_cache_file) を使う
+    cache_file = None
 
-    def __init__(self, cache_file=None):
+    def __init__(self, cache_file=None, cache_store=None):
         self.validation_rules = {}
         self.validation_schema = {}
         self.validation_schema_cache = {}
-        self.cache_file = cache_file or DirectoryAnalyzer.cache_file
+        self.cache_file = cache_file or DirectoryAnalyzer.cache_file or default_cache_file()
+        self.cache_store = cache_store or open_cache_store(self.cache_file)
+        self.cache_states = {}
+        self.change_detector = ChangeDetector()
+        self.change_set = ChangeSet()
+        self._dirty = set()
+        self._deleted = set()
         self.load_cache()
         self.hierarchy_reader = HierarchyReader()
         self.hierarchy_merger = HierarchyMerger()
 
     def load_cache(self):
-        if os.path.exists(self.cache_file):
-            df = pd.read_csv(self.cache_file)
-            for _, row in df.iterrows():
-                self.validation_schema_cache[row["Path"]] = (yaml.safe_load(row["Content"]), row["Timestamp"])
+        # 内容は読まずに索引だけを読み込み、内容は必要になったときに読む
+        self.cache_states = self.cache_store.states()
+
+    def get_cached(self, file_path):
+        """キャッシュが最新なら (content, state) を、無いか古い場合は None を返す"""
+        cached = self.validation_schema_cache.get(file_path)
+        cached_state = cached[1] if cached else self.cache_states.get(file_path)
+        is_changed, state = self.change_detector.check(file_path, cached_state)
+        if is_changed:
+            return None
+        if cached is None:
+            cached = (self.cache_store.get(file_path), cached_state)
+        if state != cached[1]:
+            # 内容は同じで stat だけが変わった
+            cached = (cached[0], state)
+            self._dirty.add(file_path)
+        self.validation_schema_cache[file_path] = cached
+        return cached
 
     def load_yaml_with_cache(self, file_path) -> tuple[dict, bool]:
-        is_changed = False
-        if file_path in self.validation_schema_cache:
-            cached_content, cached_timestamp = self.validation_schema_cache[file_path]
-            current_timestamp = os.path.getmtime(file_path)
-            if current_timestamp <= cached_timestamp:
-                return cached_content, is_changed
+        cached = self.get_cached(file_path)
+        if cached is not None:
+            return cached[0], False
 
         # read new content
-        is_changed = True
-        with open(file_path, encoding="utf-8") as file:
-            content = yaml.safe_load(file)
-            self.validation_schema_cache[file_path] = (content, os.path.getmtime(file_path))
-            return content, is_changed
+        content, state = parse_yaml_file(file_path)
+        self.validation_schema_cache[file_path] = (content, state)
+        self._dirty.add(file_path)
+        return content, True
+
+    def parse_changed_files(self, file_paths, jobs=None) -> dict:
+        """キャッシュが古いファイルだけを jobs 個のプロセスで並列にパースする"""
+        stale_paths = [path for path in file_paths if self.get_cached(path) is None]
+        if not jobs or jobs <= 1 or len(stale_paths) <= 1:
+            parsed = {path: parse_yaml_file(path) for path in stale_paths}
+        else:
+            chunksize = max(1, len(stale_paths) // (jobs * 4))
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                parsed = dict(zip(stale_paths, executor.map(parse_yaml_file, stale_paths, chunksize=chunksize)))
+        self.validation_schema_cache.update(parsed)
+        self._dirty.update(parsed)
+        return parsed
 
-    def analyze_directory_structure(self, root_dir):
+    def detect_changes(self, root_dir, jobs=None) -> ChangeSet:
+        """root_dir を走査し、変更されたファイルだけを読み直して ChangeSet を返す"""
+        yaml_files = scan_yaml_files(root_dir)
+        parsed = self.parse_changed_files(yaml_files, jobs)
+        cached_paths = self.cache_states.keys() | self.validation_schema_cache.keys()
+        change_set = self.change_detector.diff(root_dir, yaml_files, parsed.keys(), cached_paths)
+        for path in change_set.deleted:
+            self.validation_schema_cache.pop(path, None)
+            self.cache_states.pop(path, None)
+            self.validation_rules.pop(path, None)
+            self._dirty.discard(path)
+        self._deleted |= change_set.deleted
+        self.change_set = change_set
+        return change_set
+
+    def analyze_directory_structure(self, root_dir, jobs=None):
         hierarchies = []
-        changes = []
-        for root, dirs, files in os.walk(root_dir):
-            for name in files:
-                if name.endswith(".yaml"):
-                    # load
-                    full_path = os.path.abspath(os.path.join(root, name))
-                    validation_rule, is_changed = self.load_yaml_with_cache(full_path)
-                    if validation_rule:
-                        self.validation_rules[full_path] = validation_rule
-                    else:
-                        print(f"Failed to load {full_path}")
-
-                    # TODO: analyze hierarchy
-                    # hierarchy = self.read_hierarchy(file_path)
-                    # hierarchies.append(hierarchy)
-
-                    # changes
-                    if is_changed:
-                        changes.append(["File", full_path])
-                        change_dir = os.path.dirname(full_path)
-                        if not any(x[1] == change_dir for x in changes):
-                            changes.append(["Directory", change_dir])
+        change_set = self.detect_changes(root_dir, jobs)
+
+        # detect_changes の走査結果を使う (変更がなくても全ファイルの内容はキャッシュにある)
+        # ファイルの順序はパス順なので、並列にパースしてもマージ結果は決定的になる
+        for full_path in change_set.files:
+            validation_rule = self.validation_schema_cache[full_path][0]
+            if validation_rule:
+                self.validation_rules[full_path] = validation_rule
+            else:
+                print(f"Failed to load {full_path}")
+
+            # TODO: analyze hierarchy
+            # hierarchy = self.read_hierarchy(file_path)
+            # hierarchies.append(hierarchy)
 
         # TODO: analyze hierarchy
         # merged_hierarchy = self.merge_hierarchies(hierarchies)
 
+        changes = change_set.to_rows()
+
         # use full cache
         if len(changes) == 0:
             self.validation_schema = self.validation_schema_cache
@@ -80,11 +424,11 @@ class DirectoryAnalyzer:
         return self.validation_schema
 
     def save_cache(self):
-        data = []
-        for path, (content, timestamp) in self.validation_schema_cache.items():
-            data.append({"Path": path, "Content": yaml.dump(content), "Timestamp": timestamp})
-        df = pd.DataFrame(data)
-        df.to_csv(self.cache_file, index=False)
+        # 追加・変更されたエントリの書き込みと、削除されたエントリの削除だけを行う
+        self.cache_store.save({path: self.validation_schema_cache[path] for path in self._dirty}, self._deleted)
+        self.cache_states = self.cache_store.states()
+        self._dirty.clear()
+        self._deleted.clear()
 
     def save_changes_to_csv(self, changes, csv_file):
         with open(csv_file, "w", newline="") as file:
@@ -95,8 +439,8 @@ class DirectoryAnalyzer:
     def read_hierarchy(self, file_path):
         return self.hierarchy_reader.read_hierarchy(file_path)
 
-    def merge_hierarchies(self, hierarchies):
-        return self.hierarchy_merger.merge_hierarchies(hierarchies)
+    def merge_hierarchies(self, hierarchies, jobs=None):
+        return self.hierarchy_merger.merge_hierarchies(hierarchies, jobs)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,174 @@
+import os
+
+from yamlguardian.validator import (
+    CustomRuleCheck,
+    MaxCheck,
+    MaxLengthCheck,
+    MinCheck,
+    MinLengthCheck,
+    ProhibitedCheck,
+    RequiredCheck,
+    TypeCheck,
+    UsesCommonCheck,
+    compile_plan,
+    index_common_definitions,
+)
+
+# 表形式として読み込む入力の拡張子
+FRAME_EXTENSIONS = (".csv", ".jsonl")
+
+# チェッカー -> root_element のルール名
+RULE_NAMES = {
+    RequiredCheck: "required",
+    TypeCheck: "type",
+    MinCheck: "min",
+    MaxCheck: "max",
+    MinLengthCheck: "minlength",
+    MaxLengthCheck: "maxlength",
+    CustomRuleCheck: "custom_rules",
+    UsesCommonCheck: "uses_common",
+    ProhibitedCheck: "prohibited",
+}
+
+
+def is_frame_file(path) -> bool:
+    return os.path.isfile(path) and os.path.splitext(path)[1].lower() in FRAME_EXTENSIONS
+
+
+def frame_dtypes(plan) -> dict:
+    """プランの型のチェックから read_frame で読み込む列の dtype を決める
+
+    数字だけの文字列 (郵便番号など) が整数として読み込まれて先頭の 0 が落ちないよう、
+    type: string の列は文字列として読み込む。
+    """
+    return {check.name: "string" for check in plan if isinstance(check, TypeCheck) and check.expected_type is str}
+
+
+def read_frame(path, plan=None):
+    """CSV / JSONL (1 行 1 レコード) を DataFrame に読み込む
+
+    欠損値を含む整数列が float にならないよう、pandas の nullable な型で読み込む。
+    plan を渡すと列の dtype をスキーマの型に合わせる (frame_dtypes を参照)。
+    """
+    import pandas as pd
+
+    dtype = frame_dtypes(plan) if plan is not None else None
+    if os.path.splitext(path)[1].lower() == ".jsonl":
+        return pd.read_json(path, lines=True, dtype=dtype, dtype_backend="numpy_nullable")
+    return pd.read_csv(path, dtype=dtype, dtype_backend="numpy_nullable")
+
+
+def _values(column, missing) -> list:
+    """列を Python の値のリストにする (欠損値は None)"""
+    values = column.astype(object).tolist()
+    for i in missing.nonzero()[0]:
+        values[i] = None
+    return values
+
+
+def _value_mask(column, missing, passes):
+    """列の値ごとに passes を呼んで不合格の行のマスクを作る (型が混在した列など、ベクトル化できない場合)"""
+    import numpy as np
+
+    return ~np.fromiter((bool(passes(value)) for value in _values(column, missing)), dtype=bool, count=len(column))
+
+
+def _is_string(column) -> bool:
+    import pandas as pd
+
+    return isinstance(column.dtype, pd.StringDtype)
+
+
+def _is_numeric(column) -> bool:
+    return column.dtype.kind in "iuf"
+
+
+def _type_mask(check, column, missing):
+    import numpy as np
+
+    kind = column.dtype.kind
+    if _is_string(column):
+        matches = check.expected_type is str
+    elif kind in "iub":
+        # bool も int のサブクラスなので integer に合格する (dict の検証と同じ)
+        matches = check.expected_type is int
+    elif kind == "f":
+        matches = False
+    else:
+        return _value_mask(column, missing, lambda value: isinstance(value, check.expected_type))
+    # 欠損値は要素がない (data.get が None) ので型のチェックに不合格になる
+    return missing.copy() if matches else np.ones(len(column), dtype=bool)
+
+
+def _bound_mask(check, column, missing):
+    import numpy as np
+
+    if isinstance(check, (MinCheck, MaxCheck)):
+        if _is_numeric(column):
+            failed = column < check.bound if isinstance(check, MinCheck) else column > check.bound
+            return failed.to_numpy(dtype=bool, na_value=False)
+        if column.dtype.kind == "b" or _is_string(column):
+            return np.zeros(len(column), dtype=bool)
+    else:
+        if _is_string(column):
+            lengths = column.str.len()
+            failed = lengths < check.bound if isinstance(check, MinLengthCheck) else lengths > check.bound
+            return failed.to_numpy(dtype=bool, na_value=False)
+        if column.dtype.kind in "iufb":
+            return np.zeros(len(column), dtype=bool)
+    return _value_mask(column, missing, check.passes)
+
+
+def check_mask(check, df):
+    """1 つのチェッカーに不合格の行を表す bool の配列を返す"""
+    import numpy as np
+
+    if isinstance(check, UsesCommonCheck):
+        return np.ones(len(df), dtype=bool)
+    if check.name not in df.columns:
+        # 列がない場合はすべての行で要素が存在しないので、結果は行によらない
+        return np.full(len(df), bool(check({})), dtype=bool)
+    column = df[check.name]
+    missing = column.isna().to_numpy(dtype=bool)
+    if isinstance(check, RequiredCheck):
+        return missing
+    if isinstance(check, ProhibitedCheck):
+        return ~missing
+    if isinstance(check, TypeCheck):
+        return _type_mask(check, column, missing)
+    if isinstance(check, (MinCheck, MaxCheck, MinLengthCheck, MaxLengthCheck)):
+        return _bound_mask(check, column, missing)
+    # custom_rules は任意の関数なので値ごとに呼ぶ
+    return _value_mask(column, missing, lambda value: not check({} if value is None else {check.name: value}))
+
+
+def validate_frame_plan(df, plan) -> list[dict]:
+    """コンパイル済みのプランで DataFrame の各行を検証し、不合格だったチェックごとの結果を返す
+
+    結果はプランの順の {"name", "rule", "message", "rows"} のリストで、rows は不合格の行の index。
+    欠損値 (None / NaN / pd.NA) はその要素がないものとして扱う。
+    """
+    failures = []
+    for check in plan:
+        mask = check_mask(check, df)
+        if mask.any():
+            failures.append(
+                {
+                    "name": check.name,
+                    "rule": RULE_NAMES.get(type(check), type(check).__name__),
+                    "message": check.message,
+                    "rows": df.index[mask].tolist(),
+                }
+            )
+    return failures
+
+
+def validate_frame(df, schema, common_definitions=None, common_index=None) -> list[dict]:
+    """DataFrame の各行 (レコード) をスキーマの root_element のルールで列ごとにまとめて検証する
+
+    各行を dict にして Validator.validate で検証した場合と同じチェックを、列単位の
+    pandas / NumPy の演算で行う (結果の形式は validate_frame_plan を参照)。
+    """
+    if common_index is None:
+        common_index = index_common_definitions(common_definitions)
+    return validate_frame_plan(df, compile_plan(schema, common_index))
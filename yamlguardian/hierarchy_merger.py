@@ -1,18 +1,102 @@
-class HierarchyMerger:
-    def merge_hierarchies(self, hierarchies):
-        merged_hierarchy = {}
-        for hierarchy in hierarchies:
-            self._merge_dicts(merged_hierarchy, hierarchy)
-        return merged_hierarchy
-
-    def _merge_dicts(self, dict1, dict2):
-        for key, value in dict2.items():
-            if key in dict1:
-                if isinstance(dict1[key], dict) and isinstance(value, dict):
-                    self._merge_dicts(dict1[key], value)
-                elif isinstance(dict1[key], list) and isinstance(value, list):
-                    dict1[key].extend(value)
-                else:
-                    dict1[key] = value
+class _Node:
+    """マージ途中の値
+
+    value はマージで新しく作った dict / list か、左側の値を置き換えた値。
+    ツリー状にマージするときは途中の結果をさらに左側の結果とマージするため、
+    置き換えたこと (reset) を残しておかないと、1 つずつ順にマージした結果と一致しない。
+    """
+
+    __slots__ = ("value", "reset")
+
+    def __init__(self, value, reset=False):
+        self.value = value
+        self.reset = reset
+
+
+def _unwrap(value):
+    return (value.value, value.reset) if isinstance(value, _Node) else (value, False)
+
+
+def merge_pair(left, right):
+    """2 つの階層 (またはマージ途中の結果) をマージした途中の結果を返す
+
+    入力は変更せず、変更するパス上の dict だけを複製する (変更しない部分木は入力と共有する)。
+    dict 同士は再帰的にマージし、list 同士は連結し、それ以外は右側の値で置き換える。
+    """
+    merged = dict(_unwrap(left)[0])
+    stack = [(merged, _unwrap(right)[0])]
+    while stack:
+        target, source = stack.pop()
+        for key, value in source.items():
+            if key not in target or (isinstance(value, _Node) and value.reset):
+                target[key] = value
+                continue
+            base, reset = _unwrap(target[key])
+            value = _unwrap(value)[0]
+            if isinstance(base, dict) and isinstance(value, dict):
+                node = dict(base)
+                stack.append((node, value))
+            elif isinstance(base, list) and isinstance(value, list):
+                node = base + value
             else:
-                dict1[key] = value
+                # dict / list は、より左側の値ともマージしないよう印を付けて置き換える
+                target[key] = _Node(value, reset=True) if isinstance(value, (dict, list)) else value
+                continue
+            target[key] = _Node(node, reset)
+    return _Node(merged)
+
+
+def reduce_hierarchies(hierarchies):
+    """隣同士を組にしてマージしていくツリー状のリダクション (結果はマージ途中の形)"""
+    level = list(hierarchies)
+    if not level:
+        return _Node({})
+    while len(level) > 1:
+        paired = [merge_pair(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            paired.append(level[-1])
+        level = paired
+    return level[0]
+
+
+def finalize(merged) -> dict:
+    """マージ途中の結果から印を外して通常の dict にする"""
+    result, _ = _unwrap(merged)
+    if not isinstance(merged, _Node):
+        # 入力の階層そのもの (マージしていない) は複製して返す
+        return dict(result)
+    stack = [result]
+    while stack:
+        node = stack.pop()
+        for key, value in node.items():
+            if isinstance(value, _Node):
+                # 新しく作った dict の中だけを書き換える (入力の dict は _Node を含まない)
+                node[key] = value.value
+                if isinstance(value.value, dict):
+                    stack.append(value.value)
+    return result
+
+
+class HierarchyMerger:
+    def __init__(self, jobs=None):
+        self.jobs = jobs
+
+    def merge_hierarchies(self, hierarchies, jobs=None):
+        """階層を先頭から順にマージした結果を返す (後ろの階層の値が優先される)
+
+        入力は変更しない。結果は変更しなかった部分木を入力と共有するため、
+        結果を書き換える場合は copy.deepcopy すること。
+        jobs が 2 以上なら、階層を jobs 個に分けてプロセスごとにマージし、その結果をマージする。
+        """
+        hierarchies = list(hierarchies)
+        jobs = jobs or self.jobs
+        if not jobs or jobs <= 1 or len(hierarchies) <= jobs:
+            return finalize(reduce_hierarchies(hierarchies))
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        size = -(-len(hierarchies) // jobs)
+        chunks = [hierarchies[i : i + size] for i in range(0, len(hierarchies), size)]
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            partials = list(executor.map(reduce_hierarchies, chunks))
+        return finalize(reduce_hierarchies(partials))
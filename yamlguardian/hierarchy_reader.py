@@ -1,8 +1,12 @@
-import yaml
+from yamlguardian import yaml_loader
+from yamlguardian.yaml_stream import iter_yaml_documents
 
 
 class HierarchyReader:
     def read_hierarchy(self, file_path):
-        with open(file_path, encoding="utf-8") as file:
-            hierarchy = yaml.safe_load(file)
-        return hierarchy
+        return yaml_loader.load_file(file_path)
+
+    def iter_hierarchies(self, file_path):
+        """マルチドキュメント YAML の各ドキュメントを順に返す"""
+        for _, _, hierarchy in iter_yaml_documents(file_path):
+            yield hierarchy
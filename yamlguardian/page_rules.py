@@ -0,0 +1,277 @@
+import os
+import threading
+
+from yamlguardian import yaml_loader
+from yamlguardian.rule_watcher import active_watcher, compile_rule, is_common_definitions
+from yamlguardian.validator import index_common_definitions
+
+# rule_config の階層: <rule_dir>/common_definitions/ と <rule_dir>/page_definitions/<page>/
+COMMON_DEFINITIONS_DIR = "common_definitions"
+PAGE_DEFINITIONS_DIR = "page_definitions"
+
+
+def resolve_page_dir(page, rule_dir=None) -> str:
+    """ページ名 (rule_dir/page_definitions/<page>) またはページ定義のディレクトリを絶対パスにする"""
+    if rule_dir:
+        page_dir = os.path.join(rule_dir, PAGE_DEFINITIONS_DIR, page)
+        if os.path.isdir(page_dir):
+            return os.path.abspath(page_dir)
+    if os.path.isdir(page):
+        return os.path.abspath(page)
+    raise ValueError(f"ページ定義が見つかりません: {page}")
+
+
+def common_definitions_dir(page_dir) -> str:
+    """page_definitions/<page> に対応する common_definitions ディレクトリ"""
+    return os.path.join(os.path.dirname(os.path.dirname(page_dir)), COMMON_DEFINITIONS_DIR)
+
+
+def scan_definitions(directory) -> tuple[list, list]:
+    """directory 配下の YAML ファイルとディレクトリをパス順に返す (ディレクトリがなければ空)"""
+    files, dirs = [], []
+    for root, subdirs, names in os.walk(directory):
+        subdirs.sort()
+        dirs.append(root)
+        files.extend(os.path.join(root, name) for name in sorted(names) if name.endswith(".yaml"))
+    return files, dirs
+
+
+def stat_signature(paths) -> tuple:
+    """paths の (mtime, size) を並べたシグネチャ (存在しないパスは None)
+
+    ディレクトリの mtime はファイルの追加・削除・リネームで変わるため、ディレクトリも含めて
+    stat するだけで、一覧を取り直さずに変更を検出できる。
+    """
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            signature.append(None)
+        else:
+            signature.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def _names(value) -> set:
+    if isinstance(value, str):
+        return {value}
+    if isinstance(value, list):
+        return {item for item in value if isinstance(item, str)}
+    return set()
+
+
+def definition_targets(content):
+    """定義が対象とするドキュメントの (name の集合, type の集合) を返す (すべてに適用する定義は None)
+
+    targets を宣言した定義はその name に、root_element を持つ定義はその name (name がなければ type) に、
+    root_element_relations はリレーションの source に適用する。
+    """
+    if not isinstance(content, dict):
+        return None
+    if "targets" in content:
+        return _names(content["targets"]), set()
+    root_element = content.get("root_element")
+    if isinstance(root_element, dict):
+        if isinstance(root_element.get("name"), str):
+            return {root_element["name"]}, set()
+        if isinstance(root_element.get("type"), str):
+            return set(), {root_element["type"]}
+    relations = content.get("root_element_relations")
+    if isinstance(relations, list):
+        sources = {relation.get("source") for relation in relations if isinstance(relation, dict)}
+        return {source for source in sources if isinstance(source, str)}, set()
+    return None
+
+
+def document_discriminators(document) -> tuple:
+    """ドキュメントの root_element の (name, type) を返す (ないものは None)"""
+    root_element = document.get("root_element") if isinstance(document, dict) else None
+    if not isinstance(root_element, dict):
+        return None, None
+    name, element_type = root_element.get("name"), root_element.get("type")
+    return (name if isinstance(name, str) else None), (element_type if isinstance(element_type, str) else None)
+
+
+def merge_common_definitions(*definitions) -> dict:
+    """共通定義をまとめる (同名の要素は先に渡した共通定義が優先される)"""
+    common_elements = []
+    for common_definitions in definitions:
+        for content in common_definitions.values():
+            common_elements.extend(content["common_elements"] or [])
+    return {"common_elements": common_elements}
+
+
+class PageRules:
+    """1 ページ分の有効なルールセット
+
+    common_definitions/ の共通定義に page_definitions/<page>/ の定義を重ねたもの。
+    ページ内の共通定義 (common_elements) は同名の共通要素より優先される。
+    root_element を持つ定義は Validator に、それ以外の定義は JSON Schema として
+    構築時にコンパイルするため、検証はコンパイル済みのルールを実行するだけになる。
+    どの定義をドキュメントに適用するかは、root_element の name / type から引く索引で決める。
+    """
+
+    def __init__(self, page_dir, definitions, common_definitions, signature=None, watched_paths=()):
+        self.page_dir = page_dir
+        self.definitions = definitions
+        self.common_definitions = common_definitions
+        self.common_index = index_common_definitions(common_definitions)
+        self.signature = signature
+        self.watched_paths = tuple(watched_paths)
+        self.validators = {}
+        self.json_schemas = {}
+        self._json_validators = {}
+        for path, content in definitions.items():
+            validator = compile_rule(content, common_definitions, self.common_index)
+            if validator is not None:
+                self.validators[path] = validator
+            elif isinstance(content, dict) and not is_common_definitions(content):
+                self.json_schemas[path] = content
+        self.index_definitions()
+
+    def index_definitions(self):
+        """name / type -> 定義のパスの索引と、すべてのドキュメントに適用する定義の一覧を作る"""
+        self.by_name = {}
+        self.by_type = {}
+        self.generic = []
+        for path in self.validators.keys() | self.json_schemas.keys():
+            targets = definition_targets(self.definitions[path])
+            if targets is None:
+                self.generic.append(path)
+                continue
+            names, types = targets
+            for name in names:
+                self.by_name.setdefault(name, []).append(path)
+            for element_type in types:
+                self.by_type.setdefault(element_type, []).append(path)
+        self._order = {path: i for i, path in enumerate(self.definitions)}
+        self._routes = {}
+
+    def applicable(self, document) -> list[str]:
+        """document に適用する定義のパスを定義の順に返す
+
+        root_element の name / type を持たないドキュメントには、振り分けられないためすべての定義を適用する。
+        """
+        name, element_type = document_discriminators(document)
+        if name is None and element_type is None:
+            return self._route(None)
+        # 索引にない name / type は同じ経路になるので、キャッシュのキーは索引の大きさで抑えられる
+        key = (name if name in self.by_name else None, element_type if element_type in self.by_type else None)
+        return self._route(key)
+
+    def _route(self, key):
+        paths = self._routes.get(key)
+        if paths is None:
+            if key is None:
+                selected = self.validators.keys() | self.json_schemas.keys()
+            else:
+                name, element_type = key
+                selected = set(self.generic)
+                selected.update(self.by_name.get(name, ()))
+                selected.update(self.by_type.get(element_type, ()))
+            paths = self._routes[key] = sorted(selected, key=self._order.__getitem__)
+        return paths
+
+    def validate_definition(self, path, page_data, max_errors=None) -> list[str]:
+        """1 つの定義で page_data を検証し、エラーメッセージのリストを返す"""
+        from yamlguardian.validate import json_schema_validators
+
+        validator = self.validators.get(path)
+        if validator is not None:
+            return validator.validate(page_data, max_errors)
+        schema = self.json_schemas.get(path)
+        if schema is None:
+            return []
+        json_validator = self._json_validators.get(path)
+        if json_validator is None:
+            json_validator = self._json_validators[path] = json_schema_validators.register(schema)
+        errors = []
+        for error in json_validator.iter_errors(page_data):
+            errors.append(str(error))
+            if max_errors is not None and len(errors) >= max_errors:
+                break
+        return errors
+
+    def release(self):
+        """キャッシュから外すときに、登録した JSON Schema のバリデータを解放する"""
+        from yamlguardian.validate import json_schema_validators
+
+        for schema in self.json_schemas.values():
+            json_schema_validators.unregister(schema)
+
+
+def load_definitions(paths) -> dict:
+    return {path: yaml_loader.load_file(path) for path in paths}
+
+
+def build_page_rules(page_dir) -> PageRules:
+    """page_dir とその common_definitions を読み込んでページのルールセットを作る"""
+    common_dir = common_definitions_dir(page_dir)
+    watcher = active_watcher(page_dir)
+    if watcher is not None:
+        # 監視中のディレクトリはメモリ上のルールセットから作る (ファイルは読まない)
+        rule_set = watcher.rule_set
+        definitions = rule_set.rules_under(page_dir)
+        common = rule_set.rules_under(common_dir)
+        signature = ("watch", id(watcher), rule_set.version)
+        watched_paths = ()
+    else:
+        page_files, page_dirs = scan_definitions(page_dir)
+        common_files, common_dirs = scan_definitions(common_dir)
+        watched_paths = [common_dir, *common_dirs, *common_files, *page_dirs, *page_files]
+        signature = stat_signature(watched_paths)
+        definitions = load_definitions(page_files)
+        common = load_definitions(common_files)
+    page_common = {path: content for path, content in definitions.items() if is_common_definitions(content)}
+    common = {path: content for path, content in common.items() if is_common_definitions(content)}
+    common_definitions = merge_common_definitions(page_common, common)
+    return PageRules(page_dir, definitions, common_definitions, signature, watched_paths)
+
+
+class PageRuleCache:
+    """ページごとの有効なルールセットのキャッシュ
+
+    get() は記録したファイルとディレクトリを stat するだけで鮮度を確かめ、
+    mtime/size が変わったページだけを読み直してコンパイルする。
+    """
+
+    def __init__(self):
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def get(self, page_dir) -> PageRules:
+        key = os.path.abspath(page_dir)
+        page_rules = self._pages.get(key)
+        if page_rules is not None and page_rules.signature == self._signature(key, page_rules):
+            return page_rules
+        new_page_rules = build_page_rules(key)
+        with self._lock:
+            self._pages[key] = new_page_rules
+        if page_rules is not None:
+            page_rules.release()
+        return new_page_rules
+
+    def _signature(self, page_dir, page_rules):
+        watcher = active_watcher(page_dir)
+        if watcher is not None:
+            return ("watch", id(watcher), watcher.version)
+        return stat_signature(page_rules.watched_paths)
+
+    def invalidate(self, page_dir=None):
+        with self._lock:
+            if page_dir is None:
+                pages = list(self._pages.values())
+                self._pages.clear()
+            else:
+                pages = [self._pages.pop(os.path.abspath(page_dir), None)]
+        for page_rules in pages:
+            if page_rules is not None:
+                page_rules.release()
+
+    def __len__(self):
+        return len(self._pages)
+
+
+# YamlGuardian.validate_page が共有するキャッシュ
+page_rule_cache = PageRuleCache()
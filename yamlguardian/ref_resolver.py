@@ -0,0 +1,149 @@
+import copy
+from urllib.parse import unquote
+
+# $ref の解決方法
+#   copy: 参照ごとに参照先を複製する (jsonref_to_dict と同じ形。参照の多いスキーマでは指数的に大きくなる)
+#   shared: 参照先を 1 つのオブジェクトとして共有する (メモリ上の大きさは元のスキーマと同程度)
+#   defs: 参照を展開せず、ローカルの $defs への $ref として出力する (循環参照も表現できる)
+COPY = "copy"
+SHARED = "shared"
+DEFS = "defs"
+RESOLVE_MODES = (COPY, SHARED, DEFS)
+
+# defs モードでそのまま残す参照先
+DEFS_PREFIXES = ("#/$defs/", "#/definitions/")
+
+
+class RefResolver:
+    """JSON Schema の $ref をメモリ上の dict のまま解決する
+
+    ローカル参照 ("#/$defs/name" などの JSON Pointer) だけを解決し、外部参照は {} にする。
+    解決した参照先は $ref ごとにメモ化するため、同じ定義を何度参照しても一度しか辿らない。
+    copy / shared モードでは循環参照を ValueError にする。
+    """
+
+    def __init__(self, document, mode=SHARED):
+        if mode not in RESOLVE_MODES:
+            raise ValueError(f"不明な解決モードです: {mode} ({', '.join(RESOLVE_MODES)} のいずれか)")
+        self.document = document
+        self.mode = mode
+        self._resolved = {}
+        self._nodes = {}
+        self._resolving = []
+        self._hoisted = {}
+
+    def resolve(self, node=None):
+        """node (省略時はドキュメント全体) の $ref を解決した値を返す"""
+        if node is not None:
+            return self._resolve(node)
+        resolved = self._resolve(self.document)
+        if self._hoisted and isinstance(resolved, dict):
+            resolved["$defs"] = {**resolved.get("$defs", {}), **self._hoisted}
+        return resolved
+
+    def _resolve(self, node):
+        if not isinstance(node, (dict, list)):
+            return node
+        # 同じ元オブジェクト ($defs 内の定義とその参照先など) は同じ解決結果を共有する
+        cached = self._nodes.get(id(node))
+        if cached is not None and cached[0] is node:
+            return cached[1]
+        if isinstance(node, list):
+            resolved = [self._resolve(value) for value in node]
+        else:
+            ref = node.get("$ref")
+            if isinstance(ref, str) and self.mode == DEFS:
+                resolved = self._reference(node, ref)
+            elif isinstance(ref, str):
+                # jsonref と同じく、$ref を持つオブジェクトは参照先に置き換える
+                resolved = self.resolve_ref(ref)
+                return copy.deepcopy(resolved) if self.mode == COPY else resolved
+            else:
+                resolved = {key: self._resolve(value) for key, value in node.items()}
+        self._nodes[id(node)] = (node, resolved)
+        return resolved
+
+    def resolve_ref(self, ref):
+        if ref in self._resolved:
+            return self._resolved[ref]
+        if not ref.startswith("#"):
+            # 外部参照は読み込まない
+            return {}
+        if ref in self._resolving:
+            chain = " -> ".join(self._resolving[self._resolving.index(ref) :] + [ref])
+            raise ValueError(f"$ref が循環しています: {chain}")
+        self._resolving.append(ref)
+        try:
+            resolved = self._resolve(self.lookup(ref))
+        finally:
+            self._resolving.pop()
+        self._resolved[ref] = resolved
+        return resolved
+
+    def _reference(self, node, ref):
+        """defs モード: $ref を残し、$defs 以外を指すものは $defs に移して参照し直す"""
+        if not ref.startswith("#"):
+            return {}
+        self.lookup(ref)
+        if ref == "#" or ref.startswith(DEFS_PREFIXES):
+            return {key: self._resolve(value) for key, value in node.items()}
+        if ref not in self._resolved:
+            name = self._hoist_name(ref)
+            # 先に参照先の名前を登録しておくので、循環していてもここで止まる
+            self._resolved[ref] = "#/$defs/" + name.replace("~", "~0")
+            self._hoisted[name] = self._resolve(self.lookup(ref))
+        return {"$ref": self._resolved[ref]}
+
+    def _hoist_name(self, ref):
+        name = unquote(ref[2:]).replace("~1", "/").replace("~0", "~").replace("/", "_")
+        existing = self.document.get("$defs", {}) if isinstance(self.document, dict) else {}
+        candidate, suffix = name, 1
+        while candidate in existing or candidate in self._hoisted:
+            suffix += 1
+            candidate = f"{name}_{suffix}"
+        self._hoisted[candidate] = None
+        return candidate
+
+    def lookup(self, ref):
+        """JSON Pointer ("#/a/b" 形式) が指す値を解決前のまま返す"""
+        node = self.document
+        pointer = unquote(ref[1:])
+        if not pointer:
+            return node
+        if not pointer.startswith("/"):
+            raise ValueError(f"$ref の形式が正しくありません: {ref}")
+        for token in pointer[1:].split("/"):
+            token = token.replace("~1", "/").replace("~0", "~")
+            try:
+                node = node[int(token)] if isinstance(node, list) else node[token]
+            except (KeyError, IndexError, ValueError, TypeError):
+                raise ValueError(f"$ref の参照先が見つかりません: {ref}") from None
+        return node
+
+
+def resolve_refs(schema, mode=SHARED) -> dict:
+    """schema の $ref をすべて解決した dict を返す (schema 自体は変更しない)"""
+    return RefResolver(schema, mode).resolve()
+
+
+def schema_size(schema) -> dict:
+    """スキーマの大きさを数える
+
+    unique_nodes はメモリ上の dict/list の数、expanded_nodes は共有を展開した (JSON に
+    書き出したときの) dict/list の数。展開後の数は共有を辿るだけで数え、実際には展開しない。
+    """
+    expanded = {}
+
+    def count(node):
+        if not isinstance(node, (dict, list)):
+            return 0
+        if id(node) not in expanded:
+            expanded[id(node)] = None
+            values = node.values() if isinstance(node, dict) else node
+            expanded[id(node)] = 1 + sum(count(value) for value in values)
+        elif expanded[id(node)] is None:
+            raise ValueError("スキーマに循環したオブジェクトがあります")
+        return expanded[id(node)]
+
+    expanded_nodes = count(schema)
+    return {"unique_nodes": len(expanded), "expanded_nodes": expanded_nodes}
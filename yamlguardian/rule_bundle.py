@@ -0,0 +1,179 @@
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import time
+
+from yamlguardian import yaml_loader
+from yamlguardian.change_detector import ChangeDetector
+from yamlguardian.rules import RuleManager
+
+# バンドルの形式: ヘッダー (MAGIC, 形式のバージョン, コンパイラのフィンガープリント) + RuleBundle の pickle
+#
+# バンドルは信頼できる入力として扱うこと。読み込みは pickle.loads なので、細工したバンドルは
+# 任意のコードを実行できる (自分で compile したバンドル以外は読み込まない)。
+BUNDLE_MAGIC = b"YGBUNDLE"
+BUNDLE_VERSION = 2
+BUNDLE_HEADER = struct.Struct("<8sI16s")
+
+_compiler_fingerprint = None
+
+
+def compiler_fingerprint() -> bytes:
+    """yamlguardian のモジュールのソースのハッシュ
+
+    バンドルはチェッカーなどのインスタンスをそのまま pickle するため、コンパイルしたコードが
+    変わったバンドルは (元ファイルが変わっていなくても) 古いものとして扱う。
+    """
+    global _compiler_fingerprint
+    if _compiler_fingerprint is None:
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        digest = hashlib.blake2b(digest_size=16)
+        for name in sorted(os.listdir(package_dir)):
+            if name.endswith(".py"):
+                digest.update(name.encode("utf-8") + b"\0")
+                with open(os.path.join(package_dir, name), "rb") as f:
+                    digest.update(f.read())
+        _compiler_fingerprint = digest.digest()
+    return _compiler_fingerprint
+
+
+class RuleBundle:
+    """compile サブコマンドが作るコンパイル済みのルール一式
+
+    YAML のパース、$defs への統合と参照の解決、検証プランのコンパイルを済ませた結果と、
+    元になったファイルの状態 (sources: path -> change_detector のファイル状態) を持つ。
+    """
+
+    def __init__(self, rule_dir=None, rule_set=None, json_schema=None, resolved_schema=None):
+        self.version = BUNDLE_VERSION
+        self.created_at = time.time()
+        self.rule_dir = rule_dir
+        self.rule_set = rule_set
+        # cli が openapi スキーマで検証する JSON Schema と、$ref を解決した統合スキーマ
+        self.json_schema = json_schema
+        self.resolved_schema = resolved_schema
+        # YamlGuardian 用のスキーマとコンパイル済みの RuleManager (schema_file を指定した場合)
+        self.schema_file = None
+        self.schema = None
+        self.relations = None
+        self.common_definitions = rule_set.common_definitions if rule_set else None
+        self.rule_manager = None
+        self.sources = {}
+        # バンドルをコンパイルしたコードのフィンガープリント (load_bundle がヘッダーから設定する)
+        self.compiled_by = None
+
+    @property
+    def common_index(self) -> dict:
+        if self.rule_manager is not None:
+            return self.rule_manager.common_index
+        return self.rule_set.common_index if self.rule_set else {}
+
+    @property
+    def schema_dict(self) -> dict:
+        return self.rule_set.schema_dict if self.rule_set else {}
+
+    def stale_sources(self) -> list[str]:
+        """作成後に追加・変更・削除された元ファイルを返す"""
+        from yamlguardian.directory_analyzer import scan_yaml_files
+
+        current = set(scan_yaml_files(self.rule_dir)) if self.rule_dir else set()
+        current |= {path for path in self.sources if not path.startswith(self._rule_prefix())}
+        detector = ChangeDetector()
+        stale = []
+        for path in sorted(current | self.sources.keys()):
+            state = self.sources.get(path)
+            if state is None or not os.path.isfile(path) or detector.check(path, state)[0]:
+                stale.append(path)
+        return stale
+
+    def compiler_changed(self) -> bool:
+        """今のコードと違うバージョンの yamlguardian でコンパイルされたか"""
+        return self.compiled_by != compiler_fingerprint()
+
+    def is_stale(self) -> bool:
+        return self.compiler_changed() or bool(self.stale_sources())
+
+    def _rule_prefix(self) -> str:
+        return self.rule_dir.rstrip(os.sep) + os.sep if self.rule_dir else "\0"
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(BUNDLE_HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, compiler_fingerprint()))
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+
+def load_bundle(path) -> RuleBundle:
+    """バンドルを mmap して読み込む (形式やバージョンが違う場合は ValueError)
+
+    バンドルは信頼できる入力であること (pickle.loads で読み込む)。別のバージョンの yamlguardian で
+    コンパイルしたバンドルは読み込めても compiler_changed() / is_stale() が True になる。
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        if len(mapped) < BUNDLE_HEADER.size:
+            raise ValueError(f"ルールバンドルではありません: {path}")
+        magic, version, fingerprint = BUNDLE_HEADER.unpack_from(mapped)
+        if magic != BUNDLE_MAGIC:
+            raise ValueError(f"ルールバンドルではありません: {path}")
+        if version != BUNDLE_VERSION:
+            raise ValueError(f"ルールバンドルの形式が古いため再作成してください (version {version}): {path}")
+        with memoryview(mapped) as view:
+            bundle = pickle.loads(view[BUNDLE_HEADER.size :])
+    bundle.compiled_by = fingerprint
+    return bundle
+
+
+def _load_source(path, sources):
+    from yamlguardian.directory_analyzer import parse_yaml_file
+
+    path = os.path.abspath(path)
+    try:
+        content, sources[path] = parse_yaml_file(path)
+    except yaml_loader.YAMLError as e:
+        raise ValueError(f"YAML読み込みエラー: {e}")
+    except FileNotFoundError:
+        raise ValueError(f"ファイルが見つかりません: {path}")
+    return content
+
+
+def compile_bundle(
+    rule_dir=None,
+    schema_file=None,
+    relations_file=None,
+    common_definitions_file=None,
+    title="test",
+    jobs=None,
+    resolve_mode="shared",
+) -> RuleBundle:
+    """ルールディレクトリと (任意の) YamlGuardian 用スキーマからバンドルを作る
+
+    resolved_schema は resolve_mode (ref_resolver を参照) で解決する。shared の場合も
+    pickle が共有を保つため、バンドルの大きさは展開後の大きさにならない。
+    """
+    bundle = RuleBundle()
+    if rule_dir:
+        from yamlguardian.directory_analyzer import DirectoryAnalyzer
+        from yamlguardian.json_schema_adapter import yaml_to_json_schema as rules_to_json_schema
+        from yamlguardian.rule_watcher import RuleSetWatcher
+        from yamlguardian.yaml_to_json_schema import yaml_schema_to_json_schema
+
+        analyzer = DirectoryAnalyzer()
+        rule_set = RuleSetWatcher(rule_dir, analyzer=analyzer, jobs=jobs).rule_set
+        bundle = RuleBundle(os.path.abspath(rule_dir), rule_set)
+        bundle.sources = {path: analyzer.validation_schema_cache[path][1] for path in rule_set.rules}
+        schema_dict = rule_set.schema_dict
+        bundle.json_schema = rules_to_json_schema(schema_dict, title)
+        bundle.resolved_schema = yaml_schema_to_json_schema(schema_dict, resolve_mode)
+
+    if schema_file:
+        bundle.schema_file = os.path.abspath(schema_file)
+        bundle.schema = _load_source(schema_file, bundle.sources)
+        if relations_file:
+            bundle.relations = _load_source(relations_file, bundle.sources)
+        if common_definitions_file:
+            bundle.common_definitions = _load_source(common_definitions_file, bundle.sources)
+        bundle.rule_manager = RuleManager(bundle.schema, bundle.relations, bundle.common_definitions)
+    return bundle
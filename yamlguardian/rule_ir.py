@@ -0,0 +1,500 @@
+import re
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable, Sized
+from operator import itemgetter
+
+from yamlguardian.validator import BoundCheck, ProhibitedCheck, RequiredCheck, TypeCheck, UsesCommonCheck
+
+# ルールの中間表現 (IR)
+#
+# root_element のプラン、Cerberus のスキーマ、JSON Schema をどれも RuleNode の木にコンパイルし、
+# 1 つの木にまとめて (RuleProgram)、ドキュメントを 1 回だけ辿って全ルールを評価する。
+# 木のルールはどれかのファミリー (ステージ名など) に属する。
+#
+# Cerberus と JSON Schema の IR は「合格」を判定するだけで、エラーメッセージは作らない。
+# IR で合格したファミリーはエンジンを実行せず、不合格のファミリーと IR にできなかったファミリー
+# (未対応のルールを含むもの) だけを元のエンジンで検証する。そのため報告されるエラーは
+# 元のエンジンのものと変わらない。IR の判定は保守的で、迷う場合は不合格にする。
+# root_element のプランは同じチェッカーのメッセージをそのまま使うので、IR でエラーまで求める。
+
+
+class UnsupportedRuleError(Exception):
+    """IR にできないルール (そのファミリーは元のエンジンで検証する)"""
+
+
+class RuleNode:
+    """ドキュメントの 1 つの値に適用するルール
+
+    checks: (family, predicate) のリスト。predicate(value) が False なら family は不合格
+    fields: キー -> 子の RuleNode (値が dict の場合だけ辿る)
+    required: 値が dict の場合に必須のキー (family, key)
+    closed: 値が dict の場合に許されるキーの集合 (family, keys)
+    mapping_only: 値が dict でなければ不合格になるファミリー
+    items: list の各要素に適用する RuleNode
+    messages: root_element のプランのチェック (index, key, test, message)。test(present, value) が
+        False ならエラー (値が dict の場合だけ評価する)
+    """
+
+    __slots__ = ("checks", "fields", "required", "closed", "mapping_only", "items", "messages")
+
+    def __init__(self):
+        self.checks = []
+        self.fields = {}
+        self.required = []
+        self.closed = []
+        self.mapping_only = set()
+        self.items = None
+        self.messages = []
+
+    def child(self, key) -> "RuleNode":
+        node = self.fields.get(key)
+        if node is None:
+            node = self.fields[key] = RuleNode()
+        return node
+
+    def items_node(self) -> "RuleNode":
+        if self.items is None:
+            self.items = RuleNode()
+        return self.items
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_integer(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _never(value) -> bool:
+    return False
+
+
+def _not_none(value) -> bool:
+    return value is not None
+
+
+def _strict_equal(one, two) -> bool:
+    """型まで一致する場合だけ等しいとする (1 と True、1 と 1.0 は等しくない)"""
+    stack = [(one, two)]
+    while stack:
+        one, two = stack.pop()
+        if type(one) is not type(two):
+            return False
+        if isinstance(one, dict):
+            if one.keys() != two.keys():
+                return False
+            stack.extend((one[key], two[key]) for key in one)
+        elif isinstance(one, list):
+            if len(one) != len(two):
+                return False
+            stack.extend(zip(one, two))
+        elif one != two:
+            return False
+    return True
+
+
+# JSON Schema の型 -> 判定 (jsonschema と同じく bool は数値に含めない)
+JSON_TYPES = {
+    "string": lambda value: isinstance(value, str),
+    "integer": _is_integer,
+    "number": _is_number,
+    "boolean": lambda value: isinstance(value, bool),
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+    "null": lambda value: value is None,
+}
+
+# jsonschema が検証に使うが IR では扱わないキーワード (含まれていればエンジンで検証する)
+JSON_UNSUPPORTED = frozenset(
+    (
+        "$ref",
+        "$dynamicRef",
+        "$recursiveRef",
+        "allOf",
+        "anyOf",
+        "oneOf",
+        "not",
+        "if",
+        "then",
+        "else",
+        "dependentRequired",
+        "dependentSchemas",
+        "dependencies",
+        "patternProperties",
+        "propertyNames",
+        "prefixItems",
+        "contains",
+        "minContains",
+        "maxContains",
+        "unevaluatedItems",
+        "unevaluatedProperties",
+        "additionalItems",
+        "multipleOf",
+        "minProperties",
+        "maxProperties",
+        "extends",
+        "disallow",
+        "divisibleBy",
+    )
+)
+
+
+def _type_predicate(types, type_names):
+    names = type_names if isinstance(type_names, list) else [type_names]
+    try:
+        predicates = tuple(types[name] for name in names)
+    except (KeyError, TypeError):
+        raise UnsupportedRuleError(f"type: {type_names}") from None
+    return lambda value: any(predicate(value) for predicate in predicates)
+
+
+def _number_bound(keyword, bound):
+    if not _is_number(bound):
+        # draft-04 の真偽値の exclusiveMinimum など
+        raise UnsupportedRuleError(f"{keyword}: {bound}")
+    compare = {
+        "minimum": lambda value: value >= bound,
+        "maximum": lambda value: value <= bound,
+        "exclusiveMinimum": lambda value: value > bound,
+        "exclusiveMaximum": lambda value: value < bound,
+    }[keyword]
+    return lambda value: not _is_number(value) or compare(value)
+
+
+def _length_bound(keyword, bound, value_type):
+    if not _is_integer(bound):
+        raise UnsupportedRuleError(f"{keyword}: {bound}")
+    if keyword.startswith("min"):
+        return lambda value: not isinstance(value, value_type) or len(value) >= bound
+    return lambda value: not isinstance(value, value_type) or len(value) <= bound
+
+
+def compile_json_schema(schema, family) -> RuleNode:
+    """JSON Schema を IR にコンパイルする (未対応のキーワードがあれば UnsupportedRuleError)
+
+    jsonschema と同じく未知のキーワードと注釈 (description など) は無視する。
+    スキーマ自体の妥当性はエンジンで確認済みであることを前提にする。
+    """
+    if isinstance(schema, dict) and any(draft in str(schema.get("$schema", "")) for draft in ("draft-03", "draft-04")):
+        raise UnsupportedRuleError("$schema")
+    root = RuleNode()
+    stack = [(schema, root)]
+    while stack:
+        schema, node = stack.pop()
+        if schema is True:
+            continue
+        if schema is False:
+            node.checks.append((family, _never))
+            continue
+        if not isinstance(schema, dict):
+            raise UnsupportedRuleError(f"schema: {schema!r}")
+        for keyword, value in schema.items():
+            if keyword in JSON_UNSUPPORTED or (keyword == "uniqueItems" and value):
+                raise UnsupportedRuleError(keyword)
+            if keyword == "type":
+                node.checks.append((family, _type_predicate(JSON_TYPES, value)))
+            elif keyword in ("enum", "const"):
+                members = value if keyword == "enum" else [value]
+                if not isinstance(members, list):
+                    raise UnsupportedRuleError(keyword)
+                node.checks.append(
+                    (family, lambda value, members=members: any(_strict_equal(value, m) for m in members))
+                )
+            elif keyword in ("minimum", "maximum", "exclusiveMinimum", "exclusiveMaximum"):
+                node.checks.append((family, _number_bound(keyword, value)))
+            elif keyword in ("minLength", "maxLength"):
+                node.checks.append((family, _length_bound(keyword, value, str)))
+            elif keyword in ("minItems", "maxItems"):
+                node.checks.append((family, _length_bound(keyword, value, list)))
+            elif keyword == "pattern":
+                pattern = re.compile(value)
+                node.checks.append(
+                    (family, lambda value, p=pattern: not isinstance(value, str) or bool(p.search(value)))
+                )
+            elif keyword == "required":
+                if not isinstance(value, list):
+                    raise UnsupportedRuleError("required")
+                node.required.extend((family, key) for key in value)
+            elif keyword == "properties":
+                if not isinstance(value, dict):
+                    raise UnsupportedRuleError("properties")
+                for key, subschema in value.items():
+                    stack.append((subschema, node.child(key)))
+            elif keyword == "additionalProperties":
+                if value is False:
+                    node.closed.append((family, frozenset(schema.get("properties") or ())))
+                elif value is not True and value != {}:
+                    raise UnsupportedRuleError("additionalProperties")
+            elif keyword == "items":
+                if not isinstance(value, (dict, bool)):
+                    raise UnsupportedRuleError("items")
+                stack.append((value, node.items_node()))
+    return root
+
+
+# Cerberus の型 -> 判定 (判定できる型だけ。bool は整数に含めない)
+CERBERUS_TYPES = {
+    "string": lambda value: isinstance(value, str),
+    "integer": _is_integer,
+    "float": lambda value: isinstance(value, float),
+    "number": _is_number,
+    "boolean": lambda value: isinstance(value, bool),
+    "dict": lambda value: isinstance(value, dict),
+    "list": lambda value: isinstance(value, list),
+}
+
+
+def _is_empty(value) -> bool:
+    return isinstance(value, Sized) and len(value) == 0
+
+
+def _cerberus_predicate(rule, value):
+    """Cerberus の 1 ルールの判定 (空の値は empty の扱いが絡むので不合格にする)"""
+    if rule == "allowed":
+        allowed = value
+
+        def predicate(value):
+            if _is_empty(value):
+                return False
+            if isinstance(value, Iterable) and not isinstance(value, str):
+                return all(item in allowed for item in value)
+            return value in allowed
+
+    elif rule in ("min", "max"):
+        bound = value
+
+        def predicate(value):
+            try:
+                return not (value < bound if rule == "min" else value > bound)
+            except TypeError:
+                return True
+
+    elif rule in ("minlength", "maxlength"):
+        bound = value
+
+        def predicate(value):
+            if not isinstance(value, Iterable):
+                return True
+            if _is_empty(value) or not isinstance(value, Sized):
+                return False
+            return len(value) >= bound if rule == "minlength" else len(value) <= bound
+
+    elif rule == "regex":
+        # Cerberus と同じく末尾に $ を補って先頭から照合する
+        pattern = re.compile(value if value.endswith("$") else value + "$")
+
+        def predicate(value):
+            if not isinstance(value, str):
+                return True
+            return bool(value) and bool(pattern.match(value))
+
+    elif rule == "empty":
+        empty = value
+
+        def predicate(value):
+            return bool(empty) or not _is_empty(value)
+
+    else:
+        raise UnsupportedRuleError(rule)
+    return predicate
+
+
+def _cerberus_fields(fields, node, family, closed=True):
+    if not isinstance(fields, dict):
+        raise UnsupportedRuleError(f"schema: {fields!r}")
+    if closed:
+        node.closed.append((family, frozenset(fields)))
+    for field, rules in fields.items():
+        if not isinstance(rules, dict):
+            raise UnsupportedRuleError(f"{field}: {rules!r}")
+        if rules.get("required"):
+            node.required.append((family, field))
+        _cerberus_rules(rules, node.child(field), family)
+
+
+def _cerberus_rules(rules, node, family):
+    if not rules.get("nullable", False):
+        node.checks.append((family, _not_none))
+    for rule, value in rules.items():
+        if rule in ("required", "nullable", "meta", "allow_unknown"):
+            continue
+        if rule == "type":
+            predicate = _type_predicate(CERBERUS_TYPES, value)
+        elif rule == "schema":
+            # schema の意味は値の型で変わるので、型が 1 つに決まっている場合だけ扱う
+            allow_unknown = rules.get("allow_unknown", False)
+            if rules.get("type") == "dict" and isinstance(allow_unknown, bool):
+                _cerberus_fields(value, node, family, closed=not allow_unknown)
+            elif rules.get("type") == "list" and isinstance(value, dict):
+                _cerberus_rules(value, node.items_node(), family)
+            else:
+                raise UnsupportedRuleError("schema")
+            continue
+        else:
+            predicate = _cerberus_predicate(rule, value)
+        # nullable の場合の None は他のルールを評価しない
+        node.checks.append((family, lambda value, predicate=predicate: value is None or predicate(value)))
+
+
+def compile_cerberus_schema(schema, family) -> RuleNode:
+    """Cerberus のスキーマ (フィールド名 -> ルール) を IR にコンパイルする (未対応のルールがあれば UnsupportedRuleError)
+
+    スキーマ自体の妥当性はエンジン (Cerberus) で確認済みであることを前提にする。
+    """
+    root = RuleNode()
+    # Cerberus は dict 以外のドキュメントを検証できない
+    root.mapping_only.add(family)
+    _cerberus_fields(schema, root, family)
+    return root
+
+
+def _present(present, value) -> bool:
+    return present
+
+
+def _absent(present, value) -> bool:
+    return not present
+
+
+def _undefined(present, value) -> bool:
+    return False
+
+
+def _instance_of(expected_type):
+    return lambda present, value: isinstance(value, expected_type)
+
+
+def _value_test(passes):
+    return lambda present, value: passes(value)
+
+
+def compile_plan(plan, family) -> RuleNode:
+    """root_element のプラン (validator.compile_plan) を IR にコンパイルする
+
+    custom_rules のように任意の関数を呼ぶチェックを含む場合は UnsupportedRuleError。
+    """
+    root = RuleNode()
+    # チェッカーは dict 以外のデータでは例外になりうるので、その場合はプランをそのまま実行する
+    root.mapping_only.add(family)
+    for index, check in enumerate(plan):
+        check_type = type(check)
+        if check_type is RequiredCheck:
+            test = _present
+        elif check_type is TypeCheck:
+            test = _instance_of(check.expected_type)
+        elif check_type is UsesCommonCheck:
+            test = _undefined
+        elif check_type is ProhibitedCheck:
+            test = _absent
+        elif isinstance(check, BoundCheck):
+            test = _value_test(check.passes)
+        else:
+            raise UnsupportedRuleError(check_type.__name__)
+        root.messages.append((index, check.name, test, check.message))
+    return root
+
+
+def merge_nodes(target, source):
+    """source の木を target の木に重ねる (source は変更しない)"""
+    stack = [(target, source)]
+    while stack:
+        target, source = stack.pop()
+        target.checks.extend(source.checks)
+        target.required.extend(source.required)
+        target.closed.extend(source.closed)
+        target.mapping_only |= source.mapping_only
+        target.messages.extend(source.messages)
+        for key, child in source.fields.items():
+            stack.append((target.child(key), child))
+        if source.items is not None:
+            stack.append((target.items_node(), source.items))
+
+
+class RuleOutcome:
+    """RuleProgram.evaluate の結果
+
+    failed: IR で不合格、または IR にできなかったファミリー (エンジンで検証する)
+    passed: IR で合格したファミリー
+    errors: root_element のプランのエラーメッセージ (プランの順)
+    """
+
+    __slots__ = ("failed", "passed", "errors")
+
+    def __init__(self, failed, passed, errors):
+        self.failed = failed
+        self.passed = passed
+        self.errors = errors
+
+
+class RuleProgram:
+    """ファミリーごとの IR の木を 1 つにまとめたもの
+
+    trees は family -> RuleNode (IR にできなかったファミリーは None)。
+    """
+
+    def __init__(self, trees):
+        self.families = frozenset(trees)
+        self.opaque = frozenset(family for family, tree in trees.items() if tree is None)
+        self.root = RuleNode()
+        for tree in trees.values():
+            if tree is not None:
+                merge_nodes(self.root, tree)
+        self.root.messages.sort(key=itemgetter(0))
+
+    def evaluate(self, document) -> RuleOutcome:
+        """document を 1 回だけ辿り、各ノードでそこに付いた全ファミリーのルールを評価する"""
+        failed = set(self.opaque)
+        errors = []
+        stack = [(self.root, document)]
+        while stack and len(failed) < len(self.families):
+            node, value = stack.pop()
+            for family, predicate in node.checks:
+                if family not in failed and not predicate(value):
+                    failed.add(family)
+            if not isinstance(value, dict):
+                failed |= node.mapping_only
+                if node.items is not None and isinstance(value, list):
+                    stack.extend((node.items, item) for item in value)
+                continue
+            for _, key, test, message in node.messages:
+                if not test(key in value, value.get(key)):
+                    errors.append(message)
+            for family, key in node.required:
+                if key not in value:
+                    failed.add(family)
+            for family, keys in node.closed:
+                if family not in failed and not keys.issuperset(value):
+                    failed.add(family)
+            for key, child in node.fields.items():
+                if key in value:
+                    stack.append((child, value[key]))
+        return RuleOutcome(failed, self.families - failed, errors)
+
+
+class RuleProgramCache:
+    """IR の木の組み合わせごとに RuleProgram をキャッシュする (木が同じオブジェクトの間は再利用する)"""
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self._programs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, trees) -> RuleProgram:
+        key = tuple((family, id(tree)) for family, tree in sorted(trees.items()))
+        with self._lock:
+            cached = self._programs.get(key)
+            if cached is not None and all(trees[family] is tree for family, tree in cached[0].items()):
+                self._programs.move_to_end(key)
+                return cached[1]
+        program = RuleProgram(trees)
+        with self._lock:
+            # 木を保持しておくので、id が別の木に再利用されることはない
+            self._programs[key] = (dict(trees), program)
+            while len(self._programs) > self.maxsize:
+                self._programs.popitem(last=False)
+        return program
+
+
+rule_programs = RuleProgramCache()
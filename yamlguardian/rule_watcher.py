@@ -0,0 +1,349 @@
+import os
+import select
+import struct
+import sys
+import threading
+
+from yamlguardian.change_detector import ChangeSet
+from yamlguardian.validator import Validator, index_common_definitions, root_elements
+
+# inotify のイベントマスク (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    import ctypes
+    import ctypes.util
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, "inotify_init1"):
+        return None
+    return libc
+
+
+class InotifyWatch:
+    """inotify で root_dir 配下のディレクトリを監視する
+
+    イベントは再走査のきっかけとしてだけ使う。何が変わったかは DirectoryAnalyzer の
+    変更検出が判定するため、イベントの取りこぼしや重複があっても結果は変わらない。
+    """
+
+    def __init__(self, root_dir, libc=None):
+        self.libc = libc or _load_libc()
+        if self.libc is None:
+            raise OSError("inotify はこのプラットフォームでは使えません")
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            import ctypes
+
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._watches = {}
+        self.add_tree(root_dir)
+
+    def add_tree(self, root_dir):
+        for directory, _, _ in os.walk(root_dir):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd >= 0:
+                self._watches[wd] = directory
+
+    def _read_events(self):
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset : offset + length].rstrip(b"\0")
+                offset += length
+                events.append((wd, mask, os.fsdecode(name)))
+
+    def wait(self, timeout, settle=0.05) -> bool:
+        """イベントを最大 timeout 秒待つ。届いたら settle 秒静かになるまでまとめて読み捨てる"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        while ready:
+            for wd, mask, name in self._read_events():
+                if mask & IN_IGNORED:
+                    self._watches.pop(wd, None)
+                elif mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and wd in self._watches:
+                    # 新しいディレクトリ配下も監視する
+                    self.add_tree(os.path.join(self._watches[wd], name))
+            ready, _, _ = select.select([self.fd], [], [], settle)
+        return True
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatch:
+    """inotify が使えない環境向け。timeout ごとに再走査を促す"""
+
+    def __init__(self, root_dir=None):
+        self._closed = threading.Event()
+
+    def wait(self, timeout) -> bool:
+        return not self._closed.wait(timeout)
+
+    def close(self):
+        self._closed.set()
+
+
+def open_watch(root_dir, use_inotify=True):
+    if use_inotify:
+        try:
+            return InotifyWatch(root_dir)
+        except OSError:
+            pass
+    return PollingWatch(root_dir)
+
+
+def is_common_definitions(content) -> bool:
+    return isinstance(content, dict) and "common_elements" in content
+
+
+def uses_common(content) -> bool:
+    return any(isinstance(element, dict) and element.get("uses_common") for element in root_elements(content))
+
+
+def compile_rule(content, common_definitions=None, common_index=None):
+    """root_element を持つルールファイルを Validator にコンパイルする (持たない場合は None)"""
+    if not isinstance(content, dict) or "root_element" not in content:
+        return None
+    return Validator(content, common_definitions, common_index)
+
+
+def relative_schema_dict(rules, root_dir) -> dict:
+    """ディレクトリから読み込んだルール (フルパス -> 内容) を root_dir からの相対パス (拡張子なし) をキーにする
+
+    別のサブディレクトリにある同じ名前のファイルが上書きし合わないよう、ファイル名だけをキーにはしない。
+    空のファイルは含めない (cli の schema_dict 形式)。
+    """
+    schema_dict = {}
+    for path, content in sorted(rules.items()):
+        if content:
+            name = os.path.splitext(os.path.relpath(path, root_dir))[0]
+            schema_dict[name.replace(os.sep, "/")] = content
+    return schema_dict
+
+
+class RuleSet:
+    """ある時点のルールセットのスナップショット (更新時は新しいインスタンスに置き換わる)"""
+
+    def __init__(self, version, rules, validators, common_definitions, common_index, root_dir=None):
+        self.version = version
+        self.rules = rules
+        self.validators = validators
+        self.common_definitions = common_definitions
+        self.common_index = common_index
+        self.root_dir = root_dir
+
+    @property
+    def schema_dict(self) -> dict:
+        """root_dir からの相対パスをキーにした空でない内容 (relative_schema_dict を参照)"""
+        return relative_schema_dict(self.rules, self.root_dir)
+
+    def rules_under(self, directory) -> dict:
+        prefix = os.path.abspath(directory).rstrip(os.sep) + os.sep
+        return {path: content for path, content in self.rules.items() if path.startswith(prefix)}
+
+
+class RuleSetWatcher:
+    """rule_config を監視し、コンパイル済みのルールセットをメモリ上に保つ
+
+    変更があると DirectoryAnalyzer で変わったファイルだけを読み直し、そのファイルの
+    Validator だけを作り直す。共通定義が変わった場合は、それを参照する (uses_common)
+    ルールだけを再コンパイルする。読み手は rule_set のスナップショットを使うため、
+    更新中もロックなしで一貫した内容を参照できる。
+    """
+
+    def __init__(self, root_dir, analyzer=None, jobs=None, poll_interval=1.0, use_inotify=True):
+        from yamlguardian.directory_analyzer import DirectoryAnalyzer
+
+        self.root_dir = os.path.abspath(root_dir)
+        self.analyzer = analyzer or DirectoryAnalyzer()
+        self.jobs = jobs
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.rule_set = RuleSet(0, {}, {}, None, {}, self.root_dir)
+        self._common_paths = set()
+        self._uses_common_paths = set()
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._watch = None
+        self._build()
+
+    def _build(self):
+        with self._lock:
+            self.analyzer.detect_changes(self.root_dir, self.jobs)
+            prefix = self.root_dir.rstrip(os.sep) + os.sep
+            rules = {
+                path: cached[0]
+                for path, cached in sorted(self.analyzer.validation_schema_cache.items())
+                if path.startswith(prefix)
+            }
+            change_set = ChangeSet()
+            change_set.added = set(rules)
+            self._apply(rules, change_set)
+
+    def _apply(self, rules, change_set):
+        previous = self.rule_set
+        common_changed = any(
+            path in self._common_paths or is_common_definitions(rules.get(path))
+            for path in change_set.changed | change_set.deleted
+        )
+        self._common_paths = {path for path, content in rules.items() if is_common_definitions(content)}
+        common_definitions, common_index = previous.common_definitions, previous.common_index
+        if common_changed:
+            common_elements = []
+            for path in sorted(self._common_paths):
+                common_elements.extend(rules[path]["common_elements"] or [])
+            common_definitions = {"common_elements": common_elements}
+            common_index = index_common_definitions(common_definitions)
+
+        recompile = change_set.changed - self._common_paths
+        if common_changed:
+            recompile |= self._uses_common_paths
+        validators = {path: validator for path, validator in previous.validators.items() if path in rules}
+        for path in recompile & rules.keys():
+            validator = compile_rule(rules[path], common_definitions, common_index)
+            if validator is None:
+                validators.pop(path, None)
+            else:
+                validators[path] = validator
+            if uses_common(rules[path]):
+                self._uses_common_paths.add(path)
+            else:
+                self._uses_common_paths.discard(path)
+        self._uses_common_paths &= rules.keys()
+        self.rule_set = RuleSet(
+            previous.version + 1, rules, validators, common_definitions, common_index, self.root_dir
+        )
+
+    def refresh(self) -> ChangeSet:
+        """変更を検出して反映し、ChangeSet を返す (変更がなければ空の ChangeSet)"""
+        with self._lock:
+            change_set = self.analyzer.detect_changes(self.root_dir, self.jobs)
+            if not change_set:
+                return change_set
+            rules = dict(self.rule_set.rules)
+            for path in change_set.deleted:
+                rules.pop(path, None)
+            for path in change_set.changed:
+                rules[path] = self.analyzer.validation_schema_cache[path][0]
+            self._apply(dict(sorted(rules.items())), change_set)
+        for listener in list(self._listeners):
+            listener(change_set)
+        return change_set
+
+    def add_listener(self, listener):
+        """変更を反映した後に listener(change_set) を呼ぶ (監視スレッドから呼ばれる)"""
+        self._listeners.append(listener)
+
+    @property
+    def version(self) -> int:
+        return self.rule_set.version
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return self
+        self._stop = threading.Event()
+        self._watch = open_watch(self.root_dir, self.use_inotify)
+        self._thread = threading.Thread(target=self._run, name="RuleSetWatcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self._watch.wait(self.poll_interval) and not self._stop.is_set():
+                    self.refresh()
+            except Exception as e:
+                print(f"Failed to refresh rules in {self.root_dir}: {e}")
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        if isinstance(self._watch, PollingWatch):
+            # 待機中の監視スレッドをすぐに起こす (inotify は最大 poll_interval 秒で戻る)
+            self._watch.close()
+        self._thread.join()
+        self._watch.close()
+        self._thread = None
+        self._watch = None
+
+
+# プロセス内で有効な監視 (root_dir の絶対パス -> RuleSetWatcher)
+_active_watchers = {}
+_active_lock = threading.Lock()
+
+
+def watch_rules(root_dir, **kwargs) -> RuleSetWatcher:
+    """root_dir の監視を開始する (既に監視中ならそれを返す)"""
+    key = os.path.abspath(root_dir)
+    with _active_lock:
+        watcher = _active_watchers.get(key)
+        if watcher is None:
+            watcher = _active_watchers[key] = RuleSetWatcher(key, **kwargs).start()
+    return watcher
+
+
+def active_watcher(path):
+    """path を含むディレクトリを監視中の RuleSetWatcher を返す (なければ None)"""
+    path = os.path.abspath(path)
+    for root_dir, watcher in list(_active_watchers.items()):
+        if path == root_dir or path.startswith(root_dir.rstrip(os.sep) + os.sep):
+            return watcher
+    return None
+
+
+def stop_watching(root_dir=None):
+    with _active_lock:
+        if root_dir is None:
+            watchers = list(_active_watchers.values())
+            _active_watchers.clear()
+        else:
+            watchers = [_active_watchers.pop(os.path.abspath(root_dir), None)]
+    for watcher in watchers:
+        if watcher is not None:
+            watcher.stop()
@@ -1,52 +1,17 @@
-from .validator import Validator
+from .validator import Validator, index_common_definitions
 
 
 class RuleManager:
-    def __init__(self, schema, relations=None, common_definitions=None):
+    def __init__(self, schema, relations=None, common_definitions=None, common_index=None):
         self.schema = schema
         self.relations = relations
         self.common_definitions = common_definitions
-        self.validator = Validator(schema)
-
-    def validate(self, data):
-        errors = self.validator.validate(data)
-        # Add additional validation rules based on schema
-        for element in self.schema.get("root_element", []):
-            if element.get("type") == "string":
-                if not isinstance(data.get(element["name"]), str):
-                    errors.append(f"{element['description']} は文字列である必要があります。")
-            elif element.get("type") == "integer":
-                if not isinstance(data.get(element["name"]), int):
-                    errors.append(f"{element['description']} は整数である必要があります。")
-            elif element.get("type") == "list":
-                if not isinstance(data.get(element["name"]), list):
-                    errors.append(f"{element['description']} はリストである必要があります。")
-            elif element.get("type") == "object":
-                if not isinstance(data.get(element["name"]), dict):
-                    errors.append(f"{element['description']} はオブジェクトである必要があります。")
-            # Add more type checks as needed
-
-            # Custom validation rules
-            if "custom_rules" in element:
-                for rule in element["custom_rules"]:
-                    if not rule(data.get(element["name"])):
-                        errors.append(f"{element['description']} のカスタムルールに違反しています。")
-
-            # Check for uses_common attribute
-            if element.get("uses_common"):
-                common_element = next(
-                    (e for e in self.common_definitions.get("common_elements", []) if e["name"] == element["name"]),
-                    None,
-                )
-                if not common_element:
-                    errors.append(f"{element['description']} は共通要素として定義されていません。")
-
-            # Check for required fields
-            if element.get("required") and element["name"] not in data:
-                errors.append(f"{element['description']} が存在しません。")
-
-            # Check for prohibited fields
-            if element.get("prohibited") and element["name"] in data:
-                errors.append(f"{element['description']} は選択できません。")
-
-        return errors
+        # 共通定義は name で引けるように一度だけインデックス化し、Validator と共有する
+        if common_index is None:
+            common_index = index_common_definitions(common_definitions)
+        self.common_index = common_index
+        # root_element のルールは Validator の構築時に一度だけコンパイルされる
+        self.validator = Validator(schema, common_definitions, common_index)
+
+    def validate(self, data, max_errors=None):
+        return self.validator.validate(data, max_errors)
@@ -1,12 +1,20 @@
 import os
 from pathlib import Path
 
-import jsonschema
-from ruamel.yaml import YAML
-
+from yamlguardian import yaml_loader
 from yamlguardian.validator import Validator
 
-yaml = YAML()
+
+def get_yaml():
+    """コメントを保持したまま読み書きする ruamel.yaml の YAML インスタンス"""
+    return yaml_loader.roundtrip_yaml()
+
+
+def __getattr__(name):
+    # 以前のモジュール変数 yaml との互換
+    if name == "yaml":
+        return get_yaml()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def load_yaml(yaml_file_or_contents: str) -> dict:
@@ -18,12 +26,15 @@ def load_yaml(yaml_file_or_contents: str) -> dict:
 
     Returns:
         dict | None: a dictionary containing the YAML's content, or throws an exception.
+
+    Comments are kept (round-trip loader) so the result can be written back with save_yaml.
+    Use yaml_loader.load when only the data is needed.
     """
     if isinstance(yaml_file_or_contents, (str, Path)) and Path(yaml_file_or_contents).is_file():
         with open(yaml_file_or_contents, encoding="utf-8") as f:
-            schema = yaml.load(f)
+            schema = get_yaml().load(f)
     else:
-        schema = yaml.load(yaml_file_or_contents)
+        schema = get_yaml().load(yaml_file_or_contents)
     return schema
 
 
@@ -37,7 +48,7 @@ def save_yaml(data: dict, yaml_file: str):
     """
     prepare_dir(yaml_file)
     with open(yaml_file, "w", encoding="utf-8") as f:
-        yaml.dump(data, f)
+        get_yaml().dump(data, f)
 
 
 def prepare_dir(output_file_path):
@@ -46,6 +57,8 @@ def prepare_dir(output_file_path):
 
 
 def validate_data(data, schema):
+    import jsonschema
+
     try:
         jsonschema.validate(instance=data, schema=schema)
     except jsonschema.exceptions.ValidationError as e:
@@ -54,6 +67,10 @@ def validate_data(data, schema):
 
 
 def format_errors(errors):
+    if isinstance(errors, str):
+        return errors
+    if isinstance(errors, list):
+        return "\n".join(str(e) for e in errors)
     formatted_errors = []
     for field, error in errors.items():
         if isinstance(error, list):
@@ -67,7 +84,7 @@ def format_errors(errors):
 
 def validate_yaml_data(input_data):
     try:
-        data = yaml.safe_load(input_data)
+        data = yaml_loader.load(input_data)
         openapi_validation_result = validate_openapi_schema(input_data)
         if openapi_validation_result["message"] == "Validation failed":
             return openapi_validation_result
@@ -88,7 +105,7 @@ def validate_yaml_data(input_data):
 
 def validate_openapi_schema(input_data):
     try:
-        validation_rules = yaml.safe_load(input_data)
+        validation_rules = yaml_loader.load(input_data)
         schema = load_yaml("openapi_schema.yaml")
         v = Validator(schema)
         if not v.validate(validation_rules):
@@ -100,7 +117,7 @@ def validate_openapi_schema(input_data):
 
 def validate_user_defined_yaml(input_data):
     try:
-        data = yaml.safe_load(input_data)
+        data = yaml_loader.load(input_data)
         schema = load_yaml("user_defined_yaml.yaml")
         v = Validator(schema)
         if not v.validate(data):
@@ -112,7 +129,7 @@ def validate_user_defined_yaml(input_data):
 
 def validate_user_provided_yaml(input_data):
     try:
-        data = yaml.safe_load(input_data)
+        data = yaml_loader.load(input_data)
         schema = load_yaml("user_provided_yaml.yaml")
         v = Validator(schema)
         if not v.validate(data):
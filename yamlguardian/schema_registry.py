@@ -0,0 +1,134 @@
+import os
+import threading
+from typing import TYPE_CHECKING
+
+from yamlguardian.cerberus_adapter import CompiledCerberusSchema
+from yamlguardian.rule_ir import compile_cerberus_schema, compile_json_schema
+from yamlguardian.rule_watcher import active_watcher
+
+if TYPE_CHECKING:
+    from cerberus import Validator
+
+
+def file_signature(path):
+    """ファイルまたはディレクトリ配下の YAML の (mtime, size) からシグネチャを作る"""
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+    if os.path.isdir(path):
+        watcher = active_watcher(path)
+        if watcher is not None:
+            # 監視中のディレクトリは走査せず、ルールセットのバージョンで判定する
+            return ("watch", id(watcher), watcher.version)
+        signature = []
+        for root, _, files in os.walk(path):
+            for name in sorted(files):
+                if name.endswith(".yaml"):
+                    stat = os.stat(os.path.join(root, name))
+                    signature.append((os.path.join(root, name), stat.st_mtime_ns, stat.st_size))
+        return tuple(sorted(signature))
+    return None
+
+
+class SchemaEntry:
+    """読み込み済みスキーマと、そこから作ったバリデータを保持する"""
+
+    def __init__(self, path, signature, schema, json_schema_validators):
+        self.path = path
+        self.signature = signature
+        self.schema = schema
+        self._json_schema_validators = json_schema_validators
+        self._cerberus_schema = None
+        self._rule_trees = {}
+        self._lock = threading.Lock()
+
+    def cerberus_schema(self) -> CompiledCerberusSchema:
+        # Cerberus のスキーマ正規化はスキーマのバージョン (エントリ) ごとに一度だけ行う
+        # (ステージのスキーマは Cerberus の形式なので YAML ルールとしては変換しない)
+        if self._cerberus_schema is None:
+            with self._lock:
+                if self._cerberus_schema is None:
+                    self._cerberus_schema = CompiledCerberusSchema(self.schema, convert=False)
+        return self._cerberus_schema
+
+    def cerberus_validator(self) -> "Validator":
+        # Validator はスレッドごとに使い回す (このスレッドで次に取得するまでに errors を読むこと)
+        return self.cerberus_schema().validator()
+
+    def json_schema_validator(self):
+        return self._json_schema_validators.register(self.schema)
+
+    def rule_tree(self, family, engine):
+        """スキーマを engine (cerberus / json) として IR にコンパイルした木 (IR にできなければ None)
+
+        エンジンでのコンパイルに成功したスキーマだけを IR にする (不正なスキーマのエラーはエンジンが報告する)。
+        """
+        key = (family, engine)
+        if key not in self._rule_trees:
+            try:
+                if engine == "cerberus":
+                    tree = compile_cerberus_schema(self.cerberus_schema().schema, family)
+                else:
+                    self.json_schema_validator()
+                    tree = compile_json_schema(self.schema, family)
+            except Exception:
+                tree = None
+            with self._lock:
+                self._rule_trees.setdefault(key, tree)
+        return self._rule_trees[key]
+
+
+class SchemaRegistry:
+    """スキーマファイルをプロセス内で一度だけ読み込むレジストリ
+
+    エントリはファイルの mtime/size が変わったときだけ読み直される。
+    """
+
+    def __init__(self, loader, json_schema_validators):
+        self.loader = loader
+        self.json_schema_validators = json_schema_validators
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get_entry(self, path) -> SchemaEntry:
+        key = os.path.abspath(path)
+        signature = file_signature(key)
+        entry = self._entries.get(key)
+        if entry is not None and entry.signature == signature:
+            return entry
+        schema = self.loader(path)
+        new_entry = SchemaEntry(key, signature, schema, self.json_schema_validators)
+        with self._lock:
+            self._entries[key] = new_entry
+        if entry is not None:
+            self.json_schema_validators.unregister(entry.schema)
+        return new_entry
+
+    def get_schema(self, path):
+        return self.get_entry(path).schema
+
+    def get_cerberus_schema(self, path) -> CompiledCerberusSchema:
+        return self.get_entry(path).cerberus_schema()
+
+    def get_cerberus_validator(self, path) -> "Validator":
+        return self.get_entry(path).cerberus_validator()
+
+    def get_json_schema_validator(self, path):
+        return self.get_entry(path).json_schema_validator()
+
+    def get_json_schema(self, path):
+        """jsonschema のバリデータキャッシュに登録済みのスキーマを返す"""
+        entry = self.get_entry(path)
+        entry.json_schema_validator()
+        return entry.schema
+
+    def invalidate(self, path=None):
+        with self._lock:
+            if path is None:
+                removed = list(self._entries.values())
+                self._entries.clear()
+            else:
+                removed = [self._entries.pop(os.path.abspath(path), None)]
+        for entry in removed:
+            if entry is not None:
+                self.json_schema_validators.unregister(entry.schema)
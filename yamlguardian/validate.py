@@ -1,88 +1,306 @@
+import hashlib
+import json
 import os
+import threading
+from collections import OrderedDict
+from itertools import islice
 
-import jsonschema
-import yaml
-from cerberus import Validator
+from yamlguardian import yaml_loader
+from yamlguardian.rule_ir import rule_programs
+from yamlguardian.rule_watcher import active_watcher
+from yamlguardian.schema_registry import SchemaRegistry
+from yamlguardian.validation_context import ValidationContext, error_limit
 
-from yamlguardian.directory_analyzer import DirectoryAnalyzer
-from yamlguardian.save_load_yaml import format_errors
-from yamlguardian.yaml_json_converter import YamlJsonConverter
 
-
-def load_validation_rules(file_or_dir_path: str) -> dict | None:
+def load_validation_rules(file_or_dir_path: str, jobs=None) -> dict | None:
     validation_schema = None
     if os.path.isfile(file_or_dir_path):
-        with open(file_or_dir_path, encoding="utf-8") as file:
-            validation_schema = yaml.safe_load(file)
+        validation_schema = yaml_loader.load_file(file_or_dir_path)
+    elif (watcher := active_watcher(file_or_dir_path)) is not None:
+        # 監視中のディレクトリはメモリ上のルールセットから返す
+        validation_schema = watcher.rule_set.rules_under(file_or_dir_path)
     else:
         # Load all yaml files in the directory
+        from yamlguardian.directory_analyzer import DirectoryAnalyzer
+
         analyzer = DirectoryAnalyzer()
-        validation_schema = analyzer.analyze_directory_structure(file_or_dir_path)
+        analyzer.analyze_directory_structure(file_or_dir_path, jobs)
+        # 戻り値は変更の有無で変わるので、キャッシュが温まっていても埋まる validation_rules を使う
+        # (YAML ファイルがない場合は従来どおり空のリスト)
+        validation_schema = analyzer.validation_rules or []
     return validation_schema
 
 
-def validate_data(data, schema) -> str:
+def schema_fingerprint(schema) -> str:
+    """スキーマの内容から安定したハッシュ値を計算する"""
+    canonical = json.dumps(schema, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def compile_json_schema_validator(schema):
+    """スキーマをメタスキーマで検証し、対応するバリデータクラスでコンパイルする"""
+    import jsonschema
+
+    validator_class = jsonschema.validators.validator_for(schema)
+    validator_class.check_schema(schema)
+    return validator_class(schema)
+
+
+class JsonSchemaValidatorCache:
+    """コンパイル済み jsonschema バリデータの LRU キャッシュ
+
+    キーはスキーマのフィンガープリント。register() したスキーマはオブジェクトの
+    同一性で引けるため、ハッシュ計算も不要になる (登録後のスキーマは変更しないこと)。
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._validators = OrderedDict()
+        self._registered = {}
+        self._lock = threading.Lock()
+
+    def register(self, schema):
+        validator = self._get_by_fingerprint(schema)
+        with self._lock:
+            self._registered[id(schema)] = (schema, validator)
+        return validator
+
+    def unregister(self, schema):
+        with self._lock:
+            registered = self._registered.get(id(schema))
+            if registered is not None and registered[0] is schema:
+                del self._registered[id(schema)]
+
+    def get(self, schema):
+        registered = self._registered.get(id(schema))
+        if registered is not None and registered[0] is schema:
+            with self._lock:
+                self.hits += 1
+            return registered[1]
+        return self._get_by_fingerprint(schema)
+
+    def _get_by_fingerprint(self, schema):
+        key = schema_fingerprint(schema)
+        with self._lock:
+            validator = self._validators.get(key)
+            if validator is not None:
+                self._validators.move_to_end(key)
+                self.hits += 1
+                return validator
+            self.misses += 1
+        validator = compile_json_schema_validator(schema)
+        with self._lock:
+            self._validators[key] = validator
+            self._validators.move_to_end(key)
+            while len(self._validators) > self.maxsize:
+                self._validators.popitem(last=False)
+        return validator
+
+    def info(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._validators),
+                "maxsize": self.maxsize,
+                "registered": len(self._registered),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._validators.clear()
+            self._registered.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+json_schema_validators = JsonSchemaValidatorCache()
+
+# FastAPI アプリと CLI で共有するスキーマレジストリ
+schema_registry = SchemaRegistry(load_validation_rules, json_schema_validators)
+
+
+# ステージ名 -> (スキーマファイル, エンジン)
+STAGE_SCHEMAS = {
+    "openapi": ("openapi_schema.yaml", "cerberus"),
+    "user_defined": ("user_defined_yaml.yaml", "cerberus"),
+    "user_provided": ("user_provided_yaml.yaml", "cerberus"),
+    "json_schema": ("schema.yaml", "json"),
+}
+
+
+def stage_rule_trees() -> dict:
+    """ステージ名 -> ステージのスキーマの IR の木 (IR にできないステージは None)"""
+    trees = {}
+    for stage_name, (schema_path, engine) in STAGE_SCHEMAS.items():
+        try:
+            trees[stage_name] = schema_registry.get_entry(schema_path).rule_tree(stage_name, engine)
+        except Exception:
+            trees[stage_name] = None
+    return trees
+
+
+def iter_data_errors(data, schema):
+    """コンパイル済みバリデータでエラーを遅延的に列挙する"""
+    return json_schema_validators.get(schema).iter_errors(data)
+
+
+def data_errors(data, schema, limit=None) -> list[str]:
+    """JSON Schema のエラーメッセージを limit 件まで求める
+
+    limit が 1 (fail_fast) の場合は最初に見つかったエラーではなく、
+    jsonschema.exceptions.best_match で最も関連の深いエラーを返す。
+    """
+    if limit == 1:
+        from jsonschema.exceptions import best_match
+
+        error = best_match(iter_data_errors(data, schema))
+        return [] if error is None else [str(error)]
+    return [str(e) for e in islice(iter_data_errors(data, schema), limit)]
+
+
+def validate_data(data, schema, mode=None, max_errors=None) -> list[str]:
+    """データを JSON Schema で検証し、エラーメッセージのリストを返す
+
+    mode は fail_fast (最も関連の深いエラー 1 件)、max_errors (max_errors 件で停止)、
+    exhaustive (全エラー) のいずれか。max_errors ではエラーは必要な件数だけ遅延的に求める。
+    """
+    return data_errors(data, schema, error_limit(mode, max_errors))
+
+
+def count_errors(errors) -> int:
+    """ステージの結果のエラーメッセージの数 (Cerberus の入れ子の dict / list は末端のメッセージを数える)"""
+    if isinstance(errors, dict):
+        return sum(count_errors(value) for value in errors.values())
+    if isinstance(errors, list):
+        return sum(count_errors(value) for value in errors)
+    return 1
+
+
+def limit_errors(errors, limit):
+    """エラーメッセージを先頭から limit 件 (None は無制限) までに切り詰め、(切り詰めた結果, 件数) を返す"""
+    if limit is None:
+        return errors, count_errors(errors)
+    if isinstance(errors, (dict, list)):
+        items = errors.items() if isinstance(errors, dict) else enumerate(errors)
+        limited = {} if isinstance(errors, dict) else []
+        count = 0
+        for key, value in items:
+            if count >= limit:
+                break
+            value, value_count = limit_errors(value, limit - count)
+            if isinstance(limited, dict):
+                limited[key] = value
+            else:
+                limited.append(value)
+            count += value_count
+        return limited, count
+    return errors, 1
+
+
+def validate_context(context: ValidationContext) -> dict:
+    """パース済みのコンテキストに対して全ステージを順に実行する
+
+    fail_fast では最初に失敗したステージの結果を返す。それ以外のモードでは
+    エラー数の上限に達するまで後続のステージも実行し、失敗したステージの
+    エラーをステージ名ごとにまとめて返す。エラーはメッセージ単位で数え、上限を超える分は切り捨てる。
+    全ステージのルールはまず IR でドキュメントを 1 回辿って評価し、合格が確定したステージはエンジンを実行しない。
+    """
+    if context.passed is None:
+        context.passed = rule_programs.get(stage_rule_trees()).evaluate(context.document).passed
+    limit = context.error_limit
+    failed = {}
+    reported = 0
+    for stage in (openapi_stage, user_defined_stage, user_provided_stage, json_schema_stage):
+        result = stage(context)
+        if result["message"] != "Validation failed":
+            continue
+        if context.fail_fast:
+            return result
+        remaining = None if limit is None else limit - reported
+        errors, count = limit_errors(result["errors"], remaining)
+        failed[stage.__name__.removesuffix("_stage")] = errors
+        reported += count
+        if limit is not None and reported >= limit:
+            break
+    if failed:
+        return {"message": "Validation failed", "errors": failed}
+    return {"message": "Validation successful"}
+
+
+def _passed_stage(context: ValidationContext, stage_name: str) -> dict | None:
+    if context.passed is None or stage_name not in context.passed:
+        return None
+    result = context.results[stage_name] = {"message": "Validation successful"}
+    return result
+
+
+def _cerberus_stage(context: ValidationContext, stage_name: str, schema_path: str) -> dict:
+    if (result := _passed_stage(context, stage_name)) is not None:
+        return result
     try:
-        jsonschema.validate(instance=data, schema=schema)
-    except jsonschema.exceptions.ValidationError as e:
-        print("validate_data ValidationError: e=", e)
-        return [str(e)]
-    return []  # no error
+        errors = schema_registry.get_cerberus_schema(schema_path).validate(context.document)
+        if errors is not None:
+            result = {"message": "Validation failed", "errors": errors}
+        else:
+            result = {"message": "Validation successful"}
+    except Exception as e:
+        result = {"message": "Validation error", "detail": str(e)}
+    context.results[stage_name] = result
+    return result
+
+
+def openapi_stage(context: ValidationContext) -> dict:
+    return _cerberus_stage(context, "openapi", "openapi_schema.yaml")
+
+
+def user_defined_stage(context: ValidationContext) -> dict:
+    return _cerberus_stage(context, "user_defined", "user_defined_yaml.yaml")
 
 
-def validate_yaml_data(input_data):
+def user_provided_stage(context: ValidationContext) -> dict:
+    return _cerberus_stage(context, "user_provided", "user_provided_yaml.yaml")
+
+
+def json_schema_stage(context: ValidationContext) -> dict:
+    if (result := _passed_stage(context, "json_schema")) is not None:
+        return result
     try:
-        data = yaml.safe_load(input_data)
-        openapi_validation_result = validate_openapi_schema(input_data)
-        if openapi_validation_result["message"] == "Validation failed":
-            return openapi_validation_result
-        user_defined_validation_result = validate_user_defined_yaml(input_data)
-        if user_defined_validation_result["message"] == "Validation failed":
-            return user_defined_validation_result
-        user_provided_validation_result = validate_user_provided_yaml(input_data)
-        if user_provided_validation_result["message"] == "Validation failed":
-            return user_provided_validation_result
-        schema = load_validation_rules("schema.yaml")
-        json_schema = YamlJsonConverter.yaml_to_json(schema)
-        errors = validate_data(data, json_schema)
+        schema = schema_registry.get_json_schema("schema.yaml")
+        errors = data_errors(context.document, schema, context.error_limit)
         if errors:
-            return {"message": "Validation failed", "errors": format_errors(errors)}
-        return {"message": "Validation successful"}
+            # メッセージごとに数えられるよう、1 つの文字列に連結せずリストのまま返す
+            result = {"message": "Validation failed", "errors": errors}
+        else:
+            result = {"message": "Validation successful"}
     except Exception as e:
-        return {"message": "Validation error", "detail": str(e)}
+        result = {"message": "Validation error", "detail": str(e)}
+    context.results["json_schema"] = result
+    return result
 
 
-def validate_openapi_schema(input_data):
+def _run_stage(stage, input_data, mode=None, max_errors=None) -> dict:
+    error_limit(mode, max_errors)  # 不正なモードは呼び出し元に ValueError で伝える
     try:
-        validation_rules = yaml.safe_load(input_data)
-        schema = load_validation_rules("openapi_schema.yaml")
-        v = Validator(schema)
-        if not v.validate(validation_rules):
-            return {"message": "Validation failed", "errors": v.errors}
-        return {"message": "Validation successful"}
+        context = ValidationContext.from_input(input_data, mode, max_errors)
     except Exception as e:
         return {"message": "Validation error", "detail": str(e)}
+    return stage(context)
+
+
+def validate_yaml_data(input_data, mode=None, max_errors=None):
+    return _run_stage(validate_context, input_data, mode, max_errors)
+
+
+def validate_openapi_schema(input_data):
+    return _run_stage(openapi_stage, input_data)
 
 
 def validate_user_defined_yaml(input_data):
-    try:
-        data = yaml.safe_load(input_data)
-        schema = load_validation_rules("user_defined_yaml.yaml")
-        v = Validator(schema)
-        if not v.validate(data):
-            return {"message": "Validation failed", "errors": v.errors}
-        return {"message": "Validation successful"}
-    except Exception as e:
-        return {"message": "Validation error", "detail": str(e)}
+    return _run_stage(user_defined_stage, input_data)
 
 
 def validate_user_provided_yaml(input_data):
-    try:
-        data = yaml.safe_load(input_data)
-        schema = load_validation_rules("user_provided_yaml.yaml")
-        v = Validator(schema)
-        if not v.validate(data):
-            return {"message": "Validation failed", "errors": v.errors}
-        return {"message": "Validation successful"}
-    except Exception as e:
-        return {"message": "Validation error", "detail": str(e)}
+    return _run_stage(user_provided_stage, input_data)
@@ -0,0 +1,67 @@
+from yamlguardian import yaml_loader
+
+# バリデーションモード
+FAIL_FAST = "fail_fast"
+MAX_ERRORS = "max_errors"
+EXHAUSTIVE = "exhaustive"
+VALIDATION_MODES = (FAIL_FAST, MAX_ERRORS, EXHAUSTIVE)
+
+
+def resolve_mode(mode=None, max_errors=None) -> str:
+    """省略されたモードを決める
+
+    mode を省略した場合、max_errors が指定されていれば max_errors モード、
+    そうでなければ fail_fast モードになる。
+    """
+    if mode is None:
+        mode = MAX_ERRORS if max_errors is not None else FAIL_FAST
+    if mode not in VALIDATION_MODES:
+        raise ValueError(f"不明なバリデーションモードです: {mode}")
+    return mode
+
+
+def error_limit(mode=None, max_errors=None) -> int | None:
+    """バリデーションモードから報告するエラー数の上限を求める (None は無制限、モードの省略は resolve_mode を参照)"""
+    mode = resolve_mode(mode, max_errors)
+    if mode == EXHAUSTIVE:
+        return None
+    if mode == MAX_ERRORS:
+        if max_errors is None or max_errors < 1:
+            raise ValueError("max_errors モードには 1 以上の max_errors が必要です")
+        return max_errors
+    return 1
+
+
+class ValidationContext:
+    """1 回のバリデーションで各ステージが共有する状態
+
+    入力 YAML は一度だけパースし、各ステージはパース済みの document を参照する。
+    ステージの結果は results にステージ名で記録される。
+    passed はルールの IR (rule_ir) で合格が確定したステージ名などの集合で、そのステージはエンジンを実行しない。
+    """
+
+    def __init__(self, document=None, source=None, mode=None, max_errors=None):
+        self.document = document
+        self.source = source
+        self.results = {}
+        self.passed = None
+        self.error_limit = error_limit(mode, max_errors)
+        self.mode = resolve_mode(mode, max_errors)
+
+    @property
+    def fail_fast(self) -> bool:
+        # max_errors=1 も上限は 1 だが、fail_fast とは違い後続のステージも上限まで数える
+        return self.mode == FAIL_FAST
+
+    @classmethod
+    def from_text(cls, source: str, mode=None, max_errors=None) -> "ValidationContext":
+        return cls(yaml_loader.load(source), source, mode, max_errors)
+
+    @classmethod
+    def from_input(cls, input_data, mode=None, max_errors=None) -> "ValidationContext":
+        """YAML 文字列・パース済みデータ・既存のコンテキストのいずれかからコンテキストを得る"""
+        if isinstance(input_data, ValidationContext):
+            return input_data
+        if isinstance(input_data, (str, bytes)):
+            return cls.from_text(input_data, mode, max_errors)
+        return cls(input_data, mode=mode, max_errors=max_errors)
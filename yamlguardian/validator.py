@@ -1,47 +1,207 @@
+class RequiredCheck:
+    __slots__ = ("name", "message")
+
+    def __init__(self, name, description):
+        self.name = name
+        self.message = f"{description} が存在しません。"
+
+    def __call__(self, data):
+        if self.name not in data:
+            return self.message
+        return None
+
+
+class TypeCheck:
+    __slots__ = ("name", "expected_type", "message")
+
+    def __init__(self, name, description, expected_type, message):
+        self.name = name
+        self.expected_type = expected_type
+        self.message = f"{description} {message}"
+
+    def __call__(self, data):
+        if not isinstance(data.get(self.name), self.expected_type):
+            return self.message
+        return None
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class BoundCheck:
+    """値の範囲・長さのチェック (対象の型でない値と存在しない要素は type / required に任せる)"""
+
+    __slots__ = ("name", "bound", "message")
+
+    def __init__(self, name, description, bound):
+        self.name = name
+        self.bound = bound
+        self.message = f"{description} {self.template.format(bound=bound)}"
+
+    def __call__(self, data):
+        if not self.passes(data.get(self.name)):
+            return self.message
+        return None
+
+
+class MinCheck(BoundCheck):
+    __slots__ = ()
+    template = "は {bound} 以上である必要があります。"
+
+    def passes(self, value) -> bool:
+        return not (_is_number(value) and value < self.bound)
+
+
+class MaxCheck(BoundCheck):
+    __slots__ = ()
+    template = "は {bound} 以下である必要があります。"
+
+    def passes(self, value) -> bool:
+        return not (_is_number(value) and value > self.bound)
+
+
+class MinLengthCheck(BoundCheck):
+    __slots__ = ()
+    template = "の長さは {bound} 以上である必要があります。"
+
+    def passes(self, value) -> bool:
+        return not (isinstance(value, (str, list)) and len(value) < self.bound)
+
+
+class MaxLengthCheck(BoundCheck):
+    __slots__ = ()
+    template = "の長さは {bound} 以下である必要があります。"
+
+    def passes(self, value) -> bool:
+        return not (isinstance(value, (str, list)) and len(value) > self.bound)
+
+
+class CustomRuleCheck:
+    __slots__ = ("name", "rule", "message")
+
+    def __init__(self, name, description, rule):
+        self.name = name
+        self.rule = rule
+        self.message = f"{description} のカスタムルールに違反しています。"
+
+    def __call__(self, data):
+        if not self.rule(data.get(self.name)):
+            return self.message
+        return None
+
+
+class UsesCommonCheck:
+    """共通定義に存在しない要素を参照している場合のチェック
+
+    参照の解決はコンパイル時に済ませるため、未定義の参照に対してだけ作られる。
+    """
+
+    __slots__ = ("name", "message")
+
+    def __init__(self, name, description):
+        self.name = name
+        self.message = f"{description} は共通要素として定義されていません。"
+
+    def __call__(self, data):
+        return self.message
+
+
+class ProhibitedCheck:
+    __slots__ = ("name", "message")
+
+    def __init__(self, name, description):
+        self.name = name
+        self.message = f"{description} は選択できません。"
+
+    def __call__(self, data):
+        if self.name in data:
+            return self.message
+        return None
+
+
+# root_element の type 名 -> (Python の型, エラーメッセージ)
+TYPE_CHECKS = {
+    "string": (str, "は文字列である必要があります。"),
+    "integer": (int, "は整数である必要があります。"),
+    "list": (list, "はリストである必要があります。"),
+    "object": (dict, "はオブジェクトである必要があります。"),
+}
+
+# root_element の範囲・長さのルール名 -> チェッカー
+BOUND_CHECKS = {
+    "min": MinCheck,
+    "max": MaxCheck,
+    "minlength": MinLengthCheck,
+    "maxlength": MaxLengthCheck,
+}
+
+
+def index_common_definitions(common_definitions) -> dict:
+    """共通定義の common_elements を name をキーにした辞書にする"""
+    common_index = {}
+    for common_element in (common_definitions or {}).get("common_elements", []):
+        common_index.setdefault(common_element["name"], common_element)
+    return common_index
+
+
+def root_elements(schema) -> list:
+    """スキーマの root_element の要素一覧を返す
+
+    root_element は要素のリスト、または elements を持つルート要素 (rule_config の形式) のどちらでもよい。
+    """
+    root_element = (schema or {}).get("root_element") or []
+    if isinstance(root_element, dict):
+        return root_element.get("elements") or []
+    return root_element
+
+
+def compile_element(element, common_index=None):
+    """root_element の 1 要素をチェッカーのリストにコンパイルする"""
+    name = element["name"]
+    description = element.get("description")
+    checks = []
+    if element.get("required"):
+        checks.append(RequiredCheck(name, description))
+    type_check = TYPE_CHECKS.get(element.get("type"))
+    if type_check:
+        checks.append(TypeCheck(name, description, *type_check))
+    for rule, check_class in BOUND_CHECKS.items():
+        if element.get(rule) is not None:
+            checks.append(check_class(name, description, element[rule]))
+    for rule in element.get("custom_rules", []):
+        checks.append(CustomRuleCheck(name, description, rule))
+    if element.get("uses_common") and name not in (common_index or {}):
+        checks.append(UsesCommonCheck(name, description))
+    if element.get("prohibited"):
+        checks.append(ProhibitedCheck(name, description))
+    return checks
+
+
+def compile_plan(schema, common_index=None):
+    """スキーマの root_element を検証プラン (チェッカーのタプル) にコンパイルする"""
+    plan = []
+    for element in root_elements(schema):
+        plan.extend(compile_element(element, common_index))
+    return tuple(plan)
+
+
 class Validator:
-    def __init__(self, schema):
+    def __init__(self, schema, common_definitions=None, common_index=None):
         self.schema = schema
+        self.common_definitions = common_definitions
+        if common_index is None:
+            common_index = index_common_definitions(common_definitions)
+        self.common_index = common_index
+        self.plan = compile_plan(schema, common_index)
 
-    def validate(self, data):
+    def validate(self, data, max_errors=None):
+        """プランを実行してエラーメッセージのリストを返す (max_errors 件で打ち切る)"""
         errors = []
-        for element in self.schema.get("root_element", []):
-            if element.get("required") and element["name"] not in data:
-                errors.append(f"{element['description']} が存在しません。")
-            if element.get("type") == "string":
-                if not isinstance(data.get(element["name"]), str):
-                    errors.append(f"{element['description']} は文字列である必要があります。")
-            elif element.get("type") == "integer":
-                if not isinstance(data.get(element["name"]), int):
-                    errors.append(f"{element['description']} は整数である必要があります。")
-            elif element.get("type") == "list":
-                if not isinstance(data.get(element["name"]), list):
-                    errors.append(f"{element['description']} はリストである必要があります。")
-            elif element.get("type") == "object":
-                if not isinstance(data.get(element["name"]), dict):
-                    errors.append(f"{element['description']} はオブジェクトである必要があります。")
-            # Add more type checks as needed
-
-            # Custom validation rules
-            if "custom_rules" in element:
-                for rule in element["custom_rules"]:
-                    if not rule(data.get(element["name"])):
-                        errors.append(f"{element['description']} のカスタムルールに違反しています。")
-
-            # Check for uses_common attribute
-            if element.get("uses_common"):
-                common_element = next(
-                    (e for e in self.common_definitions.get("common_elements", []) if e["name"] == element["name"]),
-                    None,
-                )
-                if not common_element:
-                    errors.append(f"{element['description']} は共通要素として定義されていません。")
-
-            # Check for required fields
-            if element.get("required") and element["name"] not in data:
-                errors.append(f"{element['description']} が存在しません。")
-
-            # Check for prohibited fields
-            if element.get("prohibited") and element["name"] in data:
-                errors.append(f"{element['description']} は選択できません。")
-
+        for check in self.plan:
+            error = check(data)
+            if error:
+                errors.append(error)
+                if max_errors is not None and len(errors) >= max_errors:
+                    break
         return errors
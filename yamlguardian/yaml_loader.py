@@ -0,0 +1,138 @@
+import importlib.util
+import os
+
+import yaml
+
+# YAML の読み込みバックエンド
+#   c: libyaml の CSafeLoader (PyYAML が libyaml 付きでビルドされている場合)
+#   safe: PyYAML の SafeLoader (pure Python)
+#   roundtrip: ruamel.yaml のラウンドトリップローダー (コメントや位置情報を保持する。最も遅い)
+#   auto: c が使えれば c、なければ safe
+AUTO = "auto"
+C = "c"
+SAFE = "safe"
+ROUNDTRIP = "roundtrip"
+YAML_BACKENDS = (AUTO, C, SAFE, ROUNDTRIP)
+
+# バックエンドを選ぶ環境変数 (ワーカープロセスにも引き継がれる)
+BACKEND_ENV = "YAMLGUARDIAN_YAML_BACKEND"
+
+HAS_LIBYAML = bool(getattr(yaml, "__with_libyaml__", False))
+
+# どのバックエンドでも読み込みエラーはこの例外になる
+YAMLError = yaml.YAMLError
+
+_backend = None
+_roundtrip_yaml = None
+
+
+def resolve_backend(name=None) -> str:
+    """バックエンド名 (省略時は環境変数、それもなければ auto) を実際に使うバックエンドにする
+
+    c は libyaml がない環境では safe になる。
+    """
+    name = name or os.environ.get(BACKEND_ENV) or AUTO
+    if name not in YAML_BACKENDS:
+        raise ValueError(f"不明な YAML バックエンドです: {name} ({', '.join(YAML_BACKENDS)} のいずれか)")
+    if name in (AUTO, C):
+        return C if HAS_LIBYAML else SAFE
+    return name
+
+
+def available_backends() -> list[str]:
+    backends = [C] if HAS_LIBYAML else []
+    backends.append(SAFE)
+    if importlib.util.find_spec("ruamel") is not None:
+        backends.append(ROUNDTRIP)
+    return backends
+
+
+def set_backend(name) -> str:
+    """このプロセスと、これから起動する子プロセスで使うバックエンドを設定する"""
+    global _backend
+    _backend = resolve_backend(name)
+    os.environ[BACKEND_ENV] = name
+    return _backend
+
+
+def get_backend() -> str:
+    global _backend
+    if _backend is None:
+        _backend = resolve_backend()
+    return _backend
+
+
+def roundtrip_yaml():
+    """ruamel.yaml の YAML インスタンスを初回の利用時に作る"""
+    global _roundtrip_yaml
+    if _roundtrip_yaml is None:
+        from ruamel.yaml import YAML
+
+        _roundtrip_yaml = YAML()
+    return _roundtrip_yaml
+
+
+def load_roundtrip(stream):
+    """コメントや位置情報が必要な場合に使うラウンドトリップ読み込み"""
+    from ruamel.yaml import YAMLError as RoundTripYAMLError
+
+    try:
+        return roundtrip_yaml().load(stream)
+    except RoundTripYAMLError as e:
+        raise YAMLError(str(e)) from e
+
+
+def load(stream, backend=None):
+    """YAML (文字列、バイト列またはファイルオブジェクト) を Python のデータとして読み込む
+
+    検証のようにデータだけが必要な場合はこれを使う。backend を省略すると設定されたバックエンドを使う。
+    """
+    backend = resolve_backend(backend) if backend else get_backend()
+    if backend == C:
+        return yaml.load(stream, Loader=yaml.CSafeLoader)
+    if backend == SAFE:
+        return yaml.load(stream, Loader=yaml.SafeLoader)
+    return load_roundtrip(stream)
+
+
+def load_file(path, backend=None):
+    with open(path, "rb") as f:
+        return load(f, backend)
+
+
+def benchmark(paths, repeat=20) -> dict:
+    """paths の YAML を各バックエンドで repeat 回読み込み、バックエンド -> 1 回あたりの秒数を返す"""
+    import time
+
+    contents = []
+    for path in paths:
+        with open(path, "rb") as f:
+            contents.append(f.read())
+    results = {}
+    for backend in available_backends():
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for content in contents:
+                load(content, backend)
+        results[backend] = (time.perf_counter() - start) / repeat
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    from glob import glob
+
+    parser = argparse.ArgumentParser(description="Compare the speed of the YAML loader backends.")
+    parser.add_argument("paths", nargs="*", help="YAML files to load (defaults to rule_config/**/*.yaml).")
+    parser.add_argument("-n", "--repeat", type=int, default=20, help="Number of times each file set is loaded.")
+    args = parser.parse_args()
+
+    paths = args.paths or sorted(glob("rule_config/**/*.yaml", recursive=True))
+    if not paths:
+        parser.error("no YAML files to load")
+    results = benchmark(paths, args.repeat)
+    fastest = min(results.values())
+    print(f"{len(paths)} file(s), {args.repeat} run(s); default backend: {get_backend()}")
+    for backend in sorted(results, key=results.get):
+        seconds = results[backend]
+        print(f"{backend:>10}: {seconds * 1000:8.2f} ms/run  ({seconds / fastest:.1f}x)")
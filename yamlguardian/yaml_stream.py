@@ -0,0 +1,82 @@
+from pathlib import Path
+
+from yamlguardian import yaml_loader
+
+
+def _is_marker(line: bytes, marker: bytes) -> bool:
+    return line.startswith(marker) and line[3:4] in (b"", b" ", b"\t", b"\r", b"\n")
+
+
+def _is_content(line: bytes) -> bool:
+    stripped = line.strip()
+    return bool(stripped) and not stripped.startswith((b"#", b"%"))
+
+
+def _iter_lines(file_or_path):
+    if isinstance(file_or_path, (str, Path)):
+        with open(file_or_path, "rb") as f:
+            yield from f
+        return
+    for line in file_or_path:
+        yield line.encode("utf-8") if isinstance(line, str) else line
+
+
+def iter_yaml_sources(file_or_path):
+    """--- で区切られたマルチドキュメント YAML を 1 ドキュメントずつパースせずに切り出す
+
+    ファイル全体を読み込まず、行単位でドキュメント境界 (行頭の --- / ...) を検出する。
+    パースは呼び出し側が行うので、壊れたドキュメントがあっても後続のドキュメントを読み続けられる。
+
+    Args:
+        file_or_path: YAML ファイルのパス、またはバイナリ/テキストのファイルオブジェクト
+
+    Yields:
+        (index, offset, source): ドキュメント番号、ドキュメント先頭のバイトオフセット、ドキュメントのバイト列
+    """
+    buffer = []
+    start = 0
+    offset = 0
+    index = 0
+    explicit = False
+    has_content = False
+
+    for line in _iter_lines(file_or_path):
+        if _is_marker(line, b"---"):
+            if explicit or has_content:
+                yield index, start, b"".join(buffer)
+                index += 1
+                buffer = []
+                start = offset
+            explicit = True
+            has_content = False
+            buffer.append(line)
+        elif _is_marker(line, b"..."):
+            buffer.append(line)
+            if explicit or has_content:
+                yield index, start, b"".join(buffer)
+                index += 1
+                buffer = []
+                start = offset + len(line)
+                explicit = False
+                has_content = False
+        else:
+            if not buffer:
+                start = offset
+            buffer.append(line)
+            has_content = has_content or _is_content(line)
+        offset += len(line)
+
+    if explicit or has_content:
+        yield index, start, b"".join(buffer)
+
+
+def iter_yaml_documents(file_or_path):
+    """--- で区切られたマルチドキュメント YAML を 1 ドキュメントずつ読み込む
+
+    1 ドキュメント分ずつ切り出してパースする (iter_yaml_sources を参照)。
+
+    Yields:
+        (index, offset, document): ドキュメント番号、ドキュメント先頭のバイトオフセット、パース結果
+    """
+    for index, offset, source in iter_yaml_sources(file_or_path):
+        yield index, offset, yaml_loader.load(source)
@@ -1,26 +1,57 @@
-import ast
 import copy
 import json
 import os
 import tempfile
 from glob import glob
+from typing import TYPE_CHECKING
 
-import jsonref
-from ruamel.yaml import YAML
-
+from yamlguardian import yaml_loader
+from yamlguardian.ref_resolver import DEFS, SHARED, resolve_refs, schema_size
 from yamlguardian.save_load_json import to_json
-from yamlguardian.save_load_yaml import save_yaml
-from yamlguardian.yaml_json_converter import YamlJsonConverter
+from yamlguardian.save_load_yaml import get_yaml, save_yaml
+
+if TYPE_CHECKING:
+    import jsonref
+
+# ruamel.yaml (と旧形式の jsonref) はスキーマを変換するときだけ読み込む
+_converter = None
+
+
+def get_converter():
+    global _converter
+    if _converter is None:
+        from yamlguardian.yaml_json_converter import YamlJsonConverter
 
-yaml = YAML()
-converter = YamlJsonConverter()
+        _converter = YamlJsonConverter()
+    return _converter
 
 
-def yaml_to_json_schema(yaml_directory, json_directory="") -> str:
-    # YAML Schema を読み込んで JSON Schema に変換
+def __getattr__(name):
+    # 以前のモジュール変数 yaml / converter との互換
+    if name == "yaml":
+        return get_yaml()
+    if name == "converter":
+        return get_converter()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def yaml_to_json_schema(yaml_directory, json_directory="", mode=DEFS) -> str:
+    """YAML Schema を読み込んで JSON Schema に変換
+
+    mode は $ref の解決方法 (ref_resolver の copy / shared / defs)。定義同士が何度も参照し合う
+    スキーマでは、展開すると出力が指数的に大きくなるため defs を使う。
+    JSON では参照先の共有を表現できないので、shared は defs と同じく $defs への $ref のまま出力する。
+    """
+    if mode == SHARED:
+        mode = DEFS
     yaml_schema_dict = load_yaml_schemas(yaml_directory)
-    resolved_json_schema = yaml_schema_to_json_schema(yaml_schema_dict)
-    resolved_json_schema_dict = jsonref_to_dict(resolved_json_schema)
+    merged_json_schema = merge_yaml_schemas(yaml_schema_dict)
+    resolved_json_schema_dict = resolve_merged_json_schema(merged_json_schema, mode)
+    report = schema_size_report(merged_json_schema, resolved_json_schema_dict)
+    print(
+        f"参照の解決 ({mode}): {report['before']['unique_nodes']} ノード -> "
+        f"{report['after']['unique_nodes']} ノード (JSON に展開すると {report['after']['expanded_nodes']} ノード)"
+    )
     resolved_json_schema_str = to_json(resolved_json_schema_dict)
 
     # JSON Schema を保存
@@ -38,7 +69,9 @@ def yaml_to_json_schema(yaml_directory, json_directory="") -> str:
     return resolved_json_schema_str
 
 
-def jsonref_to_dict(jsonref_obj: jsonref.JsonRef | list | dict | str):
+def jsonref_to_dict(jsonref_obj: "jsonref.JsonRef | list | dict | str"):
+    import jsonref
+
     def ref_caster(o):
         """
         jsonref.JsonRef を適切な Python のデータ型 (dict, list, str, int, bool, float) に変換する。
@@ -58,23 +91,23 @@ def jsonref_to_dict(jsonref_obj: jsonref.JsonRef | list | dict | str):
     return json.loads(json_str)  # dict に戻す
 
 
-def dereference_schema(json_schema: jsonref.JsonRef):
-    def custom_jsonref_jsonloader(uri, **kwargs):
-        return {}
-
-    json_ref_obj = jsonref.loads(json.dumps(json_schema), json_loader=custom_jsonref_jsonloader)
-    deref_schema_str = str(json_ref_obj)
-    deref_schema_dict = ast.literal_eval(deref_schema_str)
-    return deref_schema_dict
+def dereference_schema(json_schema: dict) -> dict:
+    # 外部参照は {} として扱う
+    return resolve_refs(json_schema)
 
 
-def yaml_schema_to_json_schema(yaml_schema_dict):
+def yaml_schema_to_json_schema(yaml_schema_dict, mode=SHARED):
     # YAML Schema を JSON Schema に変換
     merged_json_schema = merge_yaml_schemas(yaml_schema_dict)
-    resolved_json_schema = resolve_merged_json_schema(merged_json_schema)
+    resolved_json_schema = resolve_merged_json_schema(merged_json_schema, mode)
     return resolved_json_schema
 
 
+def schema_size_report(merged_json_schema, resolved_json_schema) -> dict:
+    """参照の解決前後のスキーマの大きさ (ref_resolver.schema_size) を返す"""
+    return {"before": schema_size(merged_json_schema), "after": schema_size(resolved_json_schema)}
+
+
 def merge_yaml_schemas(yaml_schema_dict):
     """複数の JSON Schema を統合 ($defs に登録)"""
     merged_json_schema = {
@@ -86,25 +119,17 @@ def merge_yaml_schemas(yaml_schema_dict):
 
     # 参照を$defsに登録
     for schema_name, yaml_schema in yaml_schema_dict.items():
-        merged_json_schema["$defs"][schema_name] = converter.yaml_to_json(yaml_schema)
-        merged_json_schema["properties"][schema_name] = {"$ref": f"#/$defs/{schema_name}"}
+        merged_json_schema["$defs"][schema_name] = get_converter().yaml_to_json(yaml_schema)
+        # スキーマ名はルールディレクトリからの相対パス ("page1/form1" など) なので JSON Pointer としてエスケープする
+        pointer = schema_name.replace("~", "~0").replace("/", "~1")
+        merged_json_schema["properties"][schema_name] = {"$ref": f"#/$defs/{pointer}"}
 
     return merged_json_schema
 
 
-def resolve_merged_json_schema(merged_json_schema) -> jsonref.JsonRef:
-    """参照を解決 (JSON Schema に変換)"""
-
-    # 保存
-    merged_json_schema_path = save_schema(merged_json_schema)
-
-    # 参照を解決
-    resolved_json_schema = None
-
-    with open(merged_json_schema_path, encoding="utf-8") as f:
-        resolved_json_schema = jsonref.load(f)
-
-    return resolved_json_schema
+def resolve_merged_json_schema(merged_json_schema, mode=SHARED) -> dict:
+    """参照をメモリ上で解決し、プレーンな dict を返す (JSON Schema に変換)"""
+    return resolve_refs(merged_json_schema, mode)
 
 
 def load_yaml_schemas(directory):
@@ -114,9 +139,7 @@ def load_yaml_schemas(directory):
     for file_path in glob(os.path.join(directory, "**/*.yaml"), recursive=True):
         schema_name = os.path.splitext(os.path.basename(file_path))[0]
 
-        with open(file_path, encoding="utf-8") as f:
-            yaml_schema = yaml.load(f)
-            yaml_schema_dict[schema_name] = yaml_schema
+        yaml_schema_dict[schema_name] = yaml_loader.load_file(file_path)
 
     return yaml_schema_dict
 